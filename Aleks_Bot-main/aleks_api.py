@@ -1,16 +1,30 @@
 # aleks_api.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
 import uvicorn
+import asyncio
+import hmac
+import json
 import os
-import re
-from datetime import datetime
+import signal
+import threading
+import time
 
 # Import core aleks functions and constants from the refactored file
-from aleks_core import initialize_aleks_components, get_rag_response, detect_document_request
-# Import document related constants from document_manager
-from document_manager import DOCUMENT_TEMPLATES, PLACEHOLDER_DESCRIPTIONS, TEMPLATE_DIR 
+import aleks_core
+from aleks_core import get_rag_response, stream_rag_response, resolve_document_request, route_document_request
+from batch_qa import BATCH_MAX_QUESTIONS, BATCH_PARALLELISM, BatchJob, normalize_questions, stream_batch
+from conversation_memory import MAX_SESSION_ID_LENGTH
+from document_store import DocumentStore
+from index_snapshots import INDEX_SNAPSHOT_ROOT, watch_snapshots
+from template_engine import MAX_BATCH_ROWS, template_registry
+from llm_scheduler import LLMScheduler, SchedulerBusy, SchedulerTimeout
+from warmup import WarmupManager
+import telemetry
 
 
 # --- FastAPI App Setup ---
@@ -28,33 +42,177 @@ app.add_middleware(
     allow_credentials=False, # Disable credentials to allow wildcard origins
     allow_methods=["*"],     # Allow all HTTP methods
     allow_headers=["*"],     # Allow all headers
+    expose_headers=["X-Request-ID"],
 )
 
+# --- Telemetry ---
+# Request IDs, per-route latency and the sampled stage breakdowns; metrics are served at /metrics.
+app.add_middleware(telemetry.RequestTelemetryMiddleware)
+
+# --- LLM Scheduler ---
+# Every blocking Ollama/retrieval call goes through this bounded queue so the event loop stays free
+# and overload turns into fast 429s instead of an unbounded pile-up.
+llm_scheduler = LLMScheduler()
+
+def _scheduler_http_error(e: Exception) -> HTTPException:
+    if isinstance(e, SchedulerBusy):
+        return HTTPException(
+            status_code=429,
+            detail=f"Aleks is busy ({e.queue_depth} requests queued). Please retry in about {e.retry_after}s.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    return HTTPException(status_code=504, detail=str(e))
+
+# --- Warm-up ---
+# Components load in the background at startup; /readyz reports when this instance can take traffic.
+warmup_manager = WarmupManager()
+
+def _require_ready():
+    """
+    Rejects chat requests with 503 while the components are still warming up (or failed to load).
+    """
+    if warmup_manager.started and not warmup_manager.ready:
+        raise HTTPException(status_code=503, detail="Aleks is still starting up. Please retry shortly.",
+                            headers={"Retry-After": str(int(warmup_manager.retry_seconds))})
+
+# --- Admin ---
+# Token the /api/admin endpoints require ("Authorization: Bearer <token>"). Empty = admin endpoints off.
+ADMIN_TOKEN = os.getenv("ALEKS_ADMIN_TOKEN", "")
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled. Set ALEKS_ADMIN_TOKEN to enable them.")
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token.", headers={"WWW-Authenticate": "Bearer"})
+
+# --- Index Snapshots ---
+# With ALEKS_INDEX_SNAPSHOT_ROOT set, a published snapshot goes live without a restart: on
+# POST /api/admin/index/reload, on SIGHUP, or when the watcher notices CURRENT changed.
+index_watch = None
+
+def _follow_index():
+    if not warmup_manager.ready:
+        return
+    try:
+        aleks_core.reload_index()
+    except Exception as e:
+        print(f"Could not switch to the current index snapshot: {e}")
+
+# --- Generated Documents ---
+document_store = DocumentStore()
+
 # --- API Models (Pydantic for data validation) ---
 class ChatRequest(BaseModel):
     message: str
+    # Returned by the previous answer; omit to start a new conversation.
+    session_id: Optional[str] = Field(None, max_length=MAX_SESSION_ID_LENGTH)
+
+class BatchQuestion(BaseModel):
+    question: str
+    # Echoed in the result line; defaults to the question's position (1-based).
+    id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    questions: list[BatchQuestion]
+    # IDs answered by an interrupted earlier run of the same batch; they are not answered again.
+    skip_ids: list[str] = []
+    parallelism: Optional[int] = Field(None, ge=1)
+
+class IndexReloadRequest(BaseModel):
+    # Snapshot to serve; omitted = the one CURRENT names. Naming an older one rolls back to it.
+    version: Optional[str] = None
 
 class DocumentFillRequest(BaseModel):
     template_key: str
     filled_data: dict
 
+class DocumentBatchRequest(BaseModel):
+    template_key: str
+    rows: list[dict]
+    save: bool = False
+
 # --- API Endpoints ---
 
 @app.on_event("startup")
 async def startup_event():
     """
-    Initializes Aleks components when the FastAPI application starts.
-    This ensures the LLM and vector store are loaded once.
+    Starts loading and warming the Aleks components (embedding model, Chroma, Ollama) in parallel.
+    The server accepts connections right away; /readyz turns 200 once everything is warm.
     """
+    global index_watch
     print("Starting up Aleks API...")
+    warmup_manager.start()
+    if INDEX_SNAPSHOT_ROOT:
+        index_watch = watch_snapshots(_follow_index)
+        if hasattr(signal, "SIGHUP"):
+            loop = asyncio.get_running_loop()
+            loop.add_signal_handler(signal.SIGHUP, lambda: loop.run_in_executor(None, _follow_index))
+
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: the process is up and its event loop is responsive.
+    """
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    Readiness: 200 once every component is loaded and warm, 503 before that.
+    Includes the status and load time of each component.
+    """
+    status = warmup_manager.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+async def _route_intent(user_message: str) -> dict:
+    """
+    Detects if the message is a document request (keyword/embedding tiers first, LLM only when unsure).
+    The cheap tiers run on the thread pool; only undecided messages wait for an LLM slot.
+    """
+    try:
+        intent = await run_in_threadpool(route_document_request, user_message, False)
+        if intent["tier"] == "undecided":
+            intent = await llm_scheduler.run(resolve_document_request, user_message, intent)
+    except (SchedulerBusy, SchedulerTimeout) as e:
+        raise _scheduler_http_error(e)
+    return intent
+
+def _document_request_response(detected_doc_type: str, intent: dict) -> dict:
+    """
+    Builds the response asking the user for the placeholders of the detected template.
+    """
     try:
-        initialize_aleks_components()
-        print("Aleks API ready!")
+        placeholder_details = template_registry.placeholders(detected_doc_type)
+    except KeyError:
+        return {"type": "text", "response": f"Sorry, I don't have a template for '{detected_doc_type}'."}
+    except FileNotFoundError:
+        return {"type": "text", "response": f"Sorry, the template file for '{detected_doc_type}' could not be found."}
     except Exception as e:
-        print(f"Failed to initialize Aleks components: {e}. Please check your setup (Ollama, ChromaDB, etc.).")
-        # In a production app, you might want more sophisticated error handling,
-        # but for now, this will clearly show if initialization failed.
-        raise # Re-raise the exception to indicate a critical startup failure
+        return {"type": "text", "response": f"Error reading template: {e}"}
+
+    return {
+        "type": "document_request",
+        "document_type": detected_doc_type,
+        "message": f"Okay, let's fill out your '{detected_doc_type}' template. Please provide the following details:",
+        "placeholders_to_fill": placeholder_details,
+        "intent": intent
+    }
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    Persists the answer cache (if on-disk persistence is configured) and flushes pending
+    document writes when the server stops.
+    """
+    warmup_manager.stop()
+    if index_watch is not None:
+        index_watch.set()
+    if aleks_core.answer_cache is not None:
+        aleks_core.answer_cache.save()
+    if aleks_core.llm is not None:
+        aleks_core.llm.close()
+    # Flush documents still queued for writing
+    await run_in_threadpool(document_store.close)
 
 @app.post("/api/chat")
 async def chat_with_aleks(request: ChatRequest):
@@ -65,98 +223,363 @@ async def chat_with_aleks(request: ChatRequest):
 
     if not user_message:
         raise HTTPException(status_code=400, detail="Message cannot be empty.")
+    _require_ready()
 
     # 1. Detect if it's a document request
-    detected_doc_type = detect_document_request(user_message)
+    intent = await _route_intent(user_message)
+    detected_doc_type = intent["document_type"]
 
     if detected_doc_type != "NONE":
-        template_filename = DOCUMENT_TEMPLATES.get(detected_doc_type)
-        if not template_filename:
-            return {"type": "text", "response": f"Sorry, I don't have a template for '{detected_doc_type}'."}
-
-        template_path = os.path.join(TEMPLATE_DIR, template_filename)
-        if not os.path.exists(template_path):
-            return {"type": "text", "response": f"Sorry, the template file for '{detected_doc_type}' could not be found."}
-
-        try:
-            with open(template_path, 'r', encoding='utf-8') as f:
-                template_content = f.read()
-        except Exception as e:
-            return {"type": "text", "response": f"Error reading template: {e}"}
-
-        # Extract placeholders from the template
-        placeholders = set(re.findall(r'\[(.*?)\]|\{\{(.*?)\}\}', template_content))
-        placeholders = {p.strip() for tup in placeholders for p in tup if p.strip()}
-        
-        # Remove 'current_date' as it's auto-filled
-        if 'current_date' in placeholders:
-            placeholders.remove('current_date')
-
-        # Get descriptions for the placeholders
-        placeholder_details = []
-        for p in sorted(list(placeholders)):
-            description = PLACEHOLDER_DESCRIPTIONS.get(p, p.replace('_', ' ').title())
-            placeholder_details.append({"name": p, "description": description})
-        
-        return {
-            "type": "document_request",
-            "document_type": detected_doc_type,
-            "message": f"Okay, let's fill out your '{detected_doc_type}' template. Please provide the following details:",
-            "placeholders_to_fill": placeholder_details
-        }
+        return _document_request_response(detected_doc_type, intent)
     else:
         # 2. Perform RAG query
         try:
-            rag_response = get_rag_response(user_message)
-            return {"type": "rag_response", "response": rag_response["answer"], "sources": rag_response["sources"]}
+            rag_response = await llm_scheduler.run(get_rag_response, user_message, request.session_id)
+            return {"type": "rag_response", "response": rag_response["answer"], "sources": rag_response["sources"],
+                    "session_id": rag_response["session_id"], "intent": intent}
+        except (SchedulerBusy, SchedulerTimeout) as e:
+            raise _scheduler_http_error(e)
         except Exception as e:
             # Catch any error from RAG and return as HTTPException
             raise HTTPException(status_code=500, detail=f"Error processing RAG query: {e}")
 
-@app.post("/api/generate_document")
-async def generate_document(request: DocumentFillRequest):
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _next_stream_event(queue: asyncio.Queue, producer: asyncio.Future):
     """
-    Generates the final document after all placeholders are filled.
+    Waits for the next event from the producer thread. Returns None once the producer is finished
+    and re-raises its exception (SchedulerBusy, SchedulerTimeout, RAG errors) if it failed.
     """
-    template_key = request.template_key
-    filled_data = request.filled_data
+    if queue.empty() and not producer.done():
+        getter = asyncio.ensure_future(queue.get())
+        await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+        if getter.done():
+            return getter.result()
+        getter.cancel()
+    if not queue.empty():
+        return queue.get_nowait()
+    producer.result()
+    return None
 
-    template_filename = DOCUMENT_TEMPLATES.get(template_key)
-    if not template_filename:
-        raise HTTPException(status_code=400, detail=f"No template found for '{template_key}'.")
+@app.post("/api/chat/stream")
+async def chat_with_aleks_stream(request: ChatRequest, http_request: Request):
+    """
+    Streaming chat endpoint (Server-Sent Events). Sends a "sources" event as soon as retrieval is done,
+    then one "token" event per generated chunk and a final "done" event with time-to-first-token and
+    total latency. Document requests are answered with a single "document_request" event.
+    If the client disconnects, the Ollama stream is closed so generation stops.
+    """
+    user_message = request.message.strip()
+
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Message cannot be empty.")
+    _require_ready()
+
+    received = time.perf_counter()
+    intent = await _route_intent(user_message)
+    if intent["document_type"] != "NONE":
+        payload = _document_request_response(intent["document_type"], intent)
+        return StreamingResponse(iter([_sse(payload["type"], payload)]), media_type="text/event-stream")
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        # Runs on an LLM scheduler thread and holds the slot for the whole generation.
+        events = stream_rag_response(user_message, request.session_id)
+        try:
+            for event in events:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        finally:
+            events.close()
+
+    producer = asyncio.ensure_future(llm_scheduler.run(produce))
+    # Wait for the first event before committing to a 200, so a full queue still answers 429.
+    try:
+        first_event = await _next_stream_event(queue, producer)
+    except (SchedulerBusy, SchedulerTimeout) as e:
+        raise _scheduler_http_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing RAG query: {e}")
+
+    async def event_stream():
+        event = first_event
+        first_token_ms = None
+        try:
+            while event is not None:
+                name, data = event
+                if name == "token" and first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - received) * 1000
+                if name == "done":
+                    # Add the API-side view, which includes intent routing and queueing time.
+                    data = dict(data, time_to_first_token_api_ms=round(first_token_ms or 0, 1),
+                                total_api_ms=round((time.perf_counter() - received) * 1000, 1), intent=intent)
+                yield _sse(name, data)
+                if await http_request.is_disconnected():
+                    telemetry.log("Client disconnected, stopping generation.")
+                    break
+                event = await _next_stream_event(queue, producer)
+        except (SchedulerBusy, SchedulerTimeout) as e:
+            yield _sse("error", {"detail": str(e)})
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error processing RAG query: {e}"})
+        finally:
+            # Runs on normal completion, on disconnect and when Starlette cancels the response.
+            cancelled.set()
+            producer.add_done_callback(lambda f: f.cancelled() or f.exception())
 
-    template_path = os.path.join(TEMPLATE_DIR, template_filename)
-    if not os.path.exists(template_path):
-        raise HTTPException(status_code=404, detail=f"Template file '{template_filename}' not found.")
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
+@app.post("/api/batch")
+async def batch_answer(request: BatchRequest):
+    """
+    Answers many questions in one call (e.g. a compliance checklist), streamed back as JSON lines as
+    the answers complete: a "result" (or "error") line per question, "progress" lines and a final
+    "summary". Retrieval is done in bulk and repeated questions are answered once; the generations
+    share the LLM scheduler with chat, at most `parallelism` at a time (ALEKS_BATCH_PARALLELISM).
+    To resume an interrupted batch, send it again with the IDs already answered in skip_ids.
+    """
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    try:
+        questions = normalize_questions([q.model_dump() for q in request.questions])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _require_ready()
+
+    job = BatchJob(questions, request.skip_ids)
+    telemetry.log(f"Batch of {job.total} questions ({len(job.groups)} distinct, {job.skipped} skipped).")
+    parallelism = min(request.parallelism or BATCH_PARALLELISM, llm_scheduler.max_in_flight)
+
+    async def lines():
+        async for record in stream_batch(job, llm_scheduler, parallelism):
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _get_template(template_key: str):
     try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
+        return template_registry.get(template_key)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"No template found for '{template_key}'.")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Template file for '{template_key}' not found.")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading template file: {e}")
 
-    # Add current_date automatically if placeholder exists
-    if 'current_date' in template_content:
-        filled_data['current_date'] = datetime.now().strftime("%B %d, %Y")
+@app.post("/api/generate_document")
+async def generate_document(request: DocumentFillRequest):
+    """
+    Generates the final document after all placeholders are filled.
+    """
+    template_key = request.template_key
+    filled_data = request.filled_data
 
-    filled_document = template_content
-    for placeholder, value in filled_data.items():
-        # Ensure value is string before substitution to avoid TypeError
-        filled_document = re.sub(rf"\[{re.escape(placeholder)}\]|" + r"\{\{" + re.escape(placeholder) + r"\}\}", str(value), filled_document)
+    compiled_template = _get_template(template_key)
+    filled_document = compiled_template.render(filled_data)
 
-    # Save the document
-    output_filename = f"filled_{template_key}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    output_path = os.path.join(TEMPLATE_DIR, output_filename)
+    # Written by the document store's writer thread; the event loop keeps serving meanwhile
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(filled_document)
-        print(f"Document saved as '{output_filename}' in '{TEMPLATE_DIR}'.")
+        record = await document_store.save(template_key, filled_document, {"filled_data": filled_data})
     except Exception as e:
-        print(f"Error saving document: {e}")
         raise HTTPException(status_code=500, detail=f"Error saving document: {e}")
+    telemetry.log(f"Document '{record['id']}' saved.")
 
     return {
         "status": "success",
-        "message": f"Document '{output_filename}' generated and saved.",
+        "message": f"Document '{record['id']}' generated and saved.",
+        "document_id": record["id"],
         "generated_document_preview": filled_document # Provide a preview for the frontend
-    }
\ No newline at end of file
+    }
+
+@app.post("/api/generate_documents")
+async def generate_documents(request: DocumentBatchRequest):
+    """
+    Fills one template many times in a single call (e.g. one NDA per row of a spreadsheet).
+    Each row maps placeholder names to values; placeholders missing from a row are left as-is
+    and reported per row. Documents are returned in row order and only saved if requested.
+    """
+    if len(request.rows) > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ROWS} rows per batch.")
+    compiled_template = _get_template(request.template_key)
+    started = time.perf_counter()
+    documents = template_registry.render_batch(request.template_key, request.rows)
+    render_ms = (time.perf_counter() - started) * 1000
+
+    document_ids = [None] * len(documents)
+    if request.save:
+        try:
+            records = await document_store.save(request.template_key, documents)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error saving documents: {e}")
+        document_ids = [record["id"] for record in records]
+        telemetry.log(f"{len(documents)} '{request.template_key}' documents saved.")
+
+    return {
+        "status": "success",
+        "count": len(documents),
+        "render_ms": round(render_ms, 2),
+        "documents": [
+            {"row": i, "missing": compiled_template.missing(row), "document_id": document_id, "document": document}
+            for i, (row, document, document_id) in enumerate(zip(request.rows, documents, document_ids))
+        ],
+    }
+
+@app.get("/api/documents")
+async def list_documents(limit: int = Query(20, ge=1, le=200), cursor: Optional[str] = None,
+                         template_key: Optional[str] = None):
+    """
+    Lists generated documents, newest first. Pass next_cursor back as cursor for the next page.
+    """
+    return await run_in_threadpool(document_store.list, limit, cursor, template_key)
+
+@app.get("/api/documents/{document_id}")
+async def get_document(document_id: str):
+    """
+    Returns one generated document with its content and the values it was filled with.
+    """
+    record = await run_in_threadpool(document_store.get, document_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
+    return record
+
+@app.get("/api/documents/{document_id}/download")
+async def download_document(document_id: str):
+    """
+    Returns a generated document as a plain-text attachment.
+    """
+    record = await run_in_threadpool(document_store.get, document_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
+    filename = f"{record['template_key'].replace(' ', '_')}_{document_id}.txt"
+    return PlainTextResponse(record["text"], headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.delete("/api/documents/{document_id}")
+async def delete_document(document_id: str):
+    if not await run_in_threadpool(document_store.delete, document_id):
+        raise HTTPException(status_code=404, detail=f"Document '{document_id}' not found.")
+    return {"status": "deleted", "document_id": document_id}
+
+def _component_metrics():
+    """Gauges and counters read from the components' stats() on every scrape."""
+    scheduler = llm_scheduler.stats()
+    families = [
+        ("aleks_llm_queue_waiting", "gauge", "Requests waiting for an LLM slot.", [({}, scheduler["waiting"])]),
+        ("aleks_llm_in_flight", "gauge", "LLM/retrieval calls running.", [({}, scheduler["in_flight"])]),
+        ("aleks_llm_requests_rejected_total", "counter", "Requests rejected with 429 because the queue was full.", [({}, scheduler["rejected"])]),
+        ("aleks_llm_requests_timed_out_total", "counter", "Requests that timed out waiting or running.", [({}, scheduler["timed_out"])]),
+        ("aleks_conversation_sessions", "gauge", "Conversations held in memory.", [({}, aleks_core.conversation_memory.stats()["sessions"])]),
+        ("aleks_ready", "gauge", "1 once every component is warm.", [({}, int(warmup_manager.ready))]),
+    ]
+    if aleks_core.answer_cache is not None:
+        cache = aleks_core.answer_cache.stats()
+        families.append(("aleks_answer_cache_lookups_total", "counter", "Answer cache lookups by result.",
+                         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]))
+        families.append(("aleks_answer_cache_entries", "gauge", "Answers in the cache.", [({}, cache["entries"])]))
+    if aleks_core.live_index is not None:
+        families.append(("aleks_index_swaps_total", "counter", "Index snapshots swapped in without a restart.",
+                         [({}, aleks_core.live_index.swaps)]))
+        families.append(("aleks_index_draining_generations", "gauge", "Replaced index snapshots still finishing retrievals.",
+                         [({}, len(aleks_core.live_index.draining))]))
+    if aleks_core.embeddings is not None:
+        embedding = aleks_core.embeddings.stats()
+        families.append(("aleks_embeddings_total", "counter", "Texts embedded, by where the vector came from.",
+                         [({"source": "computed"}, embedding["computed"]), ({"source": "disk_cache"}, embedding["disk_hits"]),
+                          ({"source": "memory_cache"}, embedding["memory_hits"])]))
+    if aleks_core.llm is not None:
+        servers = aleks_core.llm.stats().get("servers", [])
+        if servers:
+            families.append(("aleks_ollama_server_up", "gauge", "1 if the Ollama server passed its last check.",
+                             [({"url": server["url"]}, int(server["healthy"])) for server in servers]))
+            families.append(("aleks_ollama_server_in_flight", "gauge", "Generations running on each Ollama server.",
+                             [({"url": server["url"]}, server["in_flight"]) for server in servers]))
+    return families
+
+telemetry.metrics.add_collector(_component_metrics)
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: request and per-stage latency histograms, token counts, cache hits, queue depth.
+    """
+    return PlainTextResponse(telemetry.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/status/scheduler")
+async def scheduler_status():
+    """
+    Reports LLM queue depth, in-flight calls and rejection/timeout counters.
+    """
+    return llm_scheduler.stats()
+
+@app.get("/api/status/llm")
+async def llm_status():
+    """
+    Reports the LLM backend and, for Ollama, each server's health, load and failures.
+    """
+    if aleks_core.llm is None:
+        return {"backend": aleks_core.LLM_BACKEND, "loaded": False}
+    return dict(aleks_core.llm.stats(), loaded=True)
+
+@app.get("/api/status/cache")
+async def cache_status():
+    """
+    Reports answer cache hits, misses, hit rate and the generation time saved by hits.
+    """
+    if aleks_core.answer_cache is None:
+        return {"enabled": False}
+    return dict(aleks_core.answer_cache.stats(), enabled=True)
+
+@app.get("/api/status/index")
+async def index_status():
+    """
+    Reports the live index snapshot, replaced snapshots still finishing retrievals, and the published versions.
+    """
+    status = await run_in_threadpool(aleks_core.index_status) if aleks_core.retriever is not None else None
+    if status is None:
+        return {"snapshots": bool(INDEX_SNAPSHOT_ROOT), "db_directory": aleks_core.CHROMA_DB_DIR}
+    return dict(status, snapshots=True)
+
+@app.post("/api/admin/index/reload")
+async def reload_index(request: Request, body: Optional[IndexReloadRequest] = None):
+    """
+    Swaps retrieval to the snapshot CURRENT names (or to body.version, which also becomes CURRENT)
+    without a restart. The new snapshot is opened and warmed first; requests already retrieving finish
+    on the old one, which is closed afterwards. Requires the admin token.
+    """
+    _require_admin(request)
+    _require_ready()
+    try:
+        return await run_in_threadpool(aleks_core.reload_index, body.version if body else None)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.delete("/api/sessions/{session_id}")
+async def clear_session(session_id: str):
+    """
+    Forgets a conversation (its recent turns and summary).
+    """
+    if not await run_in_threadpool(aleks_core.conversation_memory.clear, session_id):
+        raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
+    return {"status": "cleared", "session_id": session_id}
+
+@app.get("/api/status/sessions")
+async def session_status():
+    """
+    Reports active conversations, their memory use, condensed follow-ups and evictions.
+    """
+    return aleks_core.conversation_memory.stats()
+
+@app.get("/api/status/documents")
+async def document_store_status():
+    """
+    Reports the document store backend, stored/compressed sizes, write batching and retention counters.
+    """
+    return await run_in_threadpool(document_store.stats)
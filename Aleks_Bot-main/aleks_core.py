@@ -1,157 +1,566 @@
 # aleks_core.py
 import os
 import re
+import time
 from datetime import datetime
 
 # Core LangChain components for RAG - make sure these are the updated ones
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaLLM # Note: The class name often changes to OllamaLLM
-
-from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
-from langchain.chains import LLMChain # Still used, but deprecated
 
 # Import constants from document_manager
 from document_manager import DOCUMENT_TEMPLATES, PLACEHOLDER_DESCRIPTIONS, TEMPLATE_DIR # Also need placeholder descriptions and TEMPLATE_DIR now
+from intent_router import IntentRouter
+from answer_cache import ANSWER_CACHE_ENABLED, SemanticAnswerCache
+from embedding_service import EmbeddingService
+from bm25_index import BM25Index
+from hybrid_retriever import RETRIEVAL_K, RETRIEVAL_MODE, HybridRetriever
+from statute_splitter import format_citation, format_pages
+from context_builder import GenerationStatsHandler, build_context, log_prompt_stats
+from conversation_memory import ConversationMemory
+from llm_backends import LLM_BACKEND, OLLAMA_MODEL_NAME, OLLAMA_URLS, create_llm
+import telemetry
+from vector_index import VECTOR_INDEX, VECTOR_SHARDING, open_store
+from index_snapshots import INDEX_SNAPSHOT_ROOT, IndexGeneration, LiveIndex, LiveIndexRetriever, SnapshotStore
+from retrieval_service import RETRIEVAL_SERVICE, RemoteEmbeddings, RemoteRetriever, RetrievalServiceClient
 
 # --- Configuration ---
-CHROMA_DB_DIR = "./chroma_db"
-EMBEDDINGS_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Vector database written by vector_db_creator.py. An environment variable, so uvicorn workers and the
+# retrieval service started from another directory open the same one.
+CHROMA_DB_DIR = os.getenv("ALEKS_CHROMA_DB_DIR", "./chroma_db")
 
 # --- Ollama Configuration ---
-OLLAMA_BASE_URL = "http://localhost:11434"
-OLLAMA_MODEL_NAME = "mistral"
+# The backend (ALEKS_LLM_BACKEND), servers and model are configured in llm_backends.py.
+OLLAMA_BASE_URL = OLLAMA_URLS[0] if OLLAMA_URLS else "http://localhost:11434"
+
+# --- RAG Prompt ---
+# Same wording as LangChain's default "stuff" prompt. {context} is the token-budgeted block built by
+# context_builder, with each passage labelled by its citation.
+# Every prompt starts with a fixed block and ends with the parts that change per request, and the RAG
+# prompts share their instructions byte for byte: Ollama and llama.cpp then reuse the KV cache of that
+# prefix instead of evaluating it again for each request.
+RAG_INSTRUCTIONS = "Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer."
+RAG_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template=RAG_INSTRUCTIONS + """
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+)
+# Same prompt for follow-up turns, with the bounded conversation history (recent turns plus a
+# rolling summary) between the context and the question.
+RAG_CHAT_PROMPT = PromptTemplate(
+    input_variables=["context", "history", "question"],
+    template=RAG_INSTRUCTIONS + """
+
+{context}
+
+Conversation so far:
+{history}
+
+Question: {question}
+Helpful Answer:"""
+)
+# Rewrites a follow-up into a standalone question (ALEKS_CONVERSATION_CONDENSE_MODE=llm).
+CONDENSE_PROMPT = PromptTemplate(
+    input_variables=["history", "question"],
+    template="""Given the conversation below, rewrite the follow-up question as a standalone question about Philippine law that can be understood without the conversation. Respond ONLY with the rewritten question.
+
+{history}
+
+Follow-up question: {question}
+Standalone question:"""
+)
+# Longest rewritten question.
+CONDENSE_MAX_TOKENS = 96
+
+# --- Intent Classifier Prompt ---
+# Last tier of the intent router. Built once: the instructions and examples are the same for every
+# query, which only comes at the very end.
+INTENT_PROMPT_PREFIX = f"""You are an AI assistant. Analyze the user's query to determine if they are asking for a legal document template.
+If they are, identify which specific document they are asking for from the following types: {", ".join(DOCUMENT_TEMPLATES.keys())}.
+If you identify a document, respond ONLY with the document type (e.g., "nda", "non-disclosure agreement").
+If the query is NOT a document request, respond ONLY with "NONE".
+
+Examples:
+User: I need an NDA.
+Response: nda
+
+User: Can you help me draft a non-disclosure agreement?
+Response: non-disclosure agreement
+
+User: What are the tax requirements for a new business?
+Response: NONE
+
+User: Draft a simple contract.
+Response: NONE
+
+"""
+INTENT_PROMPT = PromptTemplate(
+    input_variables=["instructions", "query"],
+    template="""{instructions}Query: {query}
+Response:"""
+).partial(instructions=INTENT_PROMPT_PREFIX)
+# Passed with each classification request; the answer is a document type or NONE.
+INTENT_LLM_TEMPERATURE = 0.3
+INTENT_LLM_MAX_TOKENS = 16
+
+# Evaluated once when the LLM warms up, so even the first requests find them in the KV cache.
+STATIC_PROMPT_PREFIXES = (RAG_INSTRUCTIONS, INTENT_PROMPT_PREFIX)
 
 # Global variables for the AI components (will be initialized once)
-qa_chain = None
 llm = None
+embeddings = None
+retriever = None
+# The swappable snapshot retrieval runs on, when ALEKS_INDEX_SNAPSHOT_ROOT is set
+live_index = None
+intent_router = None
+answer_cache = None
+# Chat sessions (no model needed, so available before warm-up finishes)
+conversation_memory = ConversationMemory(llm_condenser=lambda history, question: _condense_with_llm(history, question))
 
-def initialize_aleks_components():
+def load_embeddings():
     """
-    Initializes the RAG chain and LLM, making them globally accessible for API endpoints.
-    This function should be called once when the FastAPI application starts.
+    Loads the embedding model (from ALEKS_EMBEDDING_MODEL_PATH if a local copy is configured).
     """
-    global qa_chain, llm
-    print("Initializing Aleks AI components...")
-    
     print("Loading embedding model for retrieval...")
     try:
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL_NAME)
-        print("Embedding model loaded.")
+        embeddings = EmbeddingService()
+        print(f"Embedding model loaded ({embeddings.model_id}, batch size {embeddings.batch_size}).")
+        return embeddings
     except Exception as e:
         print(f"Error loading embedding model: {e}")
         print("Please ensure 'langchain-huggingface' and 'torch' are installed.")
         raise # Re-raise to stop app if critical component fails
 
-    print(f"Loading vector database from {CHROMA_DB_DIR}...")
+def index_location(version=None):
+    """
+    (snapshot version, database directory) that retrieval opens: with ALEKS_INDEX_SNAPSHOT_ROOT, the
+    snapshot CURRENT names (or the given version), otherwise (None, CHROMA_DB_DIR).
+    """
+    if not INDEX_SNAPSHOT_ROOT:
+        return None, CHROMA_DB_DIR
+    store = SnapshotStore()
+    version = version or store.current()
+    if version is None:
+        print(f"Error: no index snapshot published in '{INDEX_SNAPSHOT_ROOT}'. Please run the data ingestion script.")
+        raise FileNotFoundError(os.path.join(INDEX_SNAPSHOT_ROOT, "CURRENT"))
+    return version, store.path(version)
+
+def open_vector_store(embeddings=None, db_directory=None):
+    """
+    Opens the persisted Chroma database (CHROMA_DB_DIR unless another directory is given).
+    Without embeddings it can still be read and searched by vector.
+    """
+    db_directory = db_directory or CHROMA_DB_DIR
+    print(f"Loading vector database from {db_directory}...")
+    if not os.path.exists(db_directory):
+        print(f"Error: Chroma DB directory '{db_directory}' not found. Please ensure you have run the data ingestion script.")
+        raise FileNotFoundError(db_directory)
     try:
-        if not os.path.exists(CHROMA_DB_DIR):
-            print(f"Error: Chroma DB directory '{CHROMA_DB_DIR}' not found. Please ensure you have run the data ingestion script.")
-            raise # Re-raise
-        vectorstore = Chroma(persist_directory=CHROMA_DB_DIR, embedding_function=embeddings)
-        print("Vector database loaded.")
+        vectorstore = open_store(db_directory, embeddings)
+        print(f"Vector database loaded (index: {VECTOR_INDEX}, sharding: {VECTOR_SHARDING}).")
+        return vectorstore
     except Exception as e:
         print(f"Error loading vector database: {e}")
         print("Please ensure 'langchain-chroma' is installed and your database exists.")
         raise # Re-raise
 
+def load_bm25_index(vectorstore, db_directory=None):
+    """
+    Loads the BM25 index stored next to the vector database, building it from Chroma if it is missing.
+    """
+    db_directory = db_directory or CHROMA_DB_DIR
+    bm25 = BM25Index.load(db_directory)
+    if bm25 is None:
+        print("No BM25 index found next to the vector database, building it from Chroma...")
+        bm25 = BM25Index.from_vectorstore(vectorstore)
+        bm25.save(db_directory)
+    return bm25
+
+def load_llm():
+    """
+    Creates the generation backend selected by ALEKS_LLM_BACKEND (Ollama servers, in-process llama.cpp
+    or the stub). With Ollama, every request asks it to keep the model loaded for ALEKS_OLLAMA_KEEP_ALIVE.
+    """
     print("Initializing LLM...")
     try:
-        llm = OllamaLLM( # Use OllamaLLM
-            base_url=OLLAMA_BASE_URL,
-            model=OLLAMA_MODEL_NAME,
-            temperature=0.1,
-        )
-        print(f"Using local LLM via Ollama: {OLLAMA_MODEL_NAME}")
+        llm_instance = create_llm(LLM_BACKEND)
+        if LLM_BACKEND == "ollama":
+            print(f"Using local LLM via Ollama: {OLLAMA_MODEL_NAME} on {', '.join(llm_instance.urls)} ({llm_instance.routing})")
+        else:
+            print(f"Using LLM backend: {LLM_BACKEND}")
+        return llm_instance
     except Exception as e:
-        print(f"Error initializing Local LLM via Ollama: {e}")
-        print("Please ensure Ollama is installed, the model is pulled, and the Ollama server is running, and 'langchain-ollama' is installed.")
+        print(f"Error initializing the {LLM_BACKEND} LLM backend: {e}")
+        print("Please check ALEKS_LLM_BACKEND and its settings (for Ollama: that the server is running and the model is pulled).")
         raise # Re-raise
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 4})
+def build_retriever(vectorstore, bm25=None, db_directory=None):
+    if RETRIEVAL_MODE == "hybrid":
+        bm25 = bm25 or load_bm25_index(vectorstore, db_directory)
+        print(f"Hybrid retriever ready (BM25 over {len(bm25)} chunks + vector search, k={RETRIEVAL_K}).")
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=RETRIEVAL_K)
+    return vectorstore.as_retriever(search_kwargs={"k": RETRIEVAL_K})
+
+def open_index_generation(embeddings, version, bm25=None):
+    """Opens one index snapshot for a LiveIndex."""
+    version, db_directory = index_location(version)
+    if not os.path.isdir(db_directory):
+        raise FileNotFoundError(f"No index snapshot '{version}' in {INDEX_SNAPSHOT_ROOT}.")
+    retriever_instance = build_retriever(open_vector_store(embeddings, db_directory), bm25, db_directory)
+    return IndexGeneration(version, db_directory, retriever_instance)
+
+def load_retriever(embeddings, version=None, bm25=None):
+    """
+    The retriever over the configured database. With index snapshots it searches the live snapshot
+    and can be moved to a newer one at runtime (reload_index).
+    """
+    global live_index
+    version, db_directory = index_location(version)
+    if version is None:
+        return build_retriever(open_vector_store(embeddings, db_directory), bm25, db_directory)
+    generation = open_index_generation(embeddings, version, bm25)
+    live_index = LiveIndex(generation, SnapshotStore(), lambda v: open_index_generation(embeddings, v))
+    print(f"Serving index snapshot '{version}'.")
+    return LiveIndexRetriever(index=live_index)
+
+def served_db_directory():
+    """The database retrieval searches right now (the live snapshot's directory with index snapshots)."""
+    if live_index is not None:
+        return live_index.path
+    if isinstance(retriever, RemoteRetriever):
+        status = retriever.client.call("index_status")
+        return status["path"] if status else CHROMA_DB_DIR
+    return CHROMA_DB_DIR
+
+def reload_index(version=None) -> dict:
+    """
+    Makes an index snapshot live without a restart: version (default: the one CURRENT names) is opened
+    and warmed while requests keep using the live one, then swapped in. Naming a version also points
+    CURRENT at it (a rollback), so other workers follow. With the retrieval service, the service swaps.
+    Returns {"version", "previous", "path", "swapped", "seconds"}.
+    """
+    if not INDEX_SNAPSHOT_ROOT:
+        raise RuntimeError("Index snapshots are not enabled (set ALEKS_INDEX_SNAPSHOT_ROOT).")
+    if version:
+        SnapshotStore().set_current(version)
+    if isinstance(retriever, RemoteRetriever):
+        result = retriever.client.call("reload_index")
+    elif live_index is not None:
+        result = live_index.swap()
+    else:
+        raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
+    if answer_cache is not None:
+        answer_cache.use_database(result["path"])
+    return result
+
+def index_status() -> dict:
+    """The live snapshot, replaced ones still finishing retrievals, and the published versions (None without snapshots)."""
+    if isinstance(retriever, RemoteRetriever):
+        return retriever.client.call("index_status")
+    return live_index.status() if live_index is not None else None
 
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        return_source_documents=True
-    )
+def connect_retrieval_service(address=None):
+    """
+    Connects to the shared retrieval service (python retrieval_service.py) instead of loading the
+    embedding model and the index in this process. Returns (embeddings, retriever) stand-ins.
+    """
+    client = RetrievalServiceClient(address)
+    print(f"Connecting to the retrieval service at {client.address}...")
+    embeddings = RemoteEmbeddings(client)
+    print(f"Retrieval service connected ({embeddings.model_id}).")
+    return embeddings, RemoteRetriever(client=client)
+
+def install_retrieval_components(embeddings_instance, retriever_instance):
+    """
+    Makes the retriever globally available and builds the embedding-based intent router and answer cache.
+    """
+    global embeddings, retriever, intent_router, answer_cache
+    embeddings = embeddings_instance
+    retriever = retriever_instance
+
+    print("Preparing intent router...")
+    intent_router = IntentRouter(embeddings=embeddings, llm_classifier=_classify_with_llm)
+    print(f"Intent router ready (mode: {intent_router.mode}).")
+
+    if ANSWER_CACHE_ENABLED:
+        answer_cache = SemanticAnswerCache(embeddings=embeddings, db_directory=served_db_directory())
+        print(f"Answer cache enabled (similarity >= {answer_cache.similarity_threshold}).")
+
+def initialize_aleks_components():
+    """
+    Loads every component one after the other and makes them globally accessible.
+    The API uses warmup.WarmupManager instead, which loads them in parallel and warms them up.
+    """
+    global llm
+    print("Initializing Aleks AI components...")
+    if RETRIEVAL_SERVICE:
+        embeddings, retriever = connect_retrieval_service()
+    else:
+        embeddings = load_embeddings()
+        retriever = load_retriever(embeddings)
+    llm = load_llm()
+    install_retrieval_components(embeddings, retriever)
     print("Aleks AI components loaded successfully!")
 
-def get_rag_response(query: str) -> dict:
+def _build_prompt(query: str, conversation: dict = None):
     """
-    Performs RAG query using the initialized qa_chain.
+    Retrieves passages for the query and assembles the prompt within the context token budget.
+    With a conversation (from conversation_memory.prepare), retrieval uses its standalone query and
+    the prompt includes its history. Returns (prompt, context) where context holds the documents used
+    and the size statistics.
     """
-    if qa_chain is None:
+    retrieval_query = conversation["retrieval_query"] if conversation else query
+    with telemetry.stage("retrieval"):
+        docs = retriever.invoke(retrieval_query)
+    with telemetry.stage("context_build"):
+        context = build_context(retrieval_query, docs)
+    if conversation and conversation["history"]:
+        context["stats"]["history_tokens"] = conversation["history_tokens"]
+        prompt = RAG_CHAT_PROMPT.format(context=context["text"], history=conversation["history"], question=query)
+    else:
+        prompt = RAG_PROMPT.format(context=context["text"], question=query)
+    return prompt, context
+
+def _condense_with_llm(history: str, question: str) -> str:
+    if llm is None:
         raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
-    
-    response = qa_chain.invoke({"query": query})
-    
-    # Format source documents nicely for API response
-    sources_info = []
-    if response.get("source_documents"):
-        for i, doc in enumerate(response["source_documents"]):
-            source_name = doc.metadata.get('source', 'Unknown Document')
-            start_index = doc.metadata.get('start_index', 'N/A')
-            sources_info.append({
-                "source": source_name,
-                "startIndex": start_index,
-                "snippet": doc.page_content[:200] + "..." # Limit snippet length
-            })
-
-    return {
-        "answer": response["result"],
-        "sources": sources_info
+    return llm.invoke(CONDENSE_PROMPT.format(history=history, question=question), max_tokens=CONDENSE_MAX_TOKENS)
+
+def _record_turn(conversation: dict, query: str, answer: str, sources: list):
+    laws = [source["law"] for source in sources if source.get("law")]
+    conversation_memory.record_turn(conversation["session_id"], query, conversation["retrieval_query"], answer, laws)
+
+def get_rag_response(query: str, session_id: str = None) -> dict:
+    """
+    Performs a RAG query: retrieval, context assembly, then a single Ollama generation.
+    Pass the session_id of earlier turns to answer follow-ups in context; the result carries the
+    session_id to use for the next turn (a new one if none was given).
+    """
+    if retriever is None or llm is None:
+        raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
+
+    with telemetry.stage("conversation"):
+        conversation = conversation_memory.prepare(session_id, query)
+    cache_query = conversation["retrieval_query"]
+    query_vector = None
+    if answer_cache is not None:
+        with telemetry.stage("answer_cache"):
+            cached, query_vector = answer_cache.lookup(cache_query)
+        if cached is not None:
+            _record_turn(conversation, query, cached["answer"], cached["sources"])
+            return dict(cached, session_id=conversation["session_id"])
+
+    start = time.perf_counter()
+    prompt, context = _build_prompt(query, conversation)
+    result = _generate_answer(prompt, context, _cache_key(conversation), query_vector, start)
+    _record_turn(conversation, query, result["answer"], result["sources"])
+    return dict(result, session_id=conversation["session_id"])
+
+def _cache_key(conversation: dict):
+    """
+    The query an answer is cached under, or None if it must not be cached. Follow-ups are looked up
+    by their condensed, standalone form, but an answer generated with conversation history may depend
+    on that conversation, so it is never stored for other sessions to get.
+    """
+    return None if conversation["history"] else conversation["retrieval_query"]
+
+def _generate_answer(prompt: str, context: dict, cache_query, query_vector, start: float) -> dict:
+    """
+    Runs the generation for an assembled prompt and caches the answer under cache_query (None = not
+    cached). start is when retrieval began, so the cache records what the whole uncached answer cost.
+    """
+    generation_stats = GenerationStatsHandler()
+    with telemetry.stage("generation"):
+        answer = llm.invoke(prompt, config={"callbacks": [generation_stats]})
+    telemetry.record_generation(generation_stats.stats())
+    log_prompt_stats(context["stats"], generation_stats.stats())
+
+    result = {
+        "answer": answer,
+        "sources": _format_sources(context["documents"])
     }
+    if answer_cache is not None and cache_query is not None:
+        answer_cache.store(cache_query, result, (time.perf_counter() - start) * 1000, vector=query_vector)
+    return result
+
+def prepare_rag_batch(queries: list) -> list:
+    """
+    The retrieval half of get_rag_response for a batch of standalone questions (no session). The
+    questions are embedded in one batched call and searched in bulk (retrieve_many of the hybrid or
+    remote retriever);
+    answer-cache hits are not retrieved at all. Returns one entry per query for answer_prepared():
+    {"cached": result} or {"prompt", "context", "query_vector", "start"}.
+    """
+    if retriever is None or llm is None:
+        raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
+
+    start = time.perf_counter()
+    prepared = [None] * len(queries)
+    query_vectors = [None] * len(queries)
+    if answer_cache is not None:
+        # Warms the query LRU, so the cache lookups and the retriever below don't embed one by one
+        embeddings.embed_queries(queries)
+        with telemetry.stage("answer_cache"):
+            for i, query in enumerate(queries):
+                cached, query_vectors[i] = answer_cache.lookup(query)
+                if cached is not None:
+                    prepared[i] = {"cached": cached}
+
+    pending = [i for i in range(len(queries)) if prepared[i] is None]
+    with telemetry.stage("retrieval"):
+        if hasattr(retriever, "retrieve_many"):
+            documents = retriever.retrieve_many([queries[i] for i in pending])
+        else:
+            documents = retriever.batch([queries[i] for i in pending])
+    with telemetry.stage("context_build"):
+        for i, docs in zip(pending, documents):
+            context = build_context(queries[i], docs)
+            prompt = RAG_PROMPT.format(context=context["text"], question=queries[i])
+            prepared[i] = {"prompt": prompt, "context": context, "query_vector": query_vectors[i], "start": start}
+    return prepared
+
+def answer_prepared(query: str, prepared: dict) -> dict:
+    """Generates the answer for one prepare_rag_batch() entry ({"answer", "sources"}, plus "cached" for cache hits)."""
+    if "cached" in prepared:
+        return prepared["cached"]
+    return _generate_answer(prepared["prompt"], prepared["context"], query, prepared["query_vector"], prepared["start"])
+
+def stream_rag_response(query: str, session_id: str = None):
+    """
+    Streaming variant of get_rag_response. Yields ("sources", list) once retrieval is done,
+    then ("token", str) for each chunk Ollama produces, then ("done", timings).
+    Closing the generator early closes the Ollama stream, so generation stops with it
+    (and the unfinished turn is not added to the conversation).
+    """
+    if retriever is None or llm is None:
+        raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
+
+    start = time.perf_counter()
+    with telemetry.stage("conversation"):
+        conversation = conversation_memory.prepare(session_id, query)
+    cache_query = conversation["retrieval_query"]
+    conversation_info = {"session_id": conversation["session_id"], "condensed_query": cache_query if conversation["condensed"] else None}
+    query_vector = None
+    if answer_cache is not None:
+        with telemetry.stage("answer_cache"):
+            cached, query_vector = answer_cache.lookup(cache_query)
+        if cached is not None:
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            _record_turn(conversation, query, cached["answer"], cached["sources"])
+            yield "done", {"retrieval_ms": 0.0, "time_to_first_token_ms": elapsed_ms, "total_ms": elapsed_ms, "cached": True,
+                           **conversation_info}
+            return
+
+    prompt, context = _build_prompt(query, conversation)
+    retrieval_ms = (time.perf_counter() - start) * 1000
+    sources = _format_sources(context["documents"])
+    yield "sources", sources
+
+    first_token_ms = None
+    answer_parts = []
+    generation_stats = GenerationStatsHandler()
+    generation_started = time.perf_counter()
+    tokens = llm.stream(prompt, config={"callbacks": [generation_stats]})
+    try:
+        for token in tokens:
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+                telemetry.FIRST_TOKEN_SECONDS.observe(first_token_ms / 1000)
+            answer_parts.append(token)
+            yield "token", token
+    finally:
+        tokens.close()
+        # Timed by hand: a stage() span must not stay open across the yields
+        telemetry.record_stage("generation", time.perf_counter() - generation_started)
+
+    total_ms = (time.perf_counter() - start) * 1000
+    answer = "".join(answer_parts)
+    # Only completed answers reach this point, so cancelled streams are never cached.
+    if answer_cache is not None and _cache_key(conversation) is not None:
+        answer_cache.store(cache_query, {"answer": answer, "sources": sources}, total_ms, vector=query_vector)
+    _record_turn(conversation, query, answer, sources)
+    telemetry.record_generation(generation_stats.stats())
+    telemetry.log(f"Streamed answer: retrieval {retrieval_ms:.0f} ms, first token {first_token_ms or total_ms:.0f} ms, total {total_ms:.0f} ms")
+    log_prompt_stats(context["stats"], generation_stats.stats())
+    yield "done", {
+        "retrieval_ms": round(retrieval_ms, 1),
+        "time_to_first_token_ms": round(first_token_ms if first_token_ms is not None else total_ms, 1),
+        "total_ms": round(total_ms, 1),
+        "cached": False,
+        "context_tokens": context["stats"]["context_tokens"],
+        "history_tokens": conversation["history_tokens"],
+        **conversation_info,
+        **generation_stats.stats(),
+    }
+
+def _format_sources(source_documents) -> list:
+    """
+    Formats retrieved documents nicely for the API response.
+    """
+    sources_info = []
+    for doc in source_documents:
+        source_name = doc.metadata.get('source', 'Unknown Document')
+        start_index = doc.metadata.get('start_index', 'N/A')
+        sources_info.append({
+            "source": source_name,
+            "citation": format_citation(doc.metadata), # e.g. "RA 10173 (Data Privacy Act), Sec. 12 – Criteria for Lawful Processing"
+            "law": doc.metadata.get("law_name"),
+            "pages": format_pages(doc.metadata),
+            "startIndex": start_index,
+            "snippet": doc.page_content[:200] + "..." # Limit snippet length
+        })
+    return sources_info
+
+def route_document_request(query: str, use_llm: bool = True) -> dict:
+    """
+    Routes the query through the tiered intent router (keyword, embedding, then LLM fallback).
+    Returns the router decision, including which tier decided it. With use_llm=False, queries
+    that need the LLM tier come back as "undecided" instead of calling Ollama.
+    """
+    if intent_router is None:
+        raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
+
+    with telemetry.stage("route"):
+        decision = intent_router.route(query, use_llm=use_llm)
+    telemetry.INTENT_DECISIONS.inc(tier=decision["tier"])
+    if decision["tier"] == "undecided":
+        return decision
+    telemetry.log(f"Intent: {decision['document_type']} (tier: {decision['tier']}, score: {decision['score']}, {decision['latency_ms']} ms)")
+    return decision
+
+def resolve_document_request(query: str, decision: dict) -> dict:
+    """
+    Finishes an "undecided" decision of route_document_request(query, use_llm=False) with the LLM tier
+    only; the keyword and embedding tiers are not run again.
+    """
+    with telemetry.stage("route"):
+        decision = intent_router.resolve(query, decision)
+    telemetry.INTENT_DECISIONS.inc(tier=decision["tier"])
+    telemetry.log(f"Intent: {decision['document_type']} (tier: {decision['tier']}, score: {decision['score']}, {decision['latency_ms']} ms)")
+    return decision
 
 def detect_document_request(query: str) -> str:
+    """
+    Determines if the query is a request for a document template and identifies which document type.
+    Returns the DOCUMENT_TEMPLATES key, or "NONE".
+    """
+    return route_document_request(query)["document_type"]
+
+def _classify_with_llm(query: str) -> str:
     """
     Uses an LLM to determine if the query is a request for a document template
-    and identifies which document type.
+    and identifies which document type. Used by the intent router as its last tier.
     """
     if llm is None:
         raise RuntimeError("Aleks components not initialized. Call initialize_aleks_components first.")
 
-    template_names = ", ".join(DOCUMENT_TEMPLATES.keys())
-    
-    prompt_template = PromptTemplate(
-        input_variables=["query", "template_names"],
-        template="""You are an AI assistant. Analyze the user's query to determine if they are asking for a legal document template.
-        If they are, identify which specific document they are asking for from the following types: {template_names}.
-        If you identify a document, respond ONLY with the document type (e.g., "nda", "non-disclosure agreement").
-        If the query is NOT a document request, respond ONLY with "NONE".
-
-        Examples:
-        User: I need an NDA.
-        Response: nda
-
-        User: Can you help me draft a non-disclosure agreement?
-        Response: non-disclosure agreement
-
-        User: What are the tax requirements for a new business?
-        Response: NONE
-
-        User: Draft a simple contract.
-        Response: NONE
-
-        Query: {query}
-        Response:"""
-    )
-
-    llm_chain = LLMChain(prompt=prompt_template, llm=llm)
-    
-    # Temporarily adjust temperature for classification task
-    original_temperature = llm.temperature
-    llm.temperature = 0.3
-    response = llm_chain.invoke({"query": query, "template_names": template_names})
-    llm.temperature = original_temperature
-
-    detected_type = response['text'].strip().lower()
-
-    if detected_type in DOCUMENT_TEMPLATES:
-        return detected_type
-    return "NONE"
+    # Options are per request; the shared llm object is never modified, so concurrent answers keep their temperature
+    return llm.invoke(INTENT_PROMPT.format(query=query), temperature=INTENT_LLM_TEMPERATURE, max_tokens=INTENT_LLM_MAX_TOKENS)
 
 # Removed the interactive handle_document_filling as its logic will be split across API calls in aleks_api.py
 # document_manager.py will still contain TEMPLATE_DIR, DOCUMENT_TEMPLATES, PLACEHOLDER_DESCRIPTIONS
\ No newline at end of file
@@ -0,0 +1,274 @@
+# answer_cache.py
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from corpus_fingerprint import FINGERPRINT_FILENAME, read_corpus_fingerprint
+
+# --- Answer Cache Configuration ---
+ANSWER_CACHE_ENABLED = os.getenv("ALEKS_ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+# Cosine similarity at or above which a previous question counts as the same question.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ALEKS_ANSWER_CACHE_SIMILARITY", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ALEKS_ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ALEKS_ANSWER_CACHE_MAX_MB", "64")) * 1024 * 1024
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ALEKS_ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+# Set to a file path (e.g. ./answer_cache.json) to keep the cache across restarts.
+ANSWER_CACHE_PATH = os.getenv("ALEKS_ANSWER_CACHE_PATH", "")
+# How often (seconds) to check whether the vector database was rebuilt.
+FINGERPRINT_CHECK_INTERVAL = 2.0
+# Persist after this many new entries (and always on shutdown).
+SAVE_EVERY = 20
+
+
+def normalize_query(query: str) -> str:
+    """Lowercases, drops punctuation and collapses whitespace so trivially different questions share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class SemanticAnswerCache:
+    """
+    Caches RAG answers (answer text plus sources) in front of get_rag_response.
+
+    Lookups first try the normalized query text, then the most similar cached question by embedding.
+    Entries are evicted least-recently-used by count and by estimated memory, and expire after a TTL.
+    The whole cache is dropped when the corpus fingerprint of the vector database changes.
+    """
+
+    def __init__(self, embeddings, db_directory, similarity_threshold=ANSWER_CACHE_SIMILARITY,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, max_bytes=ANSWER_CACHE_MAX_BYTES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, persist_path=ANSWER_CACHE_PATH or None):
+        self.embeddings = embeddings
+        self.db_directory = db_directory
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # normalized query -> entry
+        self._bytes = 0
+        self._matrix = None  # stacked unit vectors, rebuilt lazily after changes
+        self._matrix_keys = []
+        self._matrix_created = None
+        self._unsaved = 0
+
+        self._fingerprint = read_corpus_fingerprint(db_directory)
+        self._fingerprint_mtime = self._fingerprint_file_mtime()
+        self._fingerprint_checked = time.monotonic()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0.0
+
+        if self.persist_path:
+            self._load()
+
+    # --- Public API ---
+
+    def lookup(self, query: str):
+        """
+        Returns (result, vector). result is a copy of the cached {"answer", "sources"} dict with
+        "cached": True, or None on a miss. vector is the query embedding (or None if it was not needed),
+        so the caller can pass it back to store() without embedding twice.
+        """
+        self._check_fingerprint()
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._get_fresh(key)
+        if entry is not None:
+            return self._hit(key, entry, similarity=1.0), None
+
+        vector = self._embed(query)
+        with self._lock:
+            match_key, similarity = self._nearest(vector)
+            entry = self._get_fresh(match_key) if match_key is not None else None
+        if entry is not None and similarity >= self.similarity_threshold:
+            self.semantic_hits += 1
+            return self._hit(match_key, entry, similarity), vector
+
+        self.misses += 1
+        return None, vector
+
+    def store(self, query: str, result: dict, latency_ms: float, vector=None):
+        """Caches the answer and sources for query. latency_ms is what the uncached call cost."""
+        if vector is None:
+            vector = self._embed(query)
+        key = normalize_query(query)
+        entry = {
+            "query": query,
+            "answer": result["answer"],
+            "sources": result["sources"],
+            "vector": vector,
+            "created": time.time(),
+            "latency_ms": latency_ms,
+        }
+        entry["size"] = self._estimate_size(entry)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry["size"]
+            self._matrix = None
+            self._evict()
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def use_database(self, db_directory):
+        """Follows retrieval to another database (a new index snapshot); clears the cache if its corpus differs."""
+        if db_directory == self.db_directory:
+            return
+        self.db_directory = db_directory
+        self._fingerprint_mtime = self._fingerprint_file_mtime()
+        self._fingerprint_checked = time.monotonic()
+        self._update_fingerprint(read_corpus_fingerprint(db_directory))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+            "invalidations": self.invalidations,
+            "corpus_fingerprint": self._fingerprint,
+        }
+
+    def save(self):
+        """Writes the cache to persist_path atomically (no-op when persistence is off)."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            payload = {
+                "fingerprint": self._fingerprint,
+                "entries": [
+                    dict(entry, key=key, vector=entry["vector"].tolist())
+                    for key, entry in self._entries.items()
+                ],
+            }
+            self._unsaved = 0
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, self.persist_path)
+
+    # --- Internals ---
+
+    def _embed(self, text):
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _hit(self, key, entry, similarity):
+        self.hits += 1
+        self.latency_saved_ms += entry["latency_ms"]
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return {
+            "answer": entry["answer"],
+            "sources": entry["sources"],
+            "cached": True,
+            "cache_similarity": round(similarity, 4),
+        }
+
+    def _get_fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(key)
+            return None
+        return entry
+
+    def _nearest(self, vector):
+        """The most similar unexpired entry: (key, similarity), or (None, 0.0)."""
+        if not self._entries:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k]["vector"] for k in self._matrix_keys])
+            self._matrix_created = np.array([self._entries[k]["created"] for k in self._matrix_keys])
+        # Expired entries are skipped here, so a stale best match can't hide a fresh one just below it
+        scores = np.where(self._matrix_created >= time.time() - self.ttl_seconds, self._matrix @ vector, -np.inf)
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            return None, 0.0
+        return self._matrix_keys[best], float(scores[best])
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+            self._matrix = None
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+
+    @staticmethod
+    def _estimate_size(entry):
+        text = entry["query"] + entry["answer"] + json.dumps(entry["sources"])
+        return len(text.encode('utf-8')) + entry["vector"].nbytes + 256
+
+    def _fingerprint_file_mtime(self):
+        try:
+            return os.stat(os.path.join(self.db_directory, FINGERPRINT_FILENAME)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_fingerprint(self):
+        # A stat() every few seconds is enough: rebuilds are rare and we only need to notice them.
+        now = time.monotonic()
+        if now - self._fingerprint_checked < FINGERPRINT_CHECK_INTERVAL:
+            return
+        self._fingerprint_checked = now
+        mtime = self._fingerprint_file_mtime()
+        if mtime == self._fingerprint_mtime:
+            return
+        self._fingerprint_mtime = mtime
+        self._update_fingerprint(read_corpus_fingerprint(self.db_directory))
+
+    def _update_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            print(f"Corpus fingerprint changed ({self._fingerprint} -> {fingerprint}), clearing answer cache.")
+            self._fingerprint = fingerprint
+            self.invalidations += 1
+            self.clear()
+
+    def _load(self):
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable answer cache '{self.persist_path}': {e}")
+            return
+
+        if payload.get("fingerprint") != self._fingerprint:
+            print("Answer cache on disk was built against a different corpus, starting empty.")
+            return
+        with self._lock:
+            for entry in payload.get("entries", []):
+                key = entry.pop("key")
+                entry["vector"] = np.asarray(entry["vector"], dtype=np.float32)
+                self._entries[key] = entry
+                self._bytes += entry["size"]
+            self._evict()
+        print(f"Loaded {len(self._entries)} cached answers from '{self.persist_path}'.")
@@ -0,0 +1,298 @@
+# batch_qa.py
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import aleks_core
+import telemetry
+from answer_cache import normalize_query
+from llm_scheduler import SchedulerBusy
+
+# --- Batch Configuration ---
+# Largest batch /api/batch accepts in one request (the CLI has no limit).
+BATCH_MAX_QUESTIONS = int(os.getenv("ALEKS_BATCH_MAX_QUESTIONS", "1000"))
+# Generations a batch runs at once. Through the API they also take LLM scheduler slots, so keep this
+# below ALEKS_LLM_MAX_IN_FLIGHT if chat users should not wait behind a batch.
+BATCH_PARALLELISM = int(os.getenv("ALEKS_BATCH_PARALLELISM", "2"))
+# Questions retrieved together. The next group is retrieved while the previous one is generating.
+BATCH_RETRIEVAL_CHUNK = int(os.getenv("ALEKS_BATCH_RETRIEVAL_CHUNK", "32"))
+
+
+def normalize_questions(items):
+    """
+    Turns the questions of a batch (strings, or dicts with "question" and an optional "id") into
+    [{"id", "question"}]. Questions without an id are numbered by position.
+    Raises ValueError for empty questions and duplicate ids.
+    """
+    questions, seen = [], set()
+    for position, item in enumerate(items, start=1):
+        if isinstance(item, str):
+            item = {"question": item}
+        question = str(item.get("question") or "").strip()
+        question_id = str(item.get("id") or position)
+        if not question:
+            raise ValueError(f"Question '{question_id}' is empty.")
+        if question_id in seen:
+            raise ValueError(f"Duplicate question id '{question_id}'.")
+        seen.add(question_id)
+        questions.append({"id": question_id, "question": question})
+    return questions
+
+
+class BatchJob:
+    """
+    The state of one batch: which questions are still to answer, grouped so that questions asked
+    twice (same text up to case and punctuation) are answered once, plus progress counters.
+    Questions go straight to RAG, without intent routing: a compliance checklist holds no document
+    requests, and routing each question would cost an extra embedding or LLM call.
+    """
+
+    def __init__(self, questions, skip_ids=()):
+        skip_ids = set(skip_ids)
+        self.total = len(questions)
+        self.skipped = sum(1 for q in questions if q["id"] in skip_ids)
+        groups = {}
+        for q in questions:
+            if q["id"] not in skip_ids:
+                groups.setdefault(normalize_query(q["question"]), []).append(q)
+        self.groups = list(groups.values())
+        self.answered = 0
+        self.failed = 0
+        self.cached = 0
+        self.retrieval_s = 0.0
+        self.generation_s = 0.0
+        self.started = time.perf_counter()
+
+    def chunks(self, size=BATCH_RETRIEVAL_CHUNK):
+        return [self.groups[i:i + size] for i in range(0, len(self.groups), max(1, size))]
+
+    def prepare(self, chunk):
+        """Bulk retrieval for a chunk of question groups (blocking)."""
+        started = time.perf_counter()
+        prepared = aleks_core.prepare_rag_batch([group[0]["question"] for group in chunk])
+        self.retrieval_s += time.perf_counter() - started
+        return prepared
+
+    def answer(self, group, prepared):
+        """The generation for one question group (blocking). Returns (result, latency_ms)."""
+        started = time.perf_counter()
+        result = aleks_core.answer_prepared(group[0]["question"], prepared)
+        elapsed = time.perf_counter() - started
+        self.generation_s += elapsed
+        return result, elapsed * 1000
+
+    def records(self, group, result=None, latency_ms=0.0, error=None):
+        """Result (or error) records for every question of the group, then a progress record."""
+        records = []
+        for q in group:
+            if error is None:
+                records.append({"type": "result", "id": q["id"], "question": q["question"], "answer": result["answer"],
+                                "sources": result["sources"], "cached": bool(result.get("cached")),
+                                "latency_ms": round(latency_ms, 1)})
+            else:
+                records.append({"type": "error", "id": q["id"], "question": q["question"], "error": str(error)})
+        if error is None:
+            self.answered += len(group)
+            self.cached += len(group) if result.get("cached") else 0
+        else:
+            self.failed += len(group)
+            telemetry.log(f"Batch question '{group[0]['id']}' failed: {error}")
+        records.append(self.progress())
+        return records
+
+    def progress(self):
+        return {"type": "progress", "done": self.answered + self.failed, "remaining": self.total - self.skipped - self.answered - self.failed,
+                "total": self.total, "elapsed_s": round(time.perf_counter() - self.started, 2)}
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "type": "summary",
+            "total": self.total,
+            "answered": self.answered,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "distinct_questions": len(self.groups),
+            "cached": self.cached,
+            "retrieval_s": round(self.retrieval_s, 2),
+            "generation_s": round(self.generation_s, 2),
+            "elapsed_s": round(elapsed, 2),
+            "questions_per_s": round((self.answered + self.failed) / elapsed, 2) if elapsed else None,
+        }
+
+
+def run_batch(job, parallelism=BATCH_PARALLELISM):
+    """
+    Answers the job's questions in-process, yielding records as answers complete: "result"/"error"
+    per question, "progress" after each answer and a final "summary". Generations run on parallelism
+    threads; each retrieval chunk is prepared while the previous chunk generates.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, parallelism), thread_name_prefix="aleks-batch") as pool:
+        pending = {}  # future -> question group
+        for chunk in job.chunks():
+            try:
+                prepared = job.prepare(chunk)
+            except Exception as e:
+                for group in chunk:
+                    yield from job.records(group, error=e)
+                continue
+            for group, entry in zip(chunk, prepared):
+                pending[pool.submit(job.answer, group, entry)] = group
+            finished = [future for future in pending if future.done()]
+            for future in finished:
+                yield from _future_records(job, pending.pop(future), future)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield from _future_records(job, pending.pop(future), future)
+    yield job.summary()
+
+
+def _future_records(job, group, future):
+    try:
+        result, latency_ms = future.result()
+    except Exception as e:
+        return job.records(group, error=e)
+    return job.records(group, result, latency_ms)
+
+
+async def _run_scheduled(scheduler, fn, *args):
+    # A full queue makes a batch wait its turn rather than fail; interactive requests keep their 429s
+    while True:
+        try:
+            return await scheduler.run(fn, *args)
+        except SchedulerBusy as e:
+            await asyncio.sleep(e.retry_after)
+
+
+async def stream_batch(job, scheduler, parallelism=BATCH_PARALLELISM):
+    """
+    run_batch() for the API: retrieval and generations go through the LLM scheduler, with at most
+    parallelism generations of this batch holding a slot at a time. Cancelling the iteration (client
+    disconnect) cancels the questions not yet started.
+    """
+    queue = asyncio.Queue()
+    slots = asyncio.Semaphore(max(1, parallelism))
+
+    async def answer(group, entry):
+        async with slots:
+            try:
+                result, latency_ms = await _run_scheduled(scheduler, job.answer, group, entry)
+            except Exception as e:
+                queue.put_nowait(job.records(group, error=e))
+            else:
+                queue.put_nowait(job.records(group, result, latency_ms))
+
+    async def produce():
+        tasks = []
+        try:
+            for chunk in job.chunks():
+                try:
+                    prepared = await _run_scheduled(scheduler, job.prepare, chunk)
+                except Exception as e:
+                    for group in chunk:
+                        queue.put_nowait(job.records(group, error=e))
+                    continue
+                tasks.extend(asyncio.ensure_future(answer(group, entry)) for group, entry in zip(chunk, prepared))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            queue.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            records = await queue.get()
+            if records is None:
+                break
+            for record in records:
+                yield record
+        producer.result()
+        yield job.summary()
+    finally:
+        producer.cancel()
+
+
+def read_questions(path):
+    """Questions from a .jsonl file ({"id", "question"} per line) or a text file (one question per line)."""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return normalize_questions(json.loads(line) for line in lines)
+    return normalize_questions(lines)
+
+
+def answered_ids(path):
+    """IDs already answered in an output file of an earlier run, so a resumed run skips them."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut off when the previous run was interrupted
+            if record.get("type") == "result":
+                done.add(record["id"])
+    return done
+
+
+def _remote_records(url, questions, skip_ids, parallelism):
+    import httpx
+
+    payload = {"questions": questions, "skip_ids": sorted(skip_ids), "parallelism": parallelism}
+    with httpx.stream("POST", url.rstrip("/") + "/api/batch", json=payload, timeout=None) as response:
+        if response.status_code != 200:
+            response.read()
+            raise RuntimeError(f"/api/batch answered {response.status_code}: {response.text}")
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Answer a file of questions with Aleks, writing one JSON line per answer.")
+    parser.add_argument("questions", help=".jsonl file with {\"id\", \"question\"} per line, or a text file with one question per line.")
+    parser.add_argument("--output", required=True, help="JSONL file the answers are appended to. Questions already answered in it are skipped.")
+    parser.add_argument("--parallelism", type=int, default=BATCH_PARALLELISM, help="Generations running at once.")
+    parser.add_argument("--url", help="Send the batch to a running Aleks API (e.g. http://localhost:8000) instead of loading the models here.")
+    args = parser.parse_args()
+
+    questions = read_questions(args.questions)
+    skip_ids = answered_ids(args.output)
+    if skip_ids:
+        print(f"Resuming: {len(skip_ids)} questions already answered in {args.output}.", file=sys.stderr)
+    if args.url:
+        records = _remote_records(args.url, questions, skip_ids, args.parallelism)
+    else:
+        aleks_core.initialize_aleks_components()
+        records = run_batch(BatchJob(questions, skip_ids), args.parallelism)
+
+    with open(args.output, 'a', encoding='utf-8') as output:
+        if output.tell():
+            # Don't glue the first answer onto a line the interrupted run left unfinished
+            with open(args.output, 'rb') as previous:
+                previous.seek(-1, os.SEEK_END)
+                if previous.read(1) != b"\n":
+                    output.write("\n")
+        for record in records:
+            if record["type"] in ("result", "error"):
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()  # every finished answer survives an interruption
+            elif record["type"] == "progress":
+                print(f"\r{record['done']} done, {record['remaining']} remaining ({record['elapsed_s']:.0f}s)",
+                      end="", file=sys.stderr)
+            else:
+                print(file=sys.stderr)
+                print(json.dumps(record, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
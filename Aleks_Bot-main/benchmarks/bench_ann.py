@@ -0,0 +1,258 @@
+# benchmarks/bench_ann.py
+"""
+Recall@k against exact search versus latency and memory of the vector index options at several
+corpus sizes: Chroma HNSW at different M / ef_search, per-law sharded collections with parallel
+fan-out, and the memory-mapped int8 flat and IVF indexes (at different numbers of probed lists).
+
+Corpora are built from the chunks of an ingested database (see common.synthetic_corpus); queries are
+the labelled retrieval queries plus perturbed corpus vectors. Ground truth is a brute-force float32
+scan. Every index is built and searched in a fresh process: HNSW settings only take effect when
+Chroma loads the graph, and RSS growth is then attributable to the index being measured.
+
+Run from the Aleks_Bot-main directory (builds a throwaway index from legal_data_pdfs unless --db-dir
+points at an existing one):
+    python -m benchmarks.bench_ann --sizes 10000,100000
+    python -m benchmarks.bench_ann --sizes 1000000 --hnsw-m 16,32 --ef-search 50,100,200 --ivf-probes 16,64
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import psutil
+
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies, synthetic_corpus
+
+CHROMA_ADD_BATCH = 4000
+
+
+def _rss_mb():
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def _dir_mb(path, exclude=()):
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [d for d in dirs if d not in exclude]
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return round(total / 2**20, 1)
+
+
+def _load_chunks(db_dir):
+    from vector_index import create_store
+    data = create_store(db_dir, sharding="none").get(include=["documents", "metadatas", "embeddings"])
+    return data["ids"], data["documents"], data["metadatas"], data["embeddings"]
+
+
+# --- Workers (run in a fresh process) ---
+
+def build_worker(spec):
+    import chromadb
+    from corpus_fingerprint import write_corpus_fingerprint
+    from vector_index import COLLECTION_NAME, QuantizedIndex, create_store
+
+    ids, texts, metadatas, vectors = _load_chunks(spec["base_db"])
+    store = create_store(spec["dir"], sharding=spec["layout"])
+    started = time.perf_counter()
+    collection = chromadb.PersistentClient(path=spec["dir"]).get_collection(COLLECTION_NAME) if spec["layout"] == "none" else None
+    for batch_ids, batch_texts, batch_metadatas, batch_vectors in synthetic_corpus(ids, texts, metadatas, vectors, spec["size"], CHROMA_ADD_BATCH):
+        if collection is not None:
+            collection.add(ids=batch_ids, documents=batch_texts, metadatas=batch_metadatas, embeddings=batch_vectors)
+        else:
+            store.add_embeddings(batch_ids, batch_texts, batch_metadatas, batch_vectors)
+    result = {"build_s": round(time.perf_counter() - started, 2)}
+    if spec["quantized"]:
+        fingerprint = write_corpus_fingerprint(spec["dir"], {"synthetic": str(spec["size"])})
+        for kind in ("flat", "ivf"):
+            started = time.perf_counter()
+            QuantizedIndex.build(store, os.path.join(spec["dir"], f"{kind}_index"), kind, fingerprint)
+            result[f"{kind}_build_s"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+def search_worker(spec):
+    from vector_index import QuantizedIndex, QuantizedVectorStore, create_store
+
+    queries = np.load(spec["queries"])
+    rss_before = _rss_mb()
+    if spec["kind"] in ("hnsw", "sharded"):
+        # ALEKS_HNSW_EF_SEARCH and ALEKS_VECTOR_SHARDING come from the environment, as in the API
+        store = create_store(spec["dir"])
+    else:
+        index = QuantizedIndex.load(os.path.join(spec["dir"], f"{spec['kind']}_index"))
+        index.probes = spec.get("probes", index.probes)
+        store = QuantizedVectorStore(create_store(spec["dir"], sharding="none"), index)
+
+    def search(query):
+        return [document.id for document, _ in store.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=spec["k"])]
+
+    search(queries[0])  # loads the index
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {"ids": results, "latency": summarize_latencies(latencies), "rss_delta_mb": round(_rss_mb() - rss_before, 1)}
+
+
+def _run_worker(kind, spec, env=None):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    try:
+        completed = subprocess.run([sys.executable, "-m", "benchmarks.bench_ann", "--worker", kind,
+                                    "--worker-spec", json.dumps(spec), "--worker-output", output],
+                                   env=dict(os.environ, **(env or {})), stdout=sys.stderr)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{kind} worker failed with exit code {completed.returncode}: {spec}")
+        with open(output, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+# --- Driver ---
+
+def exact_neighbours(index_dir, queries, k):
+    """Brute-force k nearest chunk IDs per query over the float32 vectors of a flat index."""
+    from vector_index import SCAN_BLOCK, QuantizedIndex
+
+    index = QuantizedIndex.load(index_dir)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+    query_norms = (queries ** 2).sum(axis=1)
+    for start in range(0, len(index), SCAN_BLOCK):
+        block = np.asarray(index.vectors[start:start + SCAN_BLOCK])
+        distances = (block ** 2).sum(axis=1)[None, :] - 2 * queries @ block.T + query_norms[:, None]
+        rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)), distances.shape)], axis=1)
+        distances = np.concatenate([best_distances, distances], axis=1)
+        keep = np.argsort(distances, axis=1)[:, :k]
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+        best_distances = np.take_along_axis(distances, keep, axis=1)
+    return [[index.ids[row] for row in rows] for rows in best_rows]
+
+
+def recall(results, truth, k):
+    return round(float(np.mean([len(set(found[:k]) & set(expected)) / k for found, expected in zip(results, truth)])), 4)
+
+
+def make_queries(base_db, n_queries, queries_path):
+    from embedding_service import EmbeddingService
+
+    ids, texts, metadatas, vectors = _load_chunks(base_db)
+    embeddings = EmbeddingService()
+    labelled = [embeddings.embed_query(item["query"]) for item in load_jsonl(queries_path)][:n_queries]
+    rng = np.random.default_rng(1)
+    base = np.asarray(vectors, dtype=np.float32)
+    picked = base[rng.choice(len(base), max(0, n_queries - len(labelled)))]
+    noise = 0.1 * np.linalg.norm(picked, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+    perturbed = picked + noise * rng.standard_normal(picked.shape, dtype=np.float32)
+    return np.concatenate([np.asarray(labelled, dtype=np.float32).reshape(-1, base.shape[1]), perturbed])
+
+
+def env_params(env):
+    names = {"ALEKS_HNSW_M": "m", "ALEKS_HNSW_EF_SEARCH": "ef_search"}
+    return {names[key]: int(value) for key, value in (env or {}).items() if key in names}
+
+
+def bench_size(args, base_db, queries_file, queries, size, work_dir):
+    single_dirs = {m: os.path.join(work_dir, f"single-m{m}") for m in args.hnsw_m}
+    sharded_dir = os.path.join(work_dir, "sharded")
+    first_m = args.hnsw_m[0]
+    builds = {}
+    for m, directory in single_dirs.items():
+        builds[f"hnsw_m{m}"] = _run_worker("build", {"base_db": base_db, "size": size, "layout": "none", "dir": directory,
+                                                      "quantized": m == first_m}, {"ALEKS_HNSW_M": str(m)})
+    if not args.no_sharded:
+        builds["sharded"] = _run_worker("build", {"base_db": base_db, "size": size, "layout": "law", "dir": sharded_dir,
+                                                  "quantized": False}, {"ALEKS_HNSW_M": str(first_m)})
+    truth = exact_neighbours(os.path.join(single_dirs[first_m], "flat_index"), queries, args.k)
+    dim = queries.shape[1]
+
+    rows = []
+
+    def measure(label, kind, directory, env=None, **extra):
+        result = _run_worker("search", {"kind": kind, "dir": directory, "queries": queries_file, "k": args.k, **extra}, env)
+        row = {"index": label, **extra, **env_params(env),
+               f"recall@{args.k}": recall(result["ids"], truth, args.k), "latency": result["latency"],
+               "rss_delta_mb": result["rss_delta_mb"]}
+        rows.append(row)
+        print(f"{size} chunks, {label} {dict(extra, **env_params(env))}: recall {row[f'recall@{args.k}']}, "
+              f"p50 {row['latency']['p50_ms']} ms", file=sys.stderr)
+        return row
+
+    for m, directory in single_dirs.items():
+        for ef in args.ef_search:
+            row = measure("hnsw", "hnsw", directory, {"ALEKS_HNSW_M": str(m), "ALEKS_HNSW_EF_SEARCH": str(ef), "ALEKS_VECTOR_SHARDING": "none"})
+            row["index_disk_mb"] = _dir_mb(directory, exclude=("flat_index", "ivf_index"))
+            # float32 vectors plus the level-0 neighbour lists (2M links of 4 bytes)
+            row["estimated_resident_mb"] = round(size * (dim * 4 + m * 2 * 4) / 2**20, 1)
+    if not args.no_sharded:
+        for ef in args.ef_search:
+            row = measure("hnsw_sharded_by_law", "sharded", sharded_dir,
+                          {"ALEKS_HNSW_M": str(first_m), "ALEKS_HNSW_EF_SEARCH": str(ef), "ALEKS_VECTOR_SHARDING": "law"})
+            row["index_disk_mb"] = _dir_mb(sharded_dir)
+    quantized_dir = single_dirs[first_m]
+    # int8 codes plus scale, norm and source code per chunk; float32 rows are read only for re-scoring
+    quantized_resident_mb = round(size * (dim + 12) / 2**20, 1)
+    row = measure("flat_int8", "flat", quantized_dir)
+    row.update(index_disk_mb=_dir_mb(os.path.join(quantized_dir, "flat_index")), estimated_resident_mb=quantized_resident_mb)
+    for probes in args.ivf_probes:
+        row = measure("ivf_int8", "ivf", quantized_dir, probes=probes)
+        row.update(index_disk_mb=_dir_mb(os.path.join(quantized_dir, "ivf_index")), estimated_resident_mb=quantized_resident_mb)
+    for directory in [*single_dirs.values(), sharded_dir]:
+        shutil.rmtree(directory, ignore_errors=True)
+    return {"chunks": size, "builds": builds, "results": rows}
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=_int_list, default=[10_000, 100_000])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="Query vectors (labelled queries first, then perturbed chunks).")
+    parser.add_argument("--hnsw-m", type=_int_list, default=[16])
+    parser.add_argument("--ef-search", type=_int_list, default=[10, 25, 50, 100, 200])
+    parser.add_argument("--ivf-probes", type=_int_list, default=[4, 8, 16, 32, 64])
+    parser.add_argument("--no-sharded", action="store_true", help="Skip the per-law sharded collections.")
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default=None, help="Existing database to take the chunks from (default: build a temporary one).")
+    parser.add_argument("--labelled-queries", default=os.path.join(DATA_DIR, "retrieval_queries.jsonl"))
+    parser.add_argument("--worker", choices=("build", "search"), help=argparse.SUPPRESS)
+    parser.add_argument("--worker-spec", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = (build_worker if args.worker == "build" else search_worker)(json.loads(args.worker_spec))
+        with open(args.worker_output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="aleks-ann-")
+    try:
+        base_db = args.db_dir
+        if base_db is None:
+            from vector_db_creator import sync_vector_db
+            base_db = os.path.join(work_dir, "base")
+            sync_vector_db(args.pdf_dir, base_db)
+        queries = make_queries(base_db, args.queries, args.labelled_queries)
+        queries_file = os.path.join(work_dir, "queries.npy")
+        np.save(queries_file, queries)
+        results = {"k": args.k, "queries": len(queries), "sizes": [
+            bench_size(args, base_db, queries_file, queries, size, work_dir) for size in args.sizes
+        ]}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# benchmarks/bench_batch.py
+"""
+Batch question answering vs the per-request path, on a compliance checklist.
+
+1. Retrieval alone: one retriever.invoke() per question vs HybridRetriever.retrieve_many() (batched
+   query embedding, bulk vector search, shared chunks fetched once), including whether both return
+   the same chunks.
+2. End to end through the ASGI app with the real retriever and a stub LLM sleeping --llm-ms:
+   the checklist sent as one /api/chat request after another, as --parallelism concurrent /api/chat
+   clients, and as a single /api/batch request with the same parallelism.
+
+The answer cache is off, so every question pays for retrieval and generation. Query embeddings are
+cleared before each run, so each run embeds its questions itself.
+
+Run from the Aleks_Bot-main directory (builds a throwaway index from legal_data_pdfs unless --db-dir
+points at an existing one):
+    python -m benchmarks.bench_batch
+    python -m benchmarks.bench_batch --db-dir ./chroma_db --repeat 5 --llm-ms 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies
+
+
+def clear_query_cache(embeddings):
+    with embeddings._query_lock:
+        embeddings._query_cache.clear()
+
+
+def time_retrieval(retriever, embeddings, questions):
+    clear_query_cache(embeddings)
+    started = time.perf_counter()
+    single = [retriever.invoke(question) for question in questions]
+    single_s = time.perf_counter() - started
+
+    clear_query_cache(embeddings)
+    started = time.perf_counter()
+    batched = retriever.retrieve_many(questions)
+    batch_s = time.perf_counter() - started
+    same = sum([d.id for d in a] == [d.id for d in b] for a, b in zip(single, batched))
+    return {
+        "questions": len(questions),
+        "per_question_ms": round(single_s * 1000, 1),
+        "batched_ms": round(batch_s * 1000, 1),
+        "speedup": round(single_s / batch_s, 2) if batch_s else None,
+        "identical_results": f"{same}/{len(questions)}",
+    }
+
+
+async def chat_questions(client, questions, concurrency):
+    latencies, errors = [], 0
+    pending = iter(questions)
+
+    async def client_loop():
+        nonlocal errors
+        for question in pending:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": question})
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"answers": len(latencies), "errors": errors, "elapsed_s": round(elapsed, 2),
+            "questions_per_s": round(len(latencies) / elapsed, 2), "latency": summarize_latencies(latencies)}
+
+
+async def batch_questions(client, items, parallelism):
+    started = time.perf_counter()
+    answers, errors, summary = 0, 0, None
+    async with client.stream("POST", "/api/batch", json={"questions": items, "parallelism": parallelism}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            record = json.loads(line)
+            if record["type"] == "result":
+                answers += 1
+            elif record["type"] == "error":
+                errors += 1
+            elif record["type"] == "summary":
+                summary = record
+    elapsed = time.perf_counter() - started
+    return {"answers": answers, "errors": errors, "elapsed_s": round(elapsed, 2),
+            "questions_per_s": round(answers / elapsed, 2), "distinct_questions": summary["distinct_questions"] if summary else None,
+            "retrieval_s": summary["retrieval_s"] if summary else None}
+
+
+async def end_to_end(app, embeddings, items, parallelism):
+    import httpx
+
+    questions = [item["question"] for item in items]
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+        await chat_questions(client, questions[:2], 1)  # warm-up
+        clear_query_cache(embeddings)
+        results["per_request_sequential"] = await chat_questions(client, questions, 1)
+        clear_query_cache(embeddings)
+        results[f"per_request_concurrency_{parallelism}"] = await chat_questions(client, questions, parallelism)
+        clear_query_cache(embeddings)
+        results["batch_api"] = await batch_questions(client, items, parallelism)
+    sequential = results["per_request_sequential"]["questions_per_s"]
+    concurrent = results[f"per_request_concurrency_{parallelism}"]["questions_per_s"]
+    batch = results["batch_api"]["questions_per_s"]
+    results["batch_speedup_vs_sequential"] = round(batch / sequential, 2) if sequential else None
+    results["batch_speedup_vs_concurrent"] = round(batch / concurrent, 2) if concurrent else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=os.path.join(DATA_DIR, "compliance_checklist.jsonl"))
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default=None, help="Existing database to use (default: build a temporary one).")
+    parser.add_argument("--repeat", type=int, default=1, help="Times the checklist is repeated (distinct IDs, same questions).")
+    parser.add_argument("--parallelism", type=int, default=2, help="Generations at once (also the concurrent /api/chat clients).")
+    parser.add_argument("--llm-ms", type=float, default=100, help="Stub LLM time per answer.")
+    args = parser.parse_args()
+
+    # Set before the scheduler is created, so batch and concurrent chat get the same number of slots
+    os.environ.setdefault("ALEKS_LLM_MAX_IN_FLIGHT", str(args.parallelism))
+    import aleks_api
+    import aleks_core
+    from llm_backends import StubLLM
+    from vector_db_creator import sync_vector_db
+
+    checklist = load_jsonl(args.questions)
+    items = [{"id": f"{item['id']}#{n}" if args.repeat > 1 else item["id"], "question": item["question"]}
+             for n in range(args.repeat) for item in checklist]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_dir = args.db_dir or tmp_dir
+        if args.db_dir is None:
+            sync_vector_db(args.pdf_dir, db_dir)
+        aleks_core.CHROMA_DB_DIR = db_dir
+        embeddings = aleks_core.load_embeddings()
+        vectorstore = aleks_core.open_vector_store(embeddings)
+        aleks_core.llm = StubLLM(delay_ms=args.llm_ms)
+        aleks_core.install_retrieval_components(embeddings, aleks_core.build_retriever(vectorstore))
+        aleks_core.answer_cache = None
+
+        results = {
+            "config": {"questions": len(items), "parallelism": args.parallelism, "llm_ms": args.llm_ms,
+                       "max_in_flight": aleks_api.llm_scheduler.max_in_flight},
+            "retrieval": time_retrieval(aleks_core.retriever, embeddings, [item["question"] for item in checklist]),
+            "end_to_end": asyncio.run(end_to_end(aleks_api.app, embeddings, items, args.parallelism)),
+        }
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
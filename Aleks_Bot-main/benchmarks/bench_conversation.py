@@ -0,0 +1,140 @@
+# benchmarks/bench_conversation.py
+"""
+Multi-turn conversation benchmark.
+
+1. Prompt size per turn over a long conversation: conversation memory (recent turns + rolling summary
+   within ALEKS_CONVERSATION_HISTORY_TOKEN_BUDGET) vs pasting the whole transcript into every prompt.
+2. Follow-up retrieval: hit@k for follow-ups like "what about the penalties?" searched as typed vs
+   after condensation into a standalone query.
+
+The LLM is a stub that answers with the first words of the retrieved context, so no Ollama is needed.
+
+Run from the Aleks_Bot-main directory (builds a throwaway index from legal_data_pdfs unless --db-dir
+points at an existing one):
+    python -m benchmarks.bench_conversation --turns 20
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import aleks_core
+from bm25_index import BM25Index
+from context_builder import estimate_tokens
+from conversation_memory import ConversationMemory
+from embedding_service import EmbeddingService
+from hybrid_retriever import HybridRetriever
+from vector_db_creator import sync_vector_db
+from vector_index import open_store
+from benchmarks.common import DATA_DIR, load_jsonl
+
+
+class StubLLM:
+    """Stands in for OllamaLLM: records each prompt and answers with answer_words words of its context."""
+
+    def __init__(self, answer_words):
+        self.answer_words = answer_words
+        self.prompts = []
+
+    def invoke(self, prompt, config=None):
+        self.prompts.append(prompt)
+        context = prompt.split("\n\n", 1)[1]
+        return " ".join(context.split()[:self.answer_words])
+
+
+def _is_relevant(document, item):
+    return document.metadata.get("source") == item["source"] and item["expect"] in " ".join(document.page_content.lower().split())
+
+
+def _history_of(prompt):
+    if "Conversation so far:\n" not in prompt:
+        return ""
+    return prompt.split("Conversation so far:\n", 1)[1].split("\n\nQuestion:", 1)[0]
+
+
+def prompt_growth(conversations, turns, stub):
+    """One long session cycling through every conversation's questions."""
+    aleks_core.conversation_memory = ConversationMemory()
+    questions = [turn["query"] for conversation in conversations for turn in conversation["turns"]]
+    session_id, transcript, rows = None, [], []
+    for i in range(turns):
+        question = questions[i % len(questions)]
+        result = aleks_core.get_rag_response(question, session_id)
+        session_id = result["session_id"]
+        prompt = stub.prompts[-1]
+        memory_tokens = estimate_tokens(prompt)
+        # Same prompt with the full transcript in place of the bounded history
+        full_history = "\n".join(transcript)
+        transcript_tokens = memory_tokens - estimate_tokens(_history_of(prompt)) + estimate_tokens(full_history)
+        rows.append({"turn": i + 1, "memory_prompt_tokens": memory_tokens, "transcript_prompt_tokens": transcript_tokens})
+        transcript.append(f"User: {question}\nAleks: {result['answer']}")
+    return rows
+
+
+def follow_up_retrieval(conversations, k):
+    aleks_core.conversation_memory = ConversationMemory()
+    raw_hits = condensed_hits = total = 0
+    examples = []
+    for conversation in conversations:
+        session_id = None
+        for i, turn in enumerate(conversation["turns"]):
+            if i > 0:
+                prepared = aleks_core.conversation_memory.prepare(session_id, turn["query"])
+                raw = any(_is_relevant(d, turn) for d in aleks_core.retriever.invoke(turn["query"])[:k])
+                condensed = any(_is_relevant(d, turn) for d in aleks_core.retriever.invoke(prepared["retrieval_query"])[:k])
+                raw_hits += raw
+                condensed_hits += condensed
+                total += 1
+                examples.append({"follow_up": turn["query"], "retrieval_query": prepared["retrieval_query"],
+                                 "raw_hit": raw, "condensed_hit": condensed})
+            session_id = aleks_core.get_rag_response(turn["query"], session_id)["session_id"]
+    return {
+        "follow_ups": total,
+        f"raw_hit@{k}": round(raw_hits / total, 3) if total else None,
+        f"condensed_hit@{k}": round(condensed_hits / total, 3) if total else None,
+        "examples": examples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", default=os.path.join(DATA_DIR, "conversations.jsonl"))
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default=None, help="Existing database to use (default: build a temporary one).")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--turns", type=int, default=20, help="Length of the long conversation in part 1.")
+    parser.add_argument("--answer-words", type=int, default=120, help="Length of each stub answer.")
+    args = parser.parse_args()
+
+    conversations = load_jsonl(args.conversations)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_dir = args.db_dir or tmp_dir
+        if args.db_dir is None:
+            sync_vector_db(args.pdf_dir, db_dir)
+
+        vectorstore = open_store(db_dir, EmbeddingService())
+        bm25 = BM25Index.load(db_dir) or BM25Index.from_vectorstore(vectorstore)
+        aleks_core.retriever = HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=args.k)
+        aleks_core.answer_cache = None
+        stub = StubLLM(args.answer_words)
+        aleks_core.llm = stub
+
+        rows = prompt_growth(conversations, args.turns, stub)
+        after_warmup = [row["memory_prompt_tokens"] for row in rows[3:]] or [rows[-1]["memory_prompt_tokens"]]
+        results = {
+            "prompt_growth": {
+                "turns": args.turns,
+                "history_token_budget": aleks_core.conversation_memory.history_token_budget,
+                "memory_first_turn_tokens": rows[0]["memory_prompt_tokens"],
+                "memory_max_tokens_after_turn_3": max(after_warmup),
+                "memory_last_turn_tokens": rows[-1]["memory_prompt_tokens"],
+                "transcript_last_turn_tokens": rows[-1]["transcript_prompt_tokens"],
+                "per_turn": rows,
+            },
+            "follow_up_retrieval": follow_up_retrieval(conversations, args.k),
+        }
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# benchmarks/bench_embeddings.py
+"""
+Embeddings/sec and memory of the default HuggingFaceEmbeddings setup versus EmbeddingService
+(configurable batch size, threads, torch/ONNX/int8 backend, disk cache) on the bundled corpus.
+
+Each configuration runs in a fresh process so RSS numbers are not polluted by the previous one.
+EmbeddingService is measured twice: with a cold disk cache (model throughput) and a warm one
+(what a rebuild with unchanged chunks costs).
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_embeddings --batch-size 64 --backend torch
+    python -m benchmarks.bench_embeddings --backend onnx-int8 --threads 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import psutil
+
+from data_processor import load_and_process_legal_data
+from embedding_service import EMBEDDINGS_MODEL_NAME
+
+
+def _rss_mb():
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def _time_embedding(embeddings, texts, queries):
+    started = time.perf_counter()
+    embeddings.embed_documents(texts)
+    doc_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for query in queries:
+        embeddings.embed_query(query)
+    query_seconds = time.perf_counter() - started
+    return {
+        "docs_per_sec": round(len(texts) / doc_seconds, 1),
+        "queries_per_sec": round(len(queries) / query_seconds, 1),
+    }
+
+
+def run_baseline(texts, queries):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    rss_before = _rss_mb()
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL_NAME)
+    result = {"model_rss_mb": round(_rss_mb() - rss_before, 1)}
+    result.update(_time_embedding(embeddings, texts, queries))
+    result["peak_rss_mb"] = round(_rss_mb(), 1)
+    return result
+
+
+def run_service(texts, queries, batch_size, threads, backend, cache_path):
+    from embedding_service import EmbeddingService
+    rss_before = _rss_mb()
+    embeddings = EmbeddingService(batch_size=batch_size, threads=threads, backend=backend, cache_path=cache_path)
+    result = {"backend": embeddings.backend, "model_rss_mb": round(_rss_mb() - rss_before, 1)}
+    result["cold"] = _time_embedding(embeddings, texts, queries)
+    # A fresh service over the same cache file: what the next ingestion run or restart sees.
+    warm = EmbeddingService(batch_size=batch_size, threads=threads, backend=backend, cache_path=cache_path)
+    result["warm"] = _time_embedding(warm, texts, queries)
+    result["warm"]["computed"] = warm.computed
+    result["peak_rss_mb"] = round(_rss_mb(), 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--limit", type=int, default=0, help="Only embed the first N chunks (0 = all).")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx", "onnx-int8"])
+    args = parser.parse_args()
+
+    texts = [chunk.page_content for chunk in load_and_process_legal_data(args.pdf_dir)]
+    if args.limit:
+        texts = texts[:args.limit]
+    queries = [text[:120] for text in texts[:100]] * 2  # every query asked twice
+
+    spawn = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "embedding_cache.sqlite3")
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            baseline = pool.submit(run_baseline, texts, queries).result()
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            service = pool.submit(run_service, texts, queries, args.batch_size, args.threads, args.backend, cache_path).result()
+
+    print(json.dumps({
+        "chunks": len(texts),
+        "queries": len(queries),
+        "baseline_huggingface_defaults": baseline,
+        "embedding_service": dict(service, batch_size=args.batch_size, threads=args.threads),
+        "cold_speedup": round(service["cold"]["docs_per_sec"] / baseline["docs_per_sec"], 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# benchmarks/bench_extraction.py
+"""
+Compares PDF extraction on legal_data_pdfs as it was before the process pool (baseline: a copy of the
+old data_processor, calling extract_text() twice per page and materializing the whole corpus as a
+list), the current pipeline run serially (workers=1) and the parallel streaming pipeline (process
+pool, chunks consumed as a generator). Reports wall time, pages/sec, chunk counts, per-file timings
+and (with --memory) peak Python memory held by the consumer. The baseline splits into fixed-size
+chunks rather than provisions, so its chunk count differs.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_extraction --workers 4
+"""
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import pypdf
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from data_processor import EXTRACT_WORKERS, iter_extracted_pdfs, iter_legal_chunks, load_and_process_legal_data
+
+
+def _pdf_paths(pdf_directory):
+    return [
+        os.path.join(pdf_directory, filename)
+        for filename in sorted(os.listdir(pdf_directory)) if filename.lower().endswith(".pdf")
+    ]
+
+
+# --- Baseline: data_processor.py before parallel extraction ---
+
+def baseline_extract_text_from_pdf(pdf_path):
+    text = ""
+    try:
+        with open(pdf_path, 'rb') as file:
+            reader = pypdf.PdfReader(file)
+            for page_num in range(len(reader.pages)):
+                page = reader.pages[page_num]
+                if page.extract_text():
+                    text += page.extract_text()
+                else:
+                    print(f"Warning: Could not extract text from page {page_num+1} of {os.path.basename(pdf_path)}")
+    except Exception as e:
+        print(f"Error extracting text from {pdf_path}: {e}")
+    return text
+
+
+def baseline_load_and_process_legal_data(pdf_directory):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200, length_function=len, add_start_index=True)
+    chunks = []
+    for pdf_path in _pdf_paths(pdf_directory):
+        text = baseline_extract_text_from_pdf(pdf_path)
+        if not text:
+            continue
+        cleaned_text = os.linesep.join([s for s in text.splitlines() if s.strip()]).strip()
+        document = Document(page_content=cleaned_text, metadata={"source": os.path.basename(pdf_path)})
+        chunks.extend(splitter.split_documents([document]))
+    return chunks
+
+
+def _measure(fn, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    chunk_count = fn()
+    result = {"seconds": round(time.perf_counter() - started, 2), "chunks": chunk_count}
+    if trace_memory:
+        # Tracing slows pypdf down a lot, so timings from a --memory run are not comparable.
+        result["peak_python_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+    return result
+
+
+def run_baseline(pdf_directory, trace_memory=False):
+    return _measure(lambda: len(baseline_load_and_process_legal_data(pdf_directory)), trace_memory)
+
+
+def run_serial(pdf_directory, trace_memory=False):
+    return _measure(lambda: len(load_and_process_legal_data(pdf_directory, workers=1)), trace_memory)
+
+
+def run_streaming(pdf_directory, workers, trace_memory=False):
+    def consume():
+        chunk_count = 0
+        for _ in iter_legal_chunks(pdf_directory, workers=workers):
+            chunk_count += 1  # a real consumer embeds and drops each batch here
+        return chunk_count
+    return _measure(consume, trace_memory)
+
+
+def per_file_timings(pdf_directory, workers):
+    return {
+        os.path.basename(path): stats
+        for path, _, stats in iter_extracted_pdfs(_pdf_paths(pdf_directory), workers=workers)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--workers", type=int, default=max(2, EXTRACT_WORKERS))
+    parser.add_argument("--memory", action="store_true",
+                        help="Also report peak Python memory held by the consumer (slow, separate runs).")
+    args = parser.parse_args()
+
+    total_pages = sum(len(pypdf.PdfReader(path).pages) for path in _pdf_paths(args.pdf_dir))
+    baseline = run_baseline(args.pdf_dir)
+    serial = run_serial(args.pdf_dir)
+    streaming = run_streaming(args.pdf_dir, args.workers)
+    for result in (baseline, serial, streaming):
+        result["pages_per_sec"] = round(total_pages / result["seconds"], 1) if result["seconds"] else 0.0
+
+    report = {
+        "pdf_dir": args.pdf_dir,
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "pages": total_pages,
+        "baseline": baseline,
+        "serial": serial,
+        "parallel_streaming": streaming,
+        "speedup_vs_baseline": round(baseline["seconds"] / streaming["seconds"], 2) if streaming["seconds"] else None,
+        "speedup_vs_serial": round(serial["seconds"] / streaming["seconds"], 2) if streaming["seconds"] else None,
+        "per_file_parallel": per_file_timings(args.pdf_dir, args.workers),
+    }
+    if args.memory:
+        report["memory"] = {
+            "baseline": run_baseline(args.pdf_dir, trace_memory=True),
+            "serial": run_serial(args.pdf_dir, trace_memory=True),
+            "parallel_streaming": run_streaming(args.pdf_dir, args.workers, trace_memory=True),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
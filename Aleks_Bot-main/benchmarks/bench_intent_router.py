@@ -0,0 +1,86 @@
+# benchmarks/bench_intent_router.py
+"""
+Compares the old LLM-only document-request classifier with the tiered intent router
+on a labelled query set, reporting accuracy, tier usage and p50/p95 routing latency.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_intent_router
+    python -m benchmarks.bench_intent_router --stub-llm-ms 1500   # no Ollama needed
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+
+import aleks_core
+from document_manager import DOCUMENT_TEMPLATES
+from embedding_service import EmbeddingService
+from intent_router import IntentRouter, NO_DOCUMENT
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies
+
+
+def _same_template(predicted, label):
+    # "nda" and "non-disclosure agreement" are aliases of the same template file.
+    if NO_DOCUMENT in (predicted, label):
+        return predicted == label
+    return DOCUMENT_TEMPLATES.get(predicted) == DOCUMENT_TEMPLATES.get(label)
+
+
+def _make_stub_classifier(labels, delay_ms):
+    """An oracle LLM stand-in: sleeps like a generation, then answers with the true label (none if unlabelled)."""
+    def classify(query):
+        time.sleep(delay_ms / 1000)
+        return labels.get(query, NO_DOCUMENT)
+    return classify
+
+
+def run_mode(router, queries):
+    latencies, tiers, correct = [], Counter(), 0
+    for item in queries:
+        decision = router.route(item["query"])
+        latencies.append(decision["latency_ms"])
+        tiers[decision["tier"]] += 1
+        correct += _same_template(decision["document_type"], item["label"])
+    return {
+        "accuracy": round(correct / len(queries), 4),
+        "tiers": dict(tiers),
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(DATA_DIR, "intent_queries.jsonl"))
+    parser.add_argument("--stub-llm-ms", type=float, default=None,
+                        help="Replace Ollama with an oracle stub that sleeps this long per call.")
+    args = parser.parse_args()
+
+    queries = load_jsonl(args.queries)
+    embeddings = EmbeddingService()
+
+    if args.stub_llm_ms is not None:
+        classifier = _make_stub_classifier({q["query"]: q["label"] for q in queries}, args.stub_llm_ms)
+    else:
+        aleks_core.llm = aleks_core.load_llm()
+        classifier = aleks_core._classify_with_llm
+
+    results = {}
+    for mode in ("llm", "tiered"):
+        router = IntentRouter(embeddings=embeddings, llm_classifier=classifier, mode=mode)
+        router.route("warm-up query")  # keep model load time out of the numbers
+        results[mode] = run_mode(router, queries)
+
+    llm_p50, tiered_p50 = results["llm"]["latency"]["p50_ms"], results["tiered"]["latency"]["p50_ms"]
+    llm_p95, tiered_p95 = results["llm"]["latency"]["p95_ms"], results["tiered"]["latency"]["p95_ms"]
+    results["reduction"] = {
+        "p50_pct": round(100 * (1 - tiered_p50 / llm_p50), 1) if llm_p50 else None,
+        "p95_pct": round(100 * (1 - tiered_p95 / llm_p95), 1) if llm_p95 else None,
+    }
+    results["queries"] = len(queries)
+    results["llm"]["note"] = "stub oracle" if args.stub_llm_ms is not None else "ollama"
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_llm_backends.py
+"""
+Throughput and failover of the Ollama backend pool, against simulated Ollama servers (no model needed).
+
+Each simulated server streams --tokens tokens after --prompt-ms of "prompt evaluation" and, like
+Ollama with OLLAMA_NUM_PARALLEL=1, runs one generation at a time. The same concurrent load is sent to
+one server, to a pool of --servers with least-loaded and round-robin routing, and to the pool with
+one server down. Also counts the TCP connections each server accepted (keep-alive reuse) and checks
+that the stub backend is deterministic.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_llm_backends
+    python -m benchmarks.bench_llm_backends --servers 4 --clients 16 --requests 8
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import OllamaPool, StubLLM
+from benchmarks.common import summarize_latencies
+
+
+class SimulatedOllama:
+    """A minimal /api/generate + /api/ps server with a one-at-a-time model and a connection counter."""
+
+    def __init__(self, prompt_ms, tokens, token_ms, parallel=1):
+        self.connections = 0
+        self.generations = 0
+        slots = threading.Semaphore(parallel)
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                simulator.connections += 1
+
+            def _send_chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                body = json.dumps({"models": []}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                with slots:
+                    simulator.generations += 1
+                    started = time.perf_counter()
+                    n_tokens = tokens if request.get("prompt") else 0
+                    time.sleep(prompt_ms / 1000 if n_tokens else 0)
+                    evaluated = time.perf_counter()
+                    for i in range(n_tokens):
+                        time.sleep(token_ms / 1000)
+                        self._send_chunk({"model": request["model"], "response": f" t{i}", "done": False})
+                    finished = time.perf_counter()
+                self._send_chunk({"model": request["model"], "response": "", "done": True, "done_reason": "stop",
+                                  "load_duration": 0, "prompt_eval_count": len(request.get("prompt", "").split()),
+                                  "prompt_eval_duration": int((evaluated - started) * 1e9), "eval_count": n_tokens,
+                                  "eval_duration": int((finished - evaluated) * 1e9)})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def unused_url():
+    """An address nothing listens on, standing in for a server that is down."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def run_load(llm, clients, requests):
+    def client(n):
+        latencies, errors = [], 0
+        for i in range(requests):
+            started = time.perf_counter()
+            try:
+                llm.invoke(f"Question {n}.{i}: what does the Labor Code say about overtime?")
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency_list, _ in results for latency in latency_list]
+    return {
+        "answers": len(latencies),
+        "errors": sum(errors for _, errors in results),
+        "answers_per_s": round(len(latencies) / elapsed, 2),
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=12, help="Concurrent callers.")
+    parser.add_argument("--requests", type=int, default=6, help="Generations per caller.")
+    parser.add_argument("--prompt-ms", type=float, default=40)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-ms", type=float, default=2)
+    args = parser.parse_args()
+
+    servers = [SimulatedOllama(args.prompt_ms, args.tokens, args.token_ms) for _ in range(args.servers)]
+    urls = [server.url for server in servers]
+    results = {}
+    try:
+        scenarios = [
+            ("single_server", [urls[0]], "least-loaded"),
+            ("pool_least_loaded", urls, "least-loaded"),
+            ("pool_round_robin", urls, "round-robin"),
+            ("pool_one_server_down", [unused_url(), *urls[1:]], "least-loaded"),
+        ]
+        for name, scenario_urls, routing in scenarios:
+            before = [(server.connections, server.generations) for server in servers]
+            llm = OllamaPool(urls=scenario_urls, routing=routing, health_interval=0)
+            result = run_load(llm, args.clients, args.requests)
+            result["servers"] = [{key: server[key] for key in ("url", "healthy", "requests", "failures")}
+                                 for server in llm.stats()["servers"]]
+            result["tcp_connections_opened"] = sum(server.connections - b[0] for server, b in zip(servers, before))
+            result["generations_served"] = sum(server.generations - b[1] for server, b in zip(servers, before))
+            llm.close()
+            results[name] = result
+    finally:
+        for server in servers:
+            server.close()
+
+    single = results["single_server"]["answers_per_s"]
+    results["speedup_pool_vs_single"] = round(results["pool_least_loaded"]["answers_per_s"] / single, 2) if single else None
+    stub = StubLLM()
+    prompt = "What are the rights of the data subject?"
+    results["stub_deterministic"] = stub.invoke(prompt) == stub.invoke(prompt) == StubLLM().invoke(prompt)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# benchmarks/bench_prompt_cache.py
+"""
+Prompt prefix reuse: how much of each prompt a backend with a KV cache can skip evaluating.
+
+1. Prompt layout (no model needed): builds the prompts of a mixed workload, an intent classification
+   and a RAG answer for every retrieval query, and reports per prompt kind the tokens of the fixed
+   prefix, the prompt tokens evaluated per request with and without prefix reuse, and the old
+   classifier prompt (built per call with indented lines) next to the current one.
+2. With --backend ollama or llamacpp: sends that workload to the model twice, once as is and once
+   with a unique line in front of every prompt (so no prefix can be reused), and reports the
+   prompt-evaluation time per request of both. The backends are configured as usual
+   (ALEKS_OLLAMA_URLS, ALEKS_LLAMACPP_MODEL_PATH...).
+
+RAG contexts come from the database given with --db-dir; without it, each question gets a stand-in
+context of ALEKS_CONTEXT_TOKEN_BUDGET tokens.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_prompt_cache
+    python -m benchmarks.bench_prompt_cache --backend ollama --db-dir ./chroma_db
+"""
+import argparse
+import json
+import os
+import uuid
+
+import aleks_core
+from context_builder import CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN, GenerationStatsHandler, build_context, estimate_tokens
+from document_manager import DOCUMENT_TEMPLATES
+from benchmarks.common import DATA_DIR, load_jsonl
+
+# The classifier prompt as it was built before: per call, with every line indented.
+OLD_INTENT_TEMPLATE = """You are an AI assistant. Analyze the user's query to determine if they are asking for a legal document template.
+        If they are, identify which specific document they are asking for from the following types: {template_names}.
+        If you identify a document, respond ONLY with the document type (e.g., "nda", "non-disclosure agreement").
+        If the query is NOT a document request, respond ONLY with "NONE".
+
+        Examples:
+        User: I need an NDA.
+        Response: nda
+
+        User: Can you help me draft a non-disclosure agreement?
+        Response: non-disclosure agreement
+
+        User: What are the tax requirements for a new business?
+        Response: NONE
+
+        User: Draft a simple contract.
+        Response: NONE
+
+        Query: {query}
+        Response:"""
+
+STAND_IN_SENTENCE = "Section {n}. The personal information controller shall implement reasonable and appropriate measures. "
+
+
+def stand_in_context(n):
+    sentence = STAND_IN_SENTENCE.format(n=n)
+    return sentence * max(1, int(CONTEXT_TOKEN_BUDGET * CHARS_PER_TOKEN / len(sentence)))
+
+
+def build_workload(queries, db_dir=None):
+    """[(kind, prompt)] alternating intent classification and RAG answer, as the chat endpoint sends them."""
+    retriever = None
+    if db_dir:
+        embeddings = aleks_core.load_embeddings()
+        aleks_core.CHROMA_DB_DIR = db_dir
+        retriever = aleks_core.build_retriever(aleks_core.open_vector_store(embeddings))
+    workload = []
+    for n, query in enumerate(queries):
+        context = build_context(query, retriever.invoke(query))["text"] if retriever else stand_in_context(n)
+        workload.append(("intent", aleks_core.INTENT_PROMPT.format(query=query)))
+        workload.append(("rag", aleks_core.RAG_PROMPT.format(context=context, question=query)))
+    return workload
+
+
+def common_prefix_length(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def layout_report(workload, queries):
+    report = {}
+    for kind, prefix in (("intent", aleks_core.INTENT_PROMPT_PREFIX), ("rag", aleks_core.RAG_INSTRUCTIONS)):
+        prompts = [prompt for prompt_kind, prompt in workload if prompt_kind == kind]
+        shared = min(common_prefix_length(prompts[0], prompt) for prompt in prompts[1:]) if len(prompts) > 1 else len(prompts[0])
+        total = sum(estimate_tokens(prompt) for prompt in prompts) / len(prompts)
+        prefix_tokens = estimate_tokens(prefix)
+        report[kind] = {
+            "prompts": len(prompts),
+            "all_start_with_fixed_prefix": all(prompt.startswith(prefix) for prompt in prompts),
+            "shared_prefix_chars": shared,
+            "fixed_prefix_tokens": prefix_tokens,
+            "mean_prompt_tokens": round(total, 1),
+            "mean_tokens_evaluated_with_reuse": round(total - prefix_tokens, 1),
+            "reusable_share": round(prefix_tokens / total, 3),
+        }
+    template_names = ", ".join(DOCUMENT_TEMPLATES.keys())
+    old = [OLD_INTENT_TEMPLATE.format(template_names=template_names, query=query) for query in queries]
+    new = [aleks_core.INTENT_PROMPT.format(query=query) for query in queries]
+    report["intent_old_vs_new"] = {
+        "old_mean_prompt_tokens": round(sum(map(estimate_tokens, old)) / len(old), 1),
+        "new_mean_prompt_tokens": round(sum(map(estimate_tokens, new)) / len(new), 1),
+        "old_options": "llm.temperature mutated on the shared instance, no length limit",
+        "new_options": {"temperature": aleks_core.INTENT_LLM_TEMPERATURE, "max_tokens": aleks_core.INTENT_LLM_MAX_TOKENS},
+    }
+    return report
+
+
+def run_backend(llm, workload, max_tokens, bust_prefix):
+    per_kind = {}
+    for kind, prompt in workload:
+        if bust_prefix:
+            prompt = f"[{uuid.uuid4().hex}]\n{prompt}"
+        stats = GenerationStatsHandler()
+        llm.invoke(prompt, max_tokens=max_tokens, config={"callbacks": [stats]})
+        per_kind.setdefault(kind, []).append(stats.stats())
+    result = {}
+    for kind, rows in per_kind.items():
+        rows = [row for row in rows if row]
+        if not rows:
+            continue
+        result[kind] = {
+            "requests": len(rows),
+            "mean_prompt_tokens": round(sum(row["prompt_tokens"] for row in rows) / len(rows), 1),
+            "mean_prompt_eval_ms": round(sum(row["prompt_eval_ms"] for row in rows) / len(rows), 1),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(DATA_DIR, "retrieval_queries.jsonl"))
+    parser.add_argument("--db-dir", default=None, help="Database to retrieve real RAG contexts from (default: stand-in contexts).")
+    parser.add_argument("--backend", choices=["none", "ollama", "llamacpp"], default="none")
+    parser.add_argument("--requests", type=int, default=12, help="Questions sent to the backend per run (x2 prompts).")
+    parser.add_argument("--max-tokens", type=int, default=8, help="Tokens generated per request; only prompt evaluation is compared.")
+    args = parser.parse_args()
+
+    queries = [item["query"] for item in load_jsonl(args.queries)]
+    workload = build_workload(queries, args.db_dir)
+    results = {"layout": layout_report(workload, queries)}
+
+    if args.backend != "none":
+        from llm_backends import create_llm
+
+        llm = create_llm(args.backend)
+        llm.warm()
+        sample = workload[:2 * args.requests]
+        # Busted first, so the stable run cannot profit from prefixes the other run left in the cache
+        busted = run_backend(llm, sample, args.max_tokens, bust_prefix=True)
+        stable = run_backend(llm, sample, args.max_tokens, bust_prefix=False)
+        results["backend"] = {"backend": args.backend, "without_prefix_reuse": busted, "with_prefix_reuse": stable}
+        for kind in stable:
+            if kind in busted and busted[kind]["mean_prompt_eval_ms"]:
+                results["backend"][f"{kind}_prompt_eval_reduction"] = round(
+                    1 - stable[kind]["mean_prompt_eval_ms"] / busted[kind]["mean_prompt_eval_ms"], 3)
+        llm.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
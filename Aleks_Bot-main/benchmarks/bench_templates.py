@@ -0,0 +1,129 @@
+# benchmarks/bench_templates.py
+"""
+Compares the old document-generation path (open the template file, scan it for placeholders,
+then one re.sub per placeholder) with the compiled template registry, for placeholder lookups,
+single renders and a batch of filled documents (e.g. 500 NDAs from a CSV).
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.bench_templates
+    python -m benchmarks.bench_templates --rows 500 --scale 20   # template text repeated 20x
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import datetime
+
+from document_manager import DOCUMENT_TEMPLATES, PLACEHOLDER_DESCRIPTIONS, TEMPLATE_DIR
+from template_engine import TemplateRegistry
+from benchmarks.common import percentile
+
+
+def legacy_placeholders(template_path):
+    """The per-request placeholder scan /api/chat did before the registry."""
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template_content = f.read()
+    placeholders = set(re.findall(r'\[(.*?)\]|\{\{(.*?)\}\}', template_content))
+    placeholders = {p.strip() for tup in placeholders for p in tup if p.strip()}
+    placeholders.discard('current_date')
+    return [{"name": p, "description": PLACEHOLDER_DESCRIPTIONS.get(p, p.replace('_', ' ').title())}
+            for p in sorted(placeholders)]
+
+
+def legacy_render(template_path, filled_data):
+    """The per-request render /api/generate_document did before the registry."""
+    with open(template_path, 'r', encoding='utf-8') as f:
+        template_content = f.read()
+    filled_data = dict(filled_data)
+    if 'current_date' in template_content:
+        filled_data['current_date'] = datetime.now().strftime("%B %d, %Y")
+    filled_document = template_content
+    for placeholder, value in filled_data.items():
+        filled_document = re.sub(rf"\[{re.escape(placeholder)}\]|" + r"\{\{" + re.escape(placeholder) + r"\}\}",
+                                 str(value), filled_document)
+    return filled_document
+
+
+def make_rows(names, count):
+    return [{name: f"{name.lower()} value {i}" for name in names} for i in range(count)]
+
+
+def time_calls(fn, repeats):
+    """Per-call latency in microseconds (the compiled path is too fast for millisecond resolution)."""
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1e6)
+    return {
+        "mean_us": round(sum(latencies) / len(latencies), 1),
+        "p50_us": round(percentile(latencies, 50), 1),
+        "p95_us": round(percentile(latencies, 95), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--template", default="nda", choices=sorted(DOCUMENT_TEMPLATES))
+    parser.add_argument("--rows", type=int, default=500, help="Documents in the batch run.")
+    parser.add_argument("--repeats", type=int, default=200, help="Calls timed for the per-request runs.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Repeat the template text this many times, to see how each path grows with size.")
+    args = parser.parse_args()
+
+    # Work on a copy so --scale never touches the real template
+    work_dir = tempfile.mkdtemp(prefix="aleks_templates_")
+    try:
+        filename = DOCUMENT_TEMPLATES[args.template]
+        with open(os.path.join(TEMPLATE_DIR, filename), 'r', encoding='utf-8') as f:
+            text = f.read()
+        template_path = os.path.join(work_dir, filename)
+        with open(template_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join([text] * args.scale))
+
+        registry = TemplateRegistry(template_dir=work_dir, templates={args.template: filename})
+        compiled = registry.get(args.template)
+        names = [p["name"] for p in compiled.placeholders]
+        rows = make_rows(names, args.rows)
+        assert legacy_placeholders(template_path) == registry.placeholders(args.template)
+        assert legacy_render(template_path, rows[0]) == registry.render(args.template, rows[0])
+
+        results = {
+            "template": args.template,
+            "template_chars": len(text) * args.scale,
+            "placeholder_slots": len(compiled.slots),
+            "placeholders": {
+                "legacy": time_calls(lambda: legacy_placeholders(template_path), args.repeats),
+                "registry": time_calls(lambda: registry.placeholders(args.template), args.repeats),
+            },
+            "render": {
+                "legacy": time_calls(lambda: legacy_render(template_path, rows[0]), args.repeats),
+                "registry": time_calls(lambda: registry.render(args.template, rows[0]), args.repeats),
+            },
+        }
+
+        started = time.perf_counter()
+        for row in rows:
+            legacy_render(template_path, row)
+        legacy_batch_s = time.perf_counter() - started
+        started = time.perf_counter()
+        registry.render_batch(args.template, rows)
+        registry_batch_s = time.perf_counter() - started
+        results["batch"] = {
+            "rows": args.rows,
+            "legacy_s": round(legacy_batch_s, 4),
+            "registry_s": round(registry_batch_s, 4),
+            "speedup": round(legacy_batch_s / registry_batch_s, 1) if registry_batch_s else None,
+            "registry_docs_per_s": round(args.rows / registry_batch_s) if registry_batch_s else None,
+        }
+        results["template_loads"] = registry.loads
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# benchmarks/bench_workers.py
+"""
+Multi-worker serving: memory and throughput as the number of uvicorn workers grows, with each
+worker loading its own embedding model and index (per-worker) vs all workers sharing one retrieval
+service (shared: python retrieval_service.py --workers N).
+
+For every mode and worker count the API is started as a real server on --port, with a stub LLM
+sleeping --llm-ms per answer and the answer cache off. Once /readyz answers 200 on every worker, the
+benchmark reports:
+- startup_s: from launch until every worker is ready;
+- memory: RSS and PSS (proportional set size: shared pages split between the processes sharing them,
+  so the total is what the host actually spends) of the whole process tree, and the mean RSS per worker;
+- load: /api/chat requests per second and latency with --concurrency clients. Every request has a
+  unique suffix, so no worker can answer it from its query embedding cache.
+
+Run from the Aleks_Bot-main directory (builds a throwaway index from legal_data_pdfs unless --db-dir
+points at an existing one):
+    python -m benchmarks.bench_workers
+    python -m benchmarks.bench_workers --db-dir ./chroma_db --workers 1,2,4,8 --requests 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import psutil
+
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch(mode, workers, port, db_dir, llm_ms, socket_path):
+    env = dict(os.environ, ALEKS_LLM_BACKEND="stub", ALEKS_STUB_LLM_MS=str(llm_ms), ALEKS_ANSWER_CACHE="false",
+               ALEKS_CHROMA_DB_DIR=db_dir, ALEKS_TRACE_SAMPLE_RATE="0")
+    env.pop("ALEKS_RETRIEVAL_SERVICE", None)
+    if mode == "shared":
+        command = [sys.executable, "retrieval_service.py", "--address", socket_path, "--workers", str(workers),
+                   "--host", "127.0.0.1", "--port", str(port)]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "aleks_api:app", "--workers", str(workers),
+                   "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(process, url, workers, timeout):
+    """Requests are spread over the workers, so ready means 200 several times in a row."""
+    deadline = time.monotonic() + timeout
+    in_a_row = 0
+    while in_a_row < 4 * workers:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode} before it was ready.")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Not every worker was ready after {timeout:.0f}s.")
+        try:
+            in_a_row = in_a_row + 1 if httpx.get(url + "/readyz", timeout=5).status_code == 200 else 0
+        except httpx.HTTPError:
+            in_a_row = 0
+        if not in_a_row:
+            time.sleep(0.25)
+
+
+def memory(process):
+    """RSS and PSS in MB of the server and all its children (PSS where the OS reports it)."""
+    root = psutil.Process(process.pid)
+    processes = [root] + root.children(recursive=True)
+    rss, pss, worker_rss = 0, 0, []
+    for proc in processes:
+        try:
+            info = proc.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rss += info.rss
+        pss += getattr(info, "pss", 0)
+        if proc.pid != root.pid and "resource_tracker" not in " ".join(proc.cmdline()):
+            worker_rss.append(info.rss)
+    mb = 1024 * 1024
+    return {
+        "processes": len(processes),
+        "total_rss_mb": round(rss / mb, 1),
+        "total_pss_mb": round(pss / mb, 1) if pss else None,
+        "main_process_rss_mb": round(root.memory_info().rss / mb, 1),
+        "mean_worker_rss_mb": round(sum(worker_rss) / len(worker_rss) / mb, 1) if worker_rss else None,
+    }
+
+
+async def load(url, queries, requests, concurrency):
+    latencies, errors = [], 0
+    pending = iter(range(requests))
+
+    async def client_loop(client):
+        nonlocal errors
+        for n in pending:
+            message = f"{queries[n % len(queries)]} (request {n})"
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/chat", json={"message": message})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"requests": requests, "errors": errors, "elapsed_s": round(elapsed, 2),
+            "requests_per_s": round(len(latencies) / elapsed, 2), "latency": summarize_latencies(latencies)}
+
+
+def run(mode, workers, args, db_dir, queries, socket_path):
+    url = f"http://127.0.0.1:{args.port}"
+    started = time.perf_counter()
+    process = launch(mode, workers, args.port, db_dir, args.llm_ms, socket_path)
+    try:
+        wait_ready(process, url, workers, args.startup_timeout)
+        result = {"mode": mode, "workers": workers, "startup_s": round(time.perf_counter() - started, 1)}
+        asyncio.run(load(url, queries, min(args.requests, 2 * args.concurrency), args.concurrency))  # warm-up
+        result["load"] = asyncio.run(load(url, queries, args.requests, args.concurrency))
+        result["memory"] = memory(process)  # after the load, so every worker's buffers are allocated
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(DATA_DIR, "retrieval_queries.jsonl"))
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default=None, help="Existing database to serve (default: build a temporary one).")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts.")
+    parser.add_argument("--modes", default="per-worker,shared", help="Comma-separated: per-worker, shared.")
+    parser.add_argument("--requests", type=int, default=200, help="/api/chat requests per run.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients.")
+    parser.add_argument("--llm-ms", type=float, default=20, help="Stub LLM time per answer.")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--startup-timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    queries = [item["query"] for item in load_jsonl(args.queries)]
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    modes = [mode.strip() for mode in args.modes.split(",")]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_dir = os.path.abspath(args.db_dir) if args.db_dir else os.path.join(tmp_dir, "chroma_db")
+        if args.db_dir is None:
+            from vector_db_creator import sync_vector_db
+            sync_vector_db(args.pdf_dir, db_dir)
+        socket_path = os.path.join(tmp_dir, "retrieval.sock")
+        runs = [run(mode, workers, args, db_dir, queries, socket_path) for mode in modes for workers in worker_counts]
+
+    results = {"config": {"workers": worker_counts, "requests": args.requests, "concurrency": args.concurrency,
+                          "llm_ms": args.llm_ms, "cpus": os.cpu_count()},
+               "runs": runs}
+    for mode in modes:
+        mode_runs = [r for r in runs if r["mode"] == mode]
+        if len(mode_runs) > 1:
+            first, last = mode_runs[0], mode_runs[-1]
+            results[f"{mode}_rss_mb_per_added_worker"] = round(
+                (last["memory"]["total_rss_mb"] - first["memory"]["total_rss_mb"]) / (last["workers"] - first["workers"]), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# benchmarks/common.py
+import json
+import os
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+
+def load_jsonl(path):
+    """Loads a JSON Lines file into a list of dicts, skipping blank lines."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(latencies_ms):
+    """Returns count, mean and p50/p95/p99 for a list of latencies in milliseconds."""
+    if not latencies_ms:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2),
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+    }
+
+
+def synthetic_text(text, copy):
+    """Copy number `copy` of a chunk's text (0 = the original), unique so no cache can serve it."""
+    return text if copy == 0 else f"{text} [synthetic copy {copy}]"
+
+
+def synthetic_corpus(ids, texts, metadatas, vectors, size, batch_size=4000, noise=0.05, seed=0):
+    """
+    Yields (ids, texts, metadatas, vectors) batches of a corpus of `size` chunks made by repeating the
+    given ones. Copies get a unique text suffix and their original's vector plus Gaussian noise of about
+    `noise` times its norm, so they are near their original without being duplicates of it.
+    """
+    import numpy as np
+
+    base = np.asarray(vectors, dtype=np.float32)
+    scale = noise * np.linalg.norm(base, axis=1, keepdims=True) / np.sqrt(base.shape[1])
+    rng = np.random.default_rng(seed)
+    for start in range(0, size, batch_size):
+        positions = np.arange(start, min(size, start + batch_size))
+        copies, rows = np.divmod(positions, len(ids))
+        batch_vectors = base[rows] + (copies > 0)[:, None] * scale[rows] * rng.standard_normal((len(rows), base.shape[1]), dtype=np.float32)
+        yield ([ids[i] if copy == 0 else f"{ids[i]}-copy{copy}" for copy, i in zip(copies, rows)],
+               [synthetic_text(texts[i], copy) for copy, i in zip(copies, rows)],
+               [metadatas[i] for i in rows],
+               batch_vectors)
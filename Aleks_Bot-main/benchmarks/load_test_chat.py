@@ -0,0 +1,97 @@
+# benchmarks/load_test_chat.py
+"""
+Load test for /api/chat using a local stub LLM (no Ollama, Chroma or embedding model needed).
+
+The stub blocks its worker thread for --llm-ms per RAG answer, like a real generation would.
+A share of the traffic are document requests, which never touch the LLM: their latency shows
+whether slow generations still stall the event loop.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.load_test_chat --clients 64 --requests 4 --llm-ms 500
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+
+import aleks_api
+import aleks_core
+from intent_router import IntentRouter
+from llm_scheduler import LLMScheduler
+from benchmarks.common import summarize_latencies
+
+RAG_QUERY = "What is the 13th month pay rule?"
+DOCUMENT_QUERY = "I need an NDA."
+
+
+def install_stub_llm(llm_ms):
+    """Points the API at keyword-only routing and a sleeping stub in place of the RAG chain."""
+    aleks_core.intent_router = IntentRouter(embeddings=None, llm_classifier=None)
+
+    def stub_rag_response(query, session_id=None):
+        time.sleep(llm_ms / 1000)
+        return {"answer": f"Stub answer to: {query}", "sources": [], "session_id": session_id or "stub"}
+
+    aleks_api.get_rag_response = stub_rag_response
+
+
+async def client_loop(client, n_requests, document_every, results):
+    for i in range(n_requests):
+        is_document = document_every and i % document_every == 0
+        started = time.perf_counter()
+        response = await client.post("/api/chat", json={"message": DOCUMENT_QUERY if is_document else RAG_QUERY})
+        results.append({
+            "kind": "document" if is_document else "rag",
+            "status": response.status_code,
+            "latency_ms": (time.perf_counter() - started) * 1000,
+        })
+
+
+async def run(args):
+    install_stub_llm(args.llm_ms)
+    aleks_api.llm_scheduler = LLMScheduler(
+        max_in_flight=args.max_in_flight, max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout, request_timeout=args.request_timeout,
+    )
+
+    results = []
+    transport = httpx.ASGITransport(app=aleks_api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            client_loop(client, args.requests, args.document_every, results) for _ in range(args.clients)
+        ))
+        elapsed = time.perf_counter() - started
+
+    ok = [r for r in results if r["status"] == 200]
+    report = {
+        "clients": args.clients,
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 2),
+        "status_codes": dict(Counter(r["status"] for r in results)),
+        "rag_latency": summarize_latencies([r["latency_ms"] for r in ok if r["kind"] == "rag"]),
+        "document_latency": summarize_latencies([r["latency_ms"] for r in ok if r["kind"] == "document"]),
+        "scheduler": aleks_api.llm_scheduler.stats(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client.")
+    parser.add_argument("--llm-ms", type=float, default=500, help="Stub generation time per RAG answer.")
+    parser.add_argument("--document-every", type=int, default=4, help="Every Nth request is a document request (0 = none).")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--queue-timeout", type=float, default=30)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
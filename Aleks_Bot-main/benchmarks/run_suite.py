@@ -0,0 +1,389 @@
+# benchmarks/run_suite.py
+"""
+End-to-end benchmark and regression suite for the RAG pipeline. Runs offline: the LLM is the stub
+backend, everything else (embedding model, Chroma, BM25, the API) is the real thing.
+
+Sections, each run in a fresh process so its peak RSS is its own:
+
+  ingestion  sync_vector_db over --pdf-dir into an empty database with the embedding cache off
+             (pages/s, chunks/s, embeddings/s), then the same chunks replicated --ingest-scale
+             times as a synthetic corpus (embed, upsert into Chroma and BM25).
+  retrieval  Synthetic corpora of --sizes chunks built from the real chunks (unique text suffix,
+             real embedding plus a little noise, see common.synthetic_corpus), queried with the labelled retrieval queries:
+             p50/p95/p99 of the hybrid retriever, its keyword stage alone (citation lookup, law
+             names and BM25) and vector search alone.
+  chat       POST /api/chat through the ASGI app with the real retriever and a stub LLM sleeping
+             --llm-ms per answer, at each --concurrency level: answers/s and p50/p95/p99.
+
+Results are written to --output as JSON and compared with --baseline: every *_per_s metric that
+drops, or *_ms / *_mb metric that grows, by more than --tolerance is a regression and the suite
+exits with status 1. Record a baseline on the reference machine with --update-baseline.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.run_suite --quick
+    python -m benchmarks.run_suite --sections retrieval --sizes 10000,100000,1000000
+    python -m benchmarks.run_suite --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies, synthetic_corpus, synthetic_text
+
+SECTIONS = ("ingestion", "retrieval", "chat")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Changes smaller than these are noise whatever the relative change (a 0.4 ms BM25 lookup going to 0.6 ms).
+ABSOLUTE_FLOORS = {"_ms": 2.0, "_mb": 25.0, "_per_s": 0.0}
+# Chroma rejects larger add() calls.
+CHROMA_ADD_BATCH = 4000
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / 2**20, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _ensure_db(pdf_dir, db_dir):
+    """The database the retrieval and chat sections start from, ingested once per suite run."""
+    from vector_db_creator import load_manifest, sync_vector_db
+    if load_manifest(db_dir) is None:
+        sync_vector_db(pdf_dir, db_dir)
+
+
+def _load_chunks(db_dir):
+    from langchain_chroma import Chroma
+    data = Chroma(persist_directory=db_dir).get(include=["documents", "metadatas", "embeddings"])
+    return data["ids"], data["documents"], data["metadatas"], data["embeddings"]
+
+
+# --- Sections (run inside a worker process) ---
+
+def run_ingestion(args):
+    import chromadb
+    from bm25_index import BM25Index
+    from embedding_service import EmbeddingService
+    from vector_db_creator import sync_vector_db
+
+    result = {}
+    with tempfile.TemporaryDirectory() as db_dir:
+        report = sync_vector_db(args.pdf_dir, db_dir, full_rebuild=True)
+        pages = sum(stats["pages"] for stats in report["files"].values())
+        embed_seconds = sum(stats["embed_seconds"] for stats in report["files"].values())
+        result["pdfs"] = {
+            "files": len(report["files"]),
+            "pages": pages,
+            "chunks": report["chunks_added"],
+            "elapsed_s": report["elapsed_s"],
+            "pages_per_s": round(pages / report["elapsed_s"], 2),
+            "chunks_per_s": round(report["chunks_added"] / report["elapsed_s"], 2),
+            "embed_per_s": round(report["chunks_added"] / embed_seconds, 2) if embed_seconds else None,
+        }
+        _, texts, metadatas, _ = _load_chunks(db_dir)
+
+    if args.ingest_scale > 0 and texts:
+        # Every copy has a unique suffix, so nothing is served from a cache
+        synthetic = [(f"synthetic-{copy}-{i}", synthetic_text(text, copy + 1), metadata)
+                     for copy in range(args.ingest_scale) for i, (text, metadata) in enumerate(zip(texts, metadatas))]
+        embeddings = EmbeddingService(cache_path="")
+        with tempfile.TemporaryDirectory() as db_dir:
+            collection = chromadb.PersistentClient(path=db_dir).get_or_create_collection("langchain")
+            bm25 = BM25Index()
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents([text for _, text, _ in synthetic])
+            embedded = time.perf_counter()
+            for i in range(0, len(synthetic), CHROMA_ADD_BATCH):
+                batch = synthetic[i:i + CHROMA_ADD_BATCH]
+                collection.add(ids=[chunk_id for chunk_id, _, _ in batch], documents=[text for _, text, _ in batch],
+                               metadatas=[metadata for _, _, metadata in batch], embeddings=vectors[i:i + CHROMA_ADD_BATCH])
+            for chunk_id, text, metadata in synthetic:
+                bm25.add(chunk_id, text, metadata)
+            bm25.save(db_dir)
+            finished = time.perf_counter()
+        result["synthetic"] = {
+            "scale": args.ingest_scale,
+            "chunks": len(synthetic),
+            "elapsed_s": round(finished - started, 2),
+            "chunks_per_s": round(len(synthetic) / (finished - started), 2),
+            "embed_per_s": round(len(synthetic) / (embedded - started), 2),
+            "index_per_s": round(len(synthetic) / (finished - embedded), 2),
+        }
+    return result
+
+
+def _time_queries(search, queries, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return summarize_latencies(latencies)
+
+
+def run_retrieval(args):
+    import chromadb
+    from bm25_index import BM25Index
+    from embedding_service import EmbeddingService
+    from corpus_fingerprint import write_corpus_fingerprint
+    from hybrid_retriever import HybridRetriever
+    from vector_index import VECTOR_INDEX, build_quantized_index, create_store, open_store
+
+    _ensure_db(args.pdf_dir, args.db_dir)
+    ids, texts, metadatas, vectors = _load_chunks(args.db_dir)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        started = time.perf_counter()
+        collection = chromadb.PersistentClient(path=db_dir).get_or_create_collection("langchain")
+        bm25 = BM25Index()
+        for batch_ids, batch_texts, batch_metadatas, batch_vectors in synthetic_corpus(ids, texts, metadatas, vectors, args.size, CHROMA_ADD_BATCH):
+            collection.add(ids=batch_ids, documents=batch_texts, metadatas=batch_metadatas, embeddings=batch_vectors)
+            for chunk_id, text, metadata in zip(batch_ids, batch_texts, batch_metadatas):
+                bm25.add(chunk_id, text, metadata)
+        # Built here as vector_db_creator.py would, since open_store() only loads the quantized index
+        write_corpus_fingerprint(db_dir, {"synthetic": str(args.size)})
+        if VECTOR_INDEX in ("flat", "ivf"):
+            build_quantized_index(create_store(db_dir, sharding="none"), db_dir, VECTOR_INDEX)
+        build_seconds = time.perf_counter() - started
+
+        embeddings = EmbeddingService()
+        # The synthetic corpus is one collection; ALEKS_VECTOR_INDEX still picks how it is searched
+        vectorstore = open_store(db_dir, embeddings, sharding="none")
+        retriever = HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=args.k)
+        queries = [item["query"] for item in load_jsonl(args.queries)]
+        query_vectors = {query: embeddings.embed_query(query) for query in queries}
+        # One pass to load the HNSW index and warm the query embedding cache
+        for query in queries:
+            retriever.invoke(query)
+
+        return {
+            "chunks": args.size,
+            "build_s": round(build_seconds, 2),
+            "hybrid": _time_queries(retriever.invoke, queries, args.repeat),
+            "bm25": _time_queries(retriever._keyword_hits, queries, args.repeat),
+            "vector": _time_queries(lambda query: vectorstore.similarity_search_by_vector(query_vectors[query], k=retriever.candidates),
+                                    queries, args.repeat),
+        }
+
+
+async def _chat_load(app, queries, concurrency, total):
+    import httpx
+
+    latencies, statuses = [], []
+    pending = iter(range(total))
+
+    async def client_loop(client):
+        for n in pending:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": queries[n % len(queries)]})
+            statuses.append(response.status_code)
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://suite", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": total,
+        "errors": sum(status != 200 for status in statuses),
+        "answers_per_s": round(len(latencies) / elapsed, 2),
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def run_chat(args):
+    import aleks_api
+    import aleks_core
+    from llm_backends import StubLLM
+
+    _ensure_db(args.pdf_dir, args.db_dir)
+    aleks_core.CHROMA_DB_DIR = args.db_dir
+    embeddings = aleks_core.load_embeddings()
+    vectorstore = aleks_core.open_vector_store(embeddings)
+    aleks_core.llm = StubLLM(delay_ms=args.llm_ms)
+    aleks_core.install_retrieval_components(embeddings, aleks_core.build_retriever(vectorstore))
+    # Every request should go through retrieval and generation
+    aleks_core.answer_cache = None
+
+    queries = [item["query"] for item in load_jsonl(args.queries)]
+    asyncio.run(_chat_load(aleks_api.app, queries, 1, len(queries)))  # warm-up
+    return {f"concurrency_{concurrency}": asyncio.run(_chat_load(aleks_api.app, queries, concurrency, args.chat_requests))
+            for concurrency in args.concurrency}
+
+
+# --- Baseline comparison ---
+
+def flatten_metrics(results, prefix=""):
+    """{"chat": {"concurrency_8": {"latency": {"p95_ms": 1}}}} -> {"chat.concurrency_8.latency.p95_ms": 1}, tracked metrics only."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(tuple(ABSOLUTE_FLOORS)):
+            flat[name] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Returns (regressions, improvements) of the metrics present in both runs."""
+    regressions, improvements = [], []
+    for name, value in sorted(current.items()):
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        suffix = next(suffix for suffix in ABSOLUTE_FLOORS if name.endswith(suffix))
+        higher_is_better = suffix == "_per_s"
+        change = (value - previous) / previous
+        worse = -change if higher_is_better else change
+        if abs(value - previous) <= ABSOLUTE_FLOORS[suffix]:
+            continue
+        entry = {"metric": name, "baseline": previous, "current": value, "change_pct": round(change * 100, 1)}
+        if worse > tolerance:
+            regressions.append(entry)
+        elif -worse > tolerance:
+            improvements.append(entry)
+    return regressions, improvements
+
+
+# --- Driver ---
+
+def _run_worker(section, args, db_dir, size=None):
+    """Runs one section in a fresh interpreter and returns its results (with its peak RSS)."""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        output = f.name
+    command = [sys.executable, "-m", "benchmarks.run_suite", "--worker", section, "--worker-output", output,
+               "--db-dir", db_dir, "--pdf-dir", args.pdf_dir, "--queries", args.queries, "--k", str(args.k),
+               "--repeat", str(args.repeat), "--ingest-scale", str(args.ingest_scale), "--llm-ms", str(args.llm_ms),
+               "--chat-requests", str(args.chat_requests), "--concurrency", ",".join(map(str, args.concurrency))]
+    if size is not None:
+        command += ["--size", str(size)]
+    env = dict(os.environ, ALEKS_LLM_BACKEND="stub", ALEKS_TRACE_SAMPLE_RATE="0")
+    if section == "ingestion":
+        env["ALEKS_EMBEDDING_CACHE_PATH"] = ""
+    label = f"{section} ({size} chunks)" if size else section
+    print(f"Running {label}...", file=sys.stderr)
+    started = time.perf_counter()
+    try:
+        # Worker chatter goes to stderr so stdout stays the final JSON
+        completed = subprocess.run(command, env=env, stdout=sys.stderr)
+        if completed.returncode != 0:
+            raise RuntimeError(f"{label} failed with exit code {completed.returncode}")
+        with open(output, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+    finally:
+        os.remove(output)
+    print(f"{label} done in {time.perf_counter() - started:.0f}s", file=sys.stderr)
+    return result
+
+
+def worker_main(args):
+    runners = {"ingestion": run_ingestion, "retrieval": run_retrieval, "chat": run_chat}
+    result = runners[args.worker](args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(args.worker_output, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", default=",".join(SECTIONS), help="Comma-separated subset of: " + ", ".join(SECTIONS))
+    parser.add_argument("--sizes", type=_int_list, default=[10_000, 100_000, 1_000_000], help="Retrieval corpus sizes in chunks.")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="Concurrent /api/chat clients per level.")
+    parser.add_argument("--chat-requests", type=int, default=128, help="Requests per concurrency level.")
+    parser.add_argument("--llm-ms", type=float, default=200, help="Stub generation time per answer.")
+    parser.add_argument("--ingest-scale", type=int, default=4, help="Copies of the real chunks in the synthetic ingestion corpus (0 = skip).")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the retrieval queries per corpus size.")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="Small sizes and request counts, for a smoke run.")
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default=None, help="Existing database for the retrieval and chat sections (default: ingest one).")
+    parser.add_argument("--queries", default=os.path.join(DATA_DIR, "retrieval_queries.jsonl"))
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative change before a metric counts as regressed.")
+    parser.add_argument("--worker", choices=SECTIONS, help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return worker_main(args)
+    if args.quick:
+        args.sizes, args.concurrency = [1_000, 10_000], [1, 8]
+        args.chat_requests, args.ingest_scale, args.repeat, args.llm_ms = 32, 1, 1, 50
+    sections = [section.strip() for section in args.sections.split(",") if section.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {key: getattr(args, key) for key in ("sizes", "concurrency", "chat_requests", "llm_ms", "ingest_scale", "repeat", "k")},
+    }
+    work_dir = tempfile.mkdtemp(prefix="aleks-suite-")
+    db_dir = args.db_dir or os.path.join(work_dir, "db")
+    try:
+        if "ingestion" in sections:
+            results["ingestion"] = _run_worker("ingestion", args, db_dir)
+        if "retrieval" in sections:
+            results["retrieval"] = {f"chunks_{size}": _run_worker("retrieval", args, db_dir, size) for size in args.sizes}
+        if "chat" in sections:
+            results["chat"] = _run_worker("chat", args, db_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    metrics = flatten_metrics({section: results[section] for section in SECTIONS if section in results})
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    if baseline is not None:
+        regressions, improvements = compare(metrics, baseline["metrics"], args.tolerance)
+        if baseline.get("config") != results["config"]:
+            print("Warning: the baseline was recorded with different settings, comparisons may be meaningless.", file=sys.stderr)
+        results["comparison"] = {"baseline": args.baseline, "baseline_created": baseline.get("created"),
+                                 "tolerance": args.tolerance, "regressions": regressions, "improvements": improvements}
+    else:
+        regressions = []
+        results["comparison"] = None
+    results["metrics"] = metrics
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({"created": results["created"], "machine": results["machine"], "config": results["config"],
+                       "metrics": metrics}, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if baseline is None and not args.update_baseline:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to record one.", file=sys.stderr)
+    for entry in regressions:
+        print(f"REGRESSION {entry['metric']}: {entry['baseline']} -> {entry['current']} ({entry['change_pct']:+}%)", file=sys.stderr)
+    if regressions and not args.update_baseline:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# benchmarks/stress_document_store.py
+"""
+Stress test for generated-document storage: many concurrent writers, then a check that every
+acknowledged document can be read back byte-for-byte (no lost or overwritten writes).
+
+Also runs the old scheme (filled_<key>_<YYYYmmdd_HHMMSS>.txt written straight into one directory)
+under the same load to count how many documents it loses to same-second overwrites, and measures
+how long the event loop stalls while requests wait on writes.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.stress_document_store
+    python -m benchmarks.stress_document_store --tasks 64 --documents 50 --backend files
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from document_store import DocumentStore
+from template_engine import template_registry
+
+
+def make_document(base, n):
+    # Unique per document, so an overwrite or a mixed-up body is detected
+    return f"{base}\n\nReference: {n} / {uuid.uuid4().hex}\n"
+
+
+async def legacy_writes(directory, base, tasks, documents):
+    """The old generate_document: a blocking write named after the current second, on the event loop."""
+    async def writer(task):
+        for i in range(documents):
+            filename = f"filled_nda_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+                f.write(make_document(base, task * documents + i))
+            await asyncio.sleep(0)
+    await asyncio.gather(*(writer(task) for task in range(tasks)))
+    return len(os.listdir(directory))
+
+
+async def store_writes(store, base, tasks, documents, batch_every):
+    """Concurrent request handlers awaiting store.save(); every batch_every-th call saves a batch of 10."""
+    expected = {}
+
+    async def writer(task):
+        for i in range(documents):
+            n = task * documents + i
+            if batch_every and i % batch_every == batch_every - 1:
+                texts = [make_document(base, f"{n}.{j}") for j in range(10)]
+                for record, text in zip(await store.save("nda", texts), texts):
+                    expected[record["id"]] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            else:
+                text = make_document(base, n)
+                record = await store.save("nda", text, {"task": task, "n": i})
+                expected[record["id"]] = hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    await asyncio.gather(*(writer(task) for task in range(tasks)))
+    return expected
+
+
+async def measure_loop_lag(work):
+    """Runs work while a ticker measures the worst delay of a 1 ms sleep (how long the loop was blocked)."""
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal worst
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - started - 0.001)
+
+    tick = asyncio.ensure_future(ticker())
+    started = time.perf_counter()
+    result = await work
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return result, elapsed, worst * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=32, help="Concurrent writers.")
+    parser.add_argument("--documents", type=int, default=40, help="Save calls per writer.")
+    parser.add_argument("--batch-every", type=int, default=8, help="Every Nth call saves a batch of 10 (0 = never).")
+    parser.add_argument("--backend", default="sqlite", choices=["sqlite", "files"])
+    args = parser.parse_args()
+
+    base = template_registry.render("nda", {})
+    work_dir = tempfile.mkdtemp(prefix="aleks_documents_")
+    try:
+        legacy_dir = os.path.join(work_dir, "legacy")
+        os.makedirs(legacy_dir)
+        legacy_files, legacy_s, legacy_lag_ms = asyncio.run(
+            measure_loop_lag(legacy_writes(legacy_dir, base, args.tasks, args.documents)))
+        legacy_written = args.tasks * args.documents
+
+        store_dir = os.path.join(work_dir, "store")
+        store = DocumentStore(directory=store_dir, backend=args.backend, retention_days=0, max_documents=0)
+        expected, store_s, store_lag_ms = asyncio.run(
+            measure_loop_lag(store_writes(store, base, args.tasks, args.documents, args.batch_every)))
+        write_stats = store.stats()
+        store.close()
+
+        # Re-open from disk and verify every acknowledged write
+        reopened = DocumentStore(directory=store_dir, backend=args.backend, retention_days=0, max_documents=0)
+        lost = corrupted = 0
+        for document_id, digest in expected.items():
+            record = reopened.get(document_id)
+            if record is None:
+                lost += 1
+            elif hashlib.sha256(record["text"].encode('utf-8')).hexdigest() != digest:
+                corrupted += 1
+        listed, cursor = 0, None
+        while True:
+            page = reopened.list(limit=200, cursor=cursor)
+            listed += len(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        final_stats = reopened.stats()
+        reopened.close()
+
+        results = {
+            "writers": args.tasks,
+            "legacy_timestamped_files": {
+                "documents_written": legacy_written,
+                "files_on_disk": legacy_files,
+                "lost_to_overwrites": legacy_written - legacy_files,
+                "seconds": round(legacy_s, 3),
+                "max_event_loop_stall_ms": round(legacy_lag_ms, 2),
+            },
+            "document_store": {
+                "backend": args.backend,
+                "documents_acknowledged": len(expected),
+                "unique_ids": len(set(expected)),
+                "lost": lost,
+                "corrupted": corrupted,
+                "listed_via_pagination": listed,
+                "seconds": round(store_s, 3),
+                "documents_per_s": round(len(expected) / store_s) if store_s else None,
+                "write_batches": write_stats["batches"],
+                "max_event_loop_stall_ms": round(store_lag_ms, 2),
+                "stored_bytes": final_stats["stored_bytes"],
+                "compression": final_stats["compression"],
+            },
+        }
+        print(json.dumps(results, indent=2))
+        if lost or corrupted or listed != len(expected):
+            raise SystemExit("FAILED: the document store lost or corrupted writes.")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# benchmarks/stress_index_swap.py
+"""
+Stress test for index hot-swaps: /api/chat under steady load while POST /api/admin/index/reload
+swaps retrieval back and forth between two index snapshots, then checks that:
+
+- no request failed;
+- requests running during a swap were not much slower than the rest (p99 within --max-slowdown x);
+- the new law is retrieved once its snapshot is live and not after rolling back;
+- every replaced snapshot was closed once its last retrieval finished.
+
+Snapshot A holds every PDF in --pdf-dir except --new-law, snapshot B holds all of them. The API runs
+in-process with a stub LLM sleeping --llm-ms per answer and the answer cache off. Exits with status 1
+if a check fails.
+
+Run from the Aleks_Bot-main directory:
+    python -m benchmarks.stress_index_swap
+    python -m benchmarks.stress_index_swap --clients 32 --duration 60 --swap-every 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.common import DATA_DIR, load_jsonl, summarize_latencies
+
+ADMIN_TOKEN = "stress-index-swap"
+
+
+def build_snapshots(pdf_dir, new_law, root):
+    """Publishes snapshot A (without new_law) and then B (with it); returns their names."""
+    from vector_db_creator import build_snapshot
+
+    staging = os.path.join(root, "pdfs")
+    os.makedirs(staging)
+    for name in sorted(os.listdir(pdf_dir)):
+        if name.lower().endswith(".pdf") and name != new_law:
+            shutil.copy(os.path.join(pdf_dir, name), staging)
+    old = build_snapshot(staging, root)["snapshot"]["version"]
+    shutil.copy(os.path.join(pdf_dir, new_law), staging)
+    new = build_snapshot(staging, root)["snapshot"]["version"]
+    return old, new
+
+
+async def chat_load(client, queries, clients, duration, requests):
+    async def client_loop(n):
+        i = n
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.post("/api/chat", json={"message": queries[i % len(queries)]})
+            requests.append((started, time.perf_counter(), response.status_code))
+            i += clients
+
+    await asyncio.gather(*(client_loop(n) for n in range(clients)))
+
+
+async def swap_loop(client, versions, swap_every, duration, swaps):
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    deadline = time.perf_counter() + duration - swap_every
+    n = 0
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(swap_every)
+        n += 1
+        started = time.perf_counter()
+        response = await client.post("/api/admin/index/reload", json={"version": versions[n % 2]}, headers=headers)
+        swaps.append({"started": started, "finished": time.perf_counter(), "status": response.status_code,
+                      "result": response.json()})
+
+
+async def law_retrieved(client, version, question, pdf_name):
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    await client.post("/api/admin/index/reload", json={"version": version}, headers=headers)
+    response = await client.post("/api/chat", json={"message": question})
+    return any(source.get("source") == pdf_name for source in response.json().get("sources", []))
+
+
+async def run(app, queries, versions, args):
+    import httpx
+
+    requests, swaps = [], []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stress", timeout=None) as client:
+        await chat_load(client, queries, args.clients, 1.0, [])  # warm-up
+        await asyncio.gather(chat_load(client, queries, args.clients, args.duration, requests),
+                             swap_loop(client, versions, args.swap_every, args.duration, swaps))
+        visible = {
+            "new_law_after_swap": await law_retrieved(client, versions[1], args.probe, args.new_law),
+            "new_law_after_rollback": await law_retrieved(client, versions[0], args.probe, args.new_law),
+        }
+    return requests, swaps, visible
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", default=os.path.join(DATA_DIR, "retrieval_queries.jsonl"))
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--new-law", default="RA 8293 - IP Code.pdf", help="PDF only snapshot B contains.")
+    parser.add_argument("--probe", default="What acts constitute trademark infringement?", help="Question only the new law answers.")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent /api/chat clients.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load.")
+    parser.add_argument("--swap-every", type=float, default=2, help="Seconds between swaps.")
+    parser.add_argument("--llm-ms", type=float, default=20, help="Stub LLM time per answer.")
+    parser.add_argument("--max-slowdown", type=float, default=3.0, help="Highest allowed p99 during swaps / p99 otherwise.")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="aleks-snapshots-")
+    # Read when the modules are imported
+    os.environ["ALEKS_INDEX_SNAPSHOT_ROOT"] = root
+    os.environ["ALEKS_INDEX_SNAPSHOT_WATCH_SECONDS"] = "0"
+    os.environ["ALEKS_ADMIN_TOKEN"] = ADMIN_TOKEN
+    os.environ["ALEKS_ANSWER_CACHE"] = "false"
+    os.environ.setdefault("ALEKS_LLM_MAX_IN_FLIGHT", str(args.clients))
+    import aleks_api
+    import aleks_core
+    from llm_backends import StubLLM
+
+    try:
+        versions = build_snapshots(args.pdf_dir, args.new_law, root)
+        embeddings = aleks_core.load_embeddings()
+        aleks_core.llm = StubLLM(delay_ms=args.llm_ms)
+        aleks_core.install_retrieval_components(embeddings, aleks_core.load_retriever(embeddings, versions[0]))
+        queries = [item["query"] for item in load_jsonl(args.queries)]
+        requests, swaps, visible = asyncio.run(run(aleks_api.app, queries, versions, args))
+        status = aleks_core.index_status()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    during, steady = [], []
+    for started, finished, _ in requests:
+        overlaps = any(started < swap["finished"] and finished > swap["started"] for swap in swaps)
+        (during if overlaps else steady).append((finished - started) * 1000)
+    errors = sum(1 for _, _, code in requests if code != 200)
+    during_summary, steady_summary = summarize_latencies(during), summarize_latencies(steady)
+    slowdown = during_summary["p99_ms"] / steady_summary["p99_ms"] if steady_summary["p99_ms"] else None
+    checks = {
+        "no_errors": errors == 0 and all(swap["status"] == 200 for swap in swaps),
+        "no_latency_cliff": slowdown is not None and slowdown <= args.max_slowdown,
+        "new_law_live_after_swap": visible["new_law_after_swap"],
+        "new_law_gone_after_rollback": not visible["new_law_after_rollback"],
+        "replaced_snapshots_closed": not status["draining"],
+    }
+    results = {
+        "config": {"clients": args.clients, "duration_s": args.duration, "swap_every_s": args.swap_every, "llm_ms": args.llm_ms},
+        "requests": len(requests),
+        "errors": errors,
+        "swaps": len(swaps),
+        "swap_ms": summarize_latencies([swap["result"].get("seconds", 0) * 1000 for swap in swaps if swap["status"] == 200]),
+        "latency_during_swaps": during_summary,
+        "latency_otherwise": steady_summary,
+        "p99_slowdown_during_swaps": round(slowdown, 2) if slowdown is not None else None,
+        "index_status": {key: status[key] for key in ("version", "swaps", "draining")},
+        "checks": checks,
+    }
+    print(json.dumps(results, indent=2))
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# bm25_index.py
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from statute_splitter import RA_NUMBER_PATTERN, law_info
+
+BM25_FILENAME = "bm25_index.json"
+
+# --- BM25 Configuration ---
+# Query terms found in more than this fraction of the chunks ("section", "shall", "employer") only add to
+# the scores of chunks the rarer terms found, instead of scoring most of the index on their own.
+BM25_MAX_DF = float(os.getenv("ALEKS_BM25_MAX_DF", "0.05"))
+# Question words that never decide a statute match; ignored unless a query has nothing else.
+STOPWORDS = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "i", "if",
+    "in", "is", "it", "me", "my", "of", "on", "or", "the", "to", "what", "when", "where", "which", "who",
+    "why", "with",
+))
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+# Provision headings as they appear in the statutes: "ART. 306. [291]", "SEC. 8.", "Sec. 1.", "SECTION 1."
+# The number must be followed by a period, which separates a heading from an in-text mention like
+# "Section 20(f)". Labor Code headings also carry the pre-renumbering article number in brackets.
+HEADING_PATTERN = re.compile(
+    r"\b(ART(?:ICLE)?|SEC(?:TION)?)\.?\s*(\d+[A-Z]?)\s*\.(?!\d)(?:\s*\[\s*(\d+[A-Z]?)\s*\])?",
+    re.IGNORECASE,
+)
+# Provision references in user queries: "Article 291", "Art. 82", "Section 12", "Sec 9A"
+QUERY_CITATION_PATTERN = re.compile(r"\b(art(?:icle)?|sec(?:tion)?)\.?\s*(\d+[a-z]?)\b", re.IGNORECASE)
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _provision_kind(word):
+    return "article" if word.lower().startswith("art") else "section"
+
+
+def heading_citations(text):
+    """Returns the provisions defined (not merely mentioned) in text, e.g. {"article:306", "article:291"}."""
+    found = set()
+    for kind, number, old_number in HEADING_PATTERN.findall(text):
+        found.add(f"{_provision_kind(kind)}:{number.upper()}")
+        if old_number:
+            found.add(f"{_provision_kind(kind)}:{old_number.upper()}")
+    return found
+
+
+def query_citations(query):
+    """Returns the provisions a query refers to, e.g. "What does Article 291 say?" -> {"article:291"}."""
+    return {f"{_provision_kind(kind)}:{number.upper()}" for kind, number in QUERY_CITATION_PATTERN.findall(query)}
+
+
+def chunk_citations(text, metadata):
+    """
+    Provisions a chunk defines. Uses the provision metadata written by the statute splitter when present
+    and falls back to scanning the text for headings (chunks from older databases).
+    """
+    if metadata.get("provision"):
+        kind = metadata.get("provision_type", "section")
+        found = {f"{kind}:{metadata['provision']}"}
+        if metadata.get("provision_alt"):
+            found.add(f"{kind}:{metadata['provision_alt']}")
+        return found
+    return heading_citations(text)
+
+
+def law_aliases(source):
+    """
+    Names a user might use for the law in a source PDF, from its filename:
+    "RA 10173 - Data Privacy Act.pdf" -> {"10173", "data privacy act"}.
+    """
+    name, ra_number = law_info(source)
+    aliases = {ra_number} if ra_number else set()
+    name = re.sub(r"\s+of the philippines$", "", name.lower()).strip()
+    if name and not name.isdigit():
+        aliases.add(name)
+    return aliases
+
+
+class BM25Index:
+    """
+    In-process Okapi BM25 inverted index over the same chunks as the Chroma collection, keyed by chunk ID.
+
+    Also keeps an index from provision headings ("article:291", "section:12") to the chunks that define
+    them, so explicit citations can be answered with a dictionary lookup instead of a similarity search.
+    Chunk text and metadata are stored too, so hits can be returned without a round trip to Chroma.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}  # chunk_id -> {"text", "metadata", "length"}
+        self.postings = defaultdict(dict)  # term -> {chunk_id: term frequency}
+        self.citations = defaultdict(set)  # "article:291" -> {chunk_id}
+        self.source_chunks = Counter()  # source PDF -> number of chunks
+        self.source_aliases = {}  # source PDF -> law_aliases(source)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def ids(self):
+        return set(self.docs)
+
+    def add(self, chunk_id, text, metadata=None):
+        if chunk_id in self.docs:
+            self.remove(chunk_id)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self.docs[chunk_id] = {"text": text, "metadata": dict(metadata or {}), "length": length}
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings[term][chunk_id] = frequency
+        for citation in chunk_citations(text, self.docs[chunk_id]["metadata"]):
+            self.citations[citation].add(chunk_id)
+        source = self.docs[chunk_id]["metadata"].get("source")
+        if source:
+            if source not in self.source_aliases:
+                self.source_aliases[source] = law_aliases(source)
+            self.source_chunks[source] += 1
+
+    def remove(self, chunk_id):
+        doc = self.docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        self.total_length -= doc["length"]
+        for term in set(tokenize(doc["text"])):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        for citation in chunk_citations(doc["text"], doc["metadata"]):
+            self.citations[citation].discard(chunk_id)
+            if not self.citations[citation]:
+                del self.citations[citation]
+        source = doc["metadata"].get("source")
+        if source:
+            self.source_chunks[source] -= 1
+            if self.source_chunks[source] <= 0:
+                del self.source_chunks[source]
+                del self.source_aliases[source]
+
+    def _query_terms(self, query):
+        """The query's terms with postings, rarest first, split into (rare, common) by BM25_MAX_DF."""
+        terms = {term for term in tokenize(query) if term in self.postings}
+        terms = sorted(terms - STOPWORDS or terms, key=lambda term: len(self.postings[term]))
+        max_postings = BM25_MAX_DF * len(self.docs)
+        rare = [term for term in terms if len(self.postings[term]) <= max_postings]
+        # A query of common terms only still needs one term to find its candidates
+        rare = rare or terms[:1]
+        return rare, terms[len(rare):]
+
+    def search(self, query, k=8, sources=None):
+        """
+        Returns up to k (chunk_id, score) pairs, best first. sources optionally restricts the source PDFs.
+        Only the postings of the rare query terms are scanned; common terms are looked up for the chunks
+        those found, so a query costs in proportion to its rare terms, not to the corpus.
+        """
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        average_length = self.total_length / n_docs
+        rare, common = self._query_terms(query)
+
+        def term_score(frequency, chunk_id, idf):
+            length_norm = self.k1 * (1 - self.b + self.b * self.docs[chunk_id]["length"] / average_length)
+            return idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+
+        def idf(postings):
+            return math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+
+        scores = defaultdict(float)
+        for term in rare:
+            postings = self.postings[term]
+            term_idf = idf(postings)
+            for chunk_id, frequency in postings.items():
+                scores[chunk_id] += term_score(frequency, chunk_id, term_idf)
+        if sources:
+            scores = {cid: s for cid, s in scores.items() if self.docs[cid]["metadata"].get("source") in sources}
+        for term in common:
+            postings = self.postings[term]
+            term_idf = idf(postings)
+            for chunk_id in scores:
+                frequency = postings.get(chunk_id)
+                if frequency:
+                    scores[chunk_id] += term_score(frequency, chunk_id, term_idf)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def sources_for_query(self, query):
+        """Source PDFs whose law the query names (by RA number or short title), or None if it names none."""
+        query_lower = query.lower()
+        query_ras = set(RA_NUMBER_PATTERN.findall(query))
+        matched = set()
+        for source, aliases in self.source_aliases.items():
+            for alias in aliases:
+                if (alias.isdigit() and alias in query_ras) or (not alias.isdigit() and alias in query_lower):
+                    matched.add(source)
+        return matched or None
+
+    def lookup_citations(self, query, sources=None):
+        """
+        Chunks defining the provisions cited in the query ("Article 291", "Section 12 of RA 10173"),
+        restricted to the named law when the query names one. sources, if given, is the query's
+        sources_for_query() result, so callers that already have it don't match the law names twice.
+        """
+        cited = query_citations(query)
+        if not cited:
+            return []
+        if sources is None:
+            sources = self.sources_for_query(query)
+        hits = []
+        for citation in sorted(cited):
+            for chunk_id in sorted(self.citations.get(citation, ())):
+                if sources is None or self.docs[chunk_id]["metadata"].get("source") in sources:
+                    hits.append(chunk_id)
+        return hits
+
+    def get(self, chunk_id):
+        return self.docs.get(chunk_id)
+
+    def save(self, directory):
+        path = os.path.join(directory, BM25_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"k1": self.k1, "b": self.b, "docs": {
+                chunk_id: {"text": doc["text"], "metadata": doc["metadata"]} for chunk_id, doc in self.docs.items()
+            }}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory):
+        """Loads the index saved in directory, or returns None if there is none."""
+        path = os.path.join(directory, BM25_FILENAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return None
+        index = cls(k1=payload.get("k1", 1.5), b=payload.get("b", 0.75))
+        for chunk_id, doc in payload["docs"].items():
+            index.add(chunk_id, doc["text"], doc["metadata"])
+        return index
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore, batch_size=1000):
+        """Builds the index from every chunk stored in a Chroma vector store."""
+        index = cls()
+        offset = 0
+        while True:
+            batch = vectorstore.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            for chunk_id, text, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"]):
+                index.add(chunk_id, text, metadata)
+            offset += len(batch["ids"])
+        return index
@@ -0,0 +1,242 @@
+# context_builder.py
+import math
+import os
+import re
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import telemetry
+from statute_splitter import CHUNK_OVERLAP, format_citation, format_pages
+
+# --- Context Configuration ---
+# Upper bound on the (estimated) tokens of retrieved text put into the prompt.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("ALEKS_CONTEXT_TOKEN_BUDGET", "700"))
+# Passages scoring below this fraction of the best passage's relevance are dropped. Only fused search
+# scores are compared; cited provisions and passages from retrievers that don't score are always kept.
+CONTEXT_MIN_RELEVANCE = float(os.getenv("ALEKS_CONTEXT_MIN_RELEVANCE", "0.4"))
+# Passages cut down to fewer tokens than this are left out rather than sent as a fragment.
+MIN_PASSAGE_TOKENS = 48
+# Rough characters per token for the local models on statute text. Only used for budgeting;
+# the real prompt token count reported by Ollama is logged next to it.
+CHARS_PER_TOKEN = 3.5
+
+CONTINUED_SUFFIX = " (continued)"
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.;:])\s+")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or that the this to under what when "
+    "which who why will with".split()
+)
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _passage_key(metadata):
+    """Pieces of the same provision are merged into one passage."""
+    return (metadata.get("source"), metadata.get("provision_type"), metadata.get("provision"))
+
+
+def _strip_continuation_heading(text):
+    first_line, _, rest = text.partition("\n")
+    return rest if first_line.endswith(CONTINUED_SUFFIX) else text
+
+
+def _merge_overlap(left, right):
+    """Appends right to left, dropping the text the splitter repeated at the start of right."""
+    for size in range(min(len(left), len(right), CHUNK_OVERLAP * 2), 0, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}\n{right}"
+
+
+def _relevance(document, rank):
+    relevance = document.metadata.get("relevance")
+    # Retrievers that don't score (plain vector search) keep their order
+    return float(relevance) if relevance is not None else 1.0 / (rank + 1)
+
+
+def _signal(documents):
+    """
+    What a passage's relevance is: "citation" (the query cites the provision; scored 1 + fusion score),
+    "score" (a fusion score, comparable between passages) or "rank" (only the retriever's order).
+    """
+    if any("citation" in document.metadata.get("found_by", "").split("+") for document in documents):
+        return "citation"
+    if any(document.metadata.get("relevance") is not None for document in documents):
+        return "score"
+    return "rank"
+
+
+def _dedupe(documents):
+    """
+    Merges the pieces of one provision into a single passage (removing the overlap between them)
+    and drops repeated lines across passages. Returns passages in descending relevance.
+    """
+    groups = {}
+    for rank, document in enumerate(documents):
+        key = _passage_key(document.metadata)
+        # Unstructured chunks have no provision to group by
+        groups.setdefault(key if key[2] else (key, rank), []).append((rank, document))
+
+    passages = []
+    for pieces in groups.values():
+        pieces.sort(key=lambda piece: piece[1].metadata.get("start_index", piece[0]))
+        text = pieces[0][1].page_content.strip()
+        for _, document in pieces[1:]:
+            text = _merge_overlap(text, _strip_continuation_heading(document.page_content.strip()))
+        passages.append({
+            "text": text,
+            "metadata": pieces[0][1].metadata,
+            "relevance": max(_relevance(document, rank) for rank, document in pieces),
+            "signal": _signal([document for _, document in pieces]),
+            "documents": [document for _, document in pieces],
+        })
+    passages.sort(key=lambda passage: passage["relevance"], reverse=True)
+
+    seen_lines = set()
+    for passage in passages:
+        lines = []
+        for line in passage["text"].split("\n"):
+            normalized = " ".join(line.split()).lower()
+            if len(normalized) > 30 and normalized in seen_lines:
+                continue
+            seen_lines.add(normalized)
+            lines.append(line)
+        passage["text"] = "\n".join(lines)
+    return passages
+
+
+def _compress(text, query_terms, max_tokens):
+    """
+    Cuts a passage down to max_tokens: keeps its first sentence (the provision heading) and then the
+    sentences sharing the most words with the query, in their original order.
+    """
+    sentences = SENTENCE_BOUNDARY.split(text)
+    budget = max_tokens - estimate_tokens(sentences[0])
+    if budget <= 0:
+        return sentences[0][:int(max_tokens * CHARS_PER_TOKEN)]
+    ranked = sorted(
+        range(1, len(sentences)),
+        key=lambda i: (-len(query_terms & set(WORD_PATTERN.findall(sentences[i].lower()))), i),
+    )
+    keep = {0}
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if cost <= budget:
+            keep.add(i)
+            budget -= cost
+    parts, previous = [], -1
+    for i in sorted(keep):
+        if previous >= 0 and i != previous + 1:
+            parts.append("…")
+        parts.append(sentences[i])
+        previous = i
+    return " ".join(parts)
+
+
+def _order(passages):
+    """
+    Best passage first and second-best last: models use the start and end of a long context
+    more reliably than its middle.
+    """
+    if len(passages) < 3:
+        return passages
+    return [passages[0], *passages[2:], passages[1]]
+
+
+def _format_passage(index, passage):
+    pages = format_pages(passage["metadata"])
+    header = f"[{index}] {format_citation(passage['metadata'])}{f' ({pages})' if pages else ''}"
+    return f"{header}\n{passage['text']}"
+
+
+def build_context(query, documents, token_budget=CONTEXT_TOKEN_BUDGET, min_relevance=CONTEXT_MIN_RELEVANCE):
+    """
+    Turns retrieved documents into the context block of the RAG prompt: merges overlapping pieces,
+    drops passages scoring far below the best scored one, fits the rest into token_budget (compressing
+    the last one that doesn't fit) and orders them. Returns {"text", "documents" (the ones actually
+    used), "stats"}.
+    """
+    raw_tokens = estimate_tokens("\n\n".join(document.page_content for document in documents))
+    passages = _dedupe(documents)
+    merged_count = len(passages)
+    best_score = max((passage["relevance"] for passage in passages if passage["signal"] == "score"), default=0)
+    if best_score > 0:
+        floor = best_score * min_relevance
+        passages = [passage for passage in passages if passage["signal"] != "score" or passage["relevance"] >= floor]
+
+    query_terms = set(WORD_PATTERN.findall(query.lower())) - STOPWORDS
+    selected, used_tokens, compressed = [], 0, 0
+    for passage in passages:
+        header_tokens = estimate_tokens(format_citation(passage["metadata"])) + 4
+        remaining = token_budget - used_tokens - header_tokens
+        tokens = estimate_tokens(passage["text"])
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                break
+            passage["text"] = _compress(passage["text"], query_terms, remaining)
+            tokens = estimate_tokens(passage["text"])
+            compressed += 1
+        selected.append(passage)
+        used_tokens += tokens + header_tokens
+
+    ordered = _order(selected)
+    text = "\n\n".join(_format_passage(i + 1, passage) for i, passage in enumerate(ordered))
+    return {
+        "text": text,
+        "documents": [document for passage in ordered for document in passage["documents"]],
+        "stats": {
+            "retrieved": len(documents),
+            "passages": len(selected),
+            "merged": len(documents) - merged_count,
+            "dropped_low_relevance": merged_count - len(passages),
+            "compressed": compressed,
+            "raw_context_tokens": raw_tokens,
+            "context_tokens": estimate_tokens(text),
+        },
+    }
+
+
+class GenerationStatsHandler(BaseCallbackHandler):
+    """
+    Callback that captures Ollama's timing fields (prompt_eval_count/duration, eval_count/duration)
+    from the final streamed chunk. Works for both llm.invoke and llm.stream.
+    """
+
+    def __init__(self):
+        self.generation_info = {}
+
+    def on_llm_end(self, response, **kwargs):
+        if response.generations and response.generations[0]:
+            self.generation_info = response.generations[0][0].generation_info or {}
+
+    def stats(self):
+        info = self.generation_info
+        if "prompt_eval_count" not in info and "eval_count" not in info:
+            return {}
+        prompt_eval_ms = info.get("prompt_eval_duration", 0) / 1e6
+        prompt_tokens = info.get("prompt_eval_count", 0)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "prompt_eval_ms": round(prompt_eval_ms, 1),
+            "completion_tokens": info.get("eval_count", 0),
+            "eval_ms": round(info.get("eval_duration", 0) / 1e6, 1),
+            "prompt_ms_per_token": round(prompt_eval_ms / prompt_tokens, 2) if prompt_tokens else None,
+        }
+
+
+def log_prompt_stats(context_stats, generation_stats):
+    """Prints one line per answered question: context size, what assembly saved, and where Ollama spent its time."""
+    saved_tokens = context_stats["raw_context_tokens"] - context_stats["context_tokens"]
+    line = (f"Context: {context_stats['passages']}/{context_stats['retrieved']} passages, "
+            f"~{context_stats['context_tokens']} tokens (stuffing would send ~{context_stats['raw_context_tokens']})")
+    if context_stats.get("history_tokens"):
+        line += f", history ~{context_stats['history_tokens']} tokens"
+    if generation_stats:
+        line += (f"; prompt {generation_stats['prompt_tokens']} tokens in {generation_stats['prompt_eval_ms']:.0f} ms, "
+                 f"generation {generation_stats['completion_tokens']} tokens in {generation_stats['eval_ms']:.0f} ms")
+        if generation_stats["prompt_ms_per_token"] and saved_tokens > 0:
+            line += f", ~{saved_tokens * generation_stats['prompt_ms_per_token']:.0f} ms of prompt eval saved"
+    telemetry.log(line)
@@ -0,0 +1,332 @@
+# conversation_memory.py
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from context_builder import CHARS_PER_TOKEN, STOPWORDS, WORD_PATTERN, estimate_tokens
+
+# --- Conversation Memory Configuration ---
+CONVERSATION_MAX_SESSIONS = int(os.getenv("ALEKS_CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_MAX_BYTES = int(os.getenv("ALEKS_CONVERSATION_MAX_MB", "16")) * 1024 * 1024
+# Sessions idle for longer than this are forgotten.
+CONVERSATION_TTL_SECONDS = float(os.getenv("ALEKS_CONVERSATION_TTL_SECONDS", str(6 * 3600)))
+# Upper bound on the (estimated) tokens of conversation history put into each prompt.
+CONVERSATION_HISTORY_TOKEN_BUDGET = int(os.getenv("ALEKS_CONVERSATION_HISTORY_TOKEN_BUDGET", "300"))
+# Most recent turns kept verbatim; older ones are folded into the rolling summary.
+CONVERSATION_RECENT_TURNS = int(os.getenv("ALEKS_CONVERSATION_RECENT_TURNS", "2"))
+# How follow-ups are turned into standalone retrieval queries: "keywords" (no LLM call),
+# "llm" (the LLM rewrites follow-ups) or "off".
+CONVERSATION_CONDENSE_MODE = os.getenv("ALEKS_CONVERSATION_CONDENSE_MODE", "keywords").lower()
+# Set to a SQLite file path (e.g. ./conversations.sqlite3) to keep sessions across restarts
+# and beyond the in-memory limits.
+CONVERSATION_DB_PATH = os.getenv("ALEKS_CONVERSATION_DB_PATH", "")
+
+# Summary lines kept per session before the oldest are dropped.
+MAX_SUMMARY_LINES = 24
+# Characters of an answer kept in its summary line.
+SUMMARY_ANSWER_CHARS = 160
+MAX_SESSION_ID_LENGTH = 128
+
+# Messages that lean on the previous turn: "what about the penalties?", "and for employers?", "does it apply...?"
+FOLLOW_UP_START = re.compile(
+    r"^\s*(?:and|also|but|so|then|what about|how about|what if|why|how so|is that|is it|are they|does it|"
+    r"does that|do they|can it|can they|same|ok|okay)\b",
+    re.IGNORECASE,
+)
+ANAPHORA = re.compile(r"\b(?:it|its|these|those|they|them|their|he|she|his|her|former|latter)\b", re.IGNORECASE)
+# A message naming a law of its own starts a new topic
+NAMES_A_LAW = re.compile(r"\b(?:act|code|republic act|r\.?\s?a\.?\s*(?:no\.?\s*)?\d{3,5})\b", re.IGNORECASE)
+FOLLOW_UP_WORDS = frozenset("about also and but explain further more please tell then".split())
+# Expired sessions are purged from SQLite after every this many recorded turns.
+PURGE_EVERY = 500
+# Locks that turns of the same session wait on (sessions share them by hash).
+SESSION_LOCK_STRIPES = 64
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+def _first_sentence(text, limit=SUMMARY_ANSWER_CHARS):
+    text = " ".join(text.split())
+    match = re.search(r"(?<=[.!?])\s", text)
+    sentence = text[:match.start()] if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def _content_terms(text):
+    return [term for term in WORD_PATTERN.findall(text.lower()) if term not in STOPWORDS and len(term) > 2]
+
+
+def _session_bytes(session):
+    return len(json.dumps(session))
+
+
+class ConversationMemory:
+    """
+    Server-side chat sessions for multi-turn RAG.
+
+    Each session keeps its last few turns verbatim and a rolling summary of older turns (one line per
+    turn: the question and the first sentence of the answer), so the history in the prompt stays within
+    a fixed token budget however long the conversation gets. Follow-up questions ("what about the
+    penalties?") are condensed into standalone retrieval queries using the previous turn's law and topic,
+    so retrieval works without the transcript.
+
+    Sessions live in an LRU bounded by count and estimated memory and expire after a TTL. With a SQLite
+    path configured, every turn is also written there, and sessions evicted from memory are reloaded on use.
+    """
+
+    def __init__(self, max_sessions=CONVERSATION_MAX_SESSIONS, max_bytes=CONVERSATION_MAX_BYTES,
+                 ttl_seconds=CONVERSATION_TTL_SECONDS, history_token_budget=CONVERSATION_HISTORY_TOKEN_BUDGET,
+                 recent_turns=CONVERSATION_RECENT_TURNS, condense_mode=CONVERSATION_CONDENSE_MODE,
+                 db_path=CONVERSATION_DB_PATH or None, llm_condenser=None, summarizer=None):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.history_token_budget = history_token_budget
+        self.recent_turns = recent_turns
+        self.condense_mode = condense_mode
+        # llm_condenser(history_text, message) -> standalone question; summarizer(lines) -> summary text
+        self.llm_condenser = llm_condenser
+        self.summarizer = summarizer
+
+        self._lock = threading.Lock()
+        # Serialize the read-modify-write of one session's turns; sessions hash onto a fixed set of locks
+        self._session_locks = [threading.Lock() for _ in range(SESSION_LOCK_STRIPES)]
+        self._sessions = OrderedDict()  # session_id -> {"turns", "summary", "updated_at"}
+        self._bytes = {}  # session_id -> estimated size
+        self._total_bytes = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, updated_at REAL NOT NULL, data TEXT NOT NULL)")
+            self._db.commit()
+
+        self.turns_recorded = 0
+        self.condensed = 0
+        self.evicted = 0
+        self.expired = 0
+        self.loaded_from_disk = 0
+
+    # --- Public API ---
+
+    def prepare(self, session_id, message):
+        """
+        Called before retrieval. Returns {"session_id", "history", "retrieval_query", "condensed",
+        "history_tokens"}. history is the text to put into the prompt ("" on the first turn);
+        retrieval_query is the message, rewritten into a standalone question if it is a follow-up.
+        A missing or unknown session_id starts a new session.
+        """
+        session_id = session_id or new_session_id()
+        session = self._get(session_id)
+        if session is None or not session["turns"]:
+            return {"session_id": session_id, "history": "", "retrieval_query": message,
+                    "condensed": False, "history_tokens": 0}
+
+        history = self._history_text(session)
+        retrieval_query = message
+        if self.condense_mode != "off" and self._is_follow_up(message):
+            if self.condense_mode == "llm" and self.llm_condenser is not None:
+                try:
+                    retrieval_query = self.llm_condenser(history, message).strip() or message
+                except Exception as e:
+                    print(f"Query condensation failed ({e}); using keywords instead.")
+                    retrieval_query = self._condense_with_keywords(session, message)
+            else:
+                retrieval_query = self._condense_with_keywords(session, message)
+        condensed = retrieval_query != message
+        if condensed:
+            self.condensed += 1
+        return {"session_id": session_id, "history": history, "retrieval_query": retrieval_query,
+                "condensed": condensed, "history_tokens": estimate_tokens(history) if history else 0}
+
+    def record_turn(self, session_id, message, retrieval_query, answer, laws=()):
+        """
+        Adds an answered turn to the session, folding the oldest turns into the summary. Concurrent
+        turns of one session are applied one after the other, so none is lost.
+        """
+        with self._session_lock(session_id):
+            self._record_turn(session_id, message, retrieval_query, answer, laws)
+
+    def _record_turn(self, session_id, message, retrieval_query, answer, laws):
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id) or {"turns": [], "summary": []}
+        turns = session["turns"] + [{
+            "question": message,
+            "standalone": retrieval_query,
+            "answer": answer,
+            "laws": list(dict.fromkeys(laws)),
+        }]
+        summary = list(session["summary"])
+        while len(turns) > self.recent_turns:
+            oldest = turns.pop(0)
+            summary.append(f"- {oldest['standalone']} → {_first_sentence(oldest['answer'])}")
+        if len(summary) > MAX_SUMMARY_LINES:
+            summary = self._shrink_summary(summary)
+        session = {"turns": turns, "summary": summary, "updated_at": time.time()}
+        self._put(session_id, session)
+        self.turns_recorded += 1
+        if self.turns_recorded % PURGE_EVERY == 0:
+            self.purge_expired()
+        if self._db is not None:
+            try:
+                with self._lock, self._db:
+                    self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                                     (session_id, session["updated_at"], json.dumps(session)))
+            except sqlite3.Error as e:
+                print(f"Error saving conversation {session_id}: {e}")
+
+    def clear(self, session_id):
+        with self._session_lock(session_id), self._lock:
+            existed = self._drop(session_id)
+            if self._db is not None:
+                with self._db:
+                    existed = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0 or existed
+        return existed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._total_bytes,
+                "turns_recorded": self.turns_recorded,
+                "condensed_queries": self.condensed,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "loaded_from_disk": self.loaded_from_disk,
+                "persistent": self._db is not None,
+                "condense_mode": self.condense_mode,
+                "history_token_budget": self.history_token_budget,
+            }
+
+    # --- History and condensation ---
+
+    def _history_text(self, session):
+        """
+        Recent turns verbatim (answers clipped if needed), preceded by as many summary lines as still fit
+        in the budget, newest first. Always within history_token_budget.
+        """
+        budget = self.history_token_budget
+        recent = []
+        for i, turn in enumerate(reversed(session["turns"])):
+            question = f"User: {turn['question']}"
+            # The latest answer gets the most room; older recent answers are clipped to their first sentence.
+            answer = turn["answer"] if i == 0 else _first_sentence(turn["answer"])
+            block = f"{question}\nAleks: {answer}"
+            if estimate_tokens(block) > budget:
+                room = int((budget - estimate_tokens(question) - 4) * CHARS_PER_TOKEN)
+                if room < 40:
+                    break
+                block = f"{question}\nAleks: {answer[:room].rsplit(' ', 1)[0]}…"
+            recent.insert(0, block)
+            budget -= estimate_tokens(block) + 1
+        earlier = []
+        if session["summary"] and budget > 20:
+            budget -= 4  # "Earlier:" heading
+            for line in reversed(session["summary"]):
+                cost = estimate_tokens(line) + 1
+                if cost > budget:
+                    break
+                earlier.insert(0, line)
+                budget -= cost
+        parts = (["Earlier:", *earlier] if earlier else []) + recent
+        return "\n".join(parts)
+
+    @staticmethod
+    def _is_follow_up(message):
+        if NAMES_A_LAW.search(message):
+            return False
+        if FOLLOW_UP_START.search(message) or ANAPHORA.search(message):
+            return True
+        return len([t for t in _content_terms(message) if t not in FOLLOW_UP_WORDS]) <= 1
+
+    @staticmethod
+    def _condense_with_keywords(session, message):
+        """
+        Adds the previous turn's law (so retrieval is restricted to it) and, when the follow-up has
+        no topic of its own ("why?", "can you explain that?"), the previous question's key terms.
+        """
+        previous = session["turns"][-1]
+        hints = [law for law in previous.get("laws", [])[:2] if law.lower() not in message.lower()]
+        own_terms = [t for t in _content_terms(message) if t not in FOLLOW_UP_WORDS]
+        if not own_terms:
+            hints += list(dict.fromkeys(_content_terms(previous["standalone"])))[:8]
+        return f"{message} ({'; '.join(hints)})" if hints else message
+
+    def _shrink_summary(self, summary):
+        if self.summarizer is not None:
+            try:
+                return [self.summarizer(summary).strip()]
+            except Exception as e:
+                print(f"Conversation summarization failed ({e}); dropping the oldest turns instead.")
+        return summary[-MAX_SUMMARY_LINES:]
+
+    # --- Storage ---
+
+    def _session_lock(self, session_id):
+        return self._session_locks[hash(session_id) % len(self._session_locks)]
+
+    def _get(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                if time.time() - session["updated_at"] > self.ttl_seconds:
+                    self._drop(session_id)
+                    self.expired += 1
+                    return None
+                self._sessions.move_to_end(session_id)
+                return session
+        session = self._load(session_id)
+        if session is not None:
+            self._put(session_id, session)
+        return session
+
+    def _load(self, session_id):
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT updated_at, data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_seconds:
+            return None
+        self.loaded_from_disk += 1
+        return json.loads(row[1])
+
+    def _put(self, session_id, session):
+        size = _session_bytes(session)
+        with self._lock:
+            self._drop(session_id)
+            self._sessions[session_id] = session
+            self._bytes[session_id] = size
+            self._total_bytes += size
+            while self._sessions and (len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes):
+                oldest = next(iter(self._sessions))
+                if oldest == session_id:
+                    break
+                self._drop(oldest)
+                self.evicted += 1
+
+    def _drop(self, session_id):
+        """Removes a session from memory. Caller holds the lock."""
+        if self._sessions.pop(session_id, None) is None:
+            return False
+        self._total_bytes -= self._bytes.pop(session_id, 0)
+        return True
+
+    def purge_expired(self):
+        """Drops sessions idle past the TTL from memory and from SQLite."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for session_id in [sid for sid, s in self._sessions.items() if s["updated_at"] < cutoff]:
+                self._drop(session_id)
+                self.expired += 1
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,))
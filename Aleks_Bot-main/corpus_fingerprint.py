@@ -0,0 +1,67 @@
+# corpus_fingerprint.py
+import hashlib
+import json
+import os
+from datetime import datetime
+
+FINGERPRINT_FILENAME = "corpus_fingerprint.json"
+
+
+def hash_file(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_from_hashes(file_hashes):
+    """Combines {filename: content hash} into a single corpus fingerprint, independent of order."""
+    digest = hashlib.sha256()
+    for name in sorted(file_hashes):
+        digest.update(f"{name}\0{file_hashes[name]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_corpus_fingerprint(db_directory, file_hashes):
+    """
+    Records the fingerprint of the corpus a vector database was built from, next to the database.
+    Anything derived from the index (e.g. the answer cache) compares against this to detect rebuilds.
+    """
+    fingerprint = fingerprint_from_hashes(file_hashes)
+    os.makedirs(db_directory, exist_ok=True)
+    path = os.path.join(db_directory, FINGERPRINT_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "fingerprint": fingerprint,
+            "files": len(file_hashes),
+            "built_at": datetime.now().isoformat(timespec='seconds'),
+        }, f, indent=2)
+    os.replace(tmp_path, path)
+    return fingerprint
+
+
+def read_corpus_fingerprint(db_directory):
+    """
+    Returns the fingerprint recorded by the last ingestion run. For databases built before fingerprints
+    were recorded, falls back to hashing the database directory listing (paths, sizes, mtimes).
+    Returns None if the directory does not exist.
+    """
+    path = os.path.join(db_directory, FINGERPRINT_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)["fingerprint"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if not os.path.isdir(db_directory):
+        return None
+    digest = hashlib.sha256()
+    for root, _, files in sorted(os.walk(db_directory)):
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            rel_path = os.path.relpath(os.path.join(root, name), db_directory)
+            digest.update(f"{rel_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return "stat-" + digest.hexdigest()
@@ -1,63 +1,179 @@
 # data_processor.py
 import pypdf
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document # Import Document class
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from statute_splitter import split_statute
 
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a single PDF file."""
-    text = ""
+# --- Extraction Configuration ---
+# Worker processes for PDF extraction (1 = extract serially in this process)
+EXTRACT_WORKERS = int(os.getenv("ALEKS_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+# Large PDFs are split into page ranges of this size so one statute can use several workers
+PAGES_PER_TASK = int(os.getenv("ALEKS_PAGES_PER_TASK", "32"))
+
+def _extract_page_range(pdf_path, start_page, end_page):
+    """
+    Extracts the text of pages [start_page, end_page) of a PDF. Runs in a worker process.
+    Returns (list of end_page - start_page page texts, "" for pages that failed, seconds spent).
+    """
+    started = time.perf_counter()
+    texts = []
     try:
         with open(pdf_path, 'rb') as file:
             reader = pypdf.PdfReader(file)
-            for page_num in range(len(reader.pages)):
-                page = reader.pages[page_num]
-                # Ensure page can be extracted as text
-                if page.extract_text():
-                    text += page.extract_text()
-                else:
+            for page_num in range(start_page, end_page):
+                # extract_text() is expensive, so call it once per page
+                try:
+                    page_text = reader.pages[page_num].extract_text()
+                except Exception as e:
+                    print(f"Warning: Error extracting page {page_num+1} of {os.path.basename(pdf_path)}: {e}")
+                    page_text = ""
+                if not page_text:
                     print(f"Warning: Could not extract text from page {page_num+1} of {os.path.basename(pdf_path)}")
+                texts.append(page_text or "")
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
-    return text
+    texts += [""] * (end_page - start_page - len(texts))
+    return texts, time.perf_counter() - started
+
+def _count_pages(pdf_path):
+    try:
+        with open(pdf_path, 'rb') as file:
+            return len(pypdf.PdfReader(file).pages)
+    except Exception as e:
+        print(f"Error reading {pdf_path}: {e}")
+        return 0
+
+def extract_text_from_pdf(pdf_path):
+    """Extracts text from a single PDF file."""
+    texts, _ = _extract_page_range(pdf_path, 0, _count_pages(pdf_path))
+    return "\n".join(texts)
+
+def iter_extracted_pdfs(pdf_paths, workers=EXTRACT_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    Extracts page texts from many PDFs in a process pool, splitting large files into page ranges.
+    Yields (pdf_path, page_texts, stats) for each file as soon as all of its pages are done, so
+    callers can split and embed one file while the next ones are still being extracted.
+    Only a bounded number of page ranges is in flight at a time to keep memory flat.
+    """
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            started = time.perf_counter()
+            page_count = _count_pages(pdf_path)
+            texts, _ = _extract_page_range(pdf_path, 0, page_count)
+            yield pdf_path, texts, _file_stats(page_count, time.perf_counter() - started)
+        return
+
+    def tasks():
+        for pdf_path in pdf_paths:
+            page_count = _count_pages(pdf_path)
+            if page_count == 0:
+                yield pdf_path, 0, 0, 0
+            for start_page in range(0, page_count, pages_per_task):
+                yield pdf_path, start_page, min(start_page + pages_per_task, page_count), page_count
+
+    files = {}  # pdf_path -> {"pages": [...], "remaining": int, "started": float}
+    pending = {}  # future -> (pdf_path, start_page, end_page)
+    task_iter = tasks()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Keep roughly two page ranges per worker queued
+            for pdf_path, start_page, end_page, page_count in task_iter:
+                if pdf_path not in files:
+                    task_count = max(1, -(-page_count // pages_per_task))
+                    files[pdf_path] = {"pages": [None] * page_count, "remaining": task_count, "started": time.perf_counter()}
+                if page_count == 0:
+                    yield pdf_path, [], _file_stats(0, 0.0)
+                    del files[pdf_path]
+                    continue
+                try:
+                    future = pool.submit(_extract_page_range, pdf_path, start_page, end_page)
+                except Exception as e:  # the pool broke (a worker died); handled like a failed range below
+                    future = Future()
+                    future.set_exception(e)
+                pending[future] = (pdf_path, start_page, end_page)
+                if len(pending) >= workers * 2:
+                    break
+            if not pending:
+                return
 
-def load_and_process_legal_data(pdf_directory="./legal_data_pdfs"):
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_path, start_page, end_page = pending.pop(future)
+                try:
+                    texts, _ = future.result()
+                except Exception as e:
+                    # Extract the range here instead, like the serial path (pages that fail there come back "")
+                    print(f"Worker failed on pages {start_page+1}-{end_page} of {os.path.basename(pdf_path)} ({e}); extracting them in this process.")
+                    texts, _ = _extract_page_range(pdf_path, start_page, end_page)
+                state = files[pdf_path]
+                state["pages"][start_page:end_page] = texts
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    del files[pdf_path]
+                    yield pdf_path, state["pages"], _file_stats(len(state["pages"]), time.perf_counter() - state["started"])
+
+def _file_stats(page_count, seconds):
+    return {
+        "pages": page_count,
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(page_count / seconds, 1) if seconds > 0 else 0.0,
+    }
+
+def _split_pages(filename, page_texts):
+    """
+    Splits the extracted page texts of one PDF into provision-aligned chunks with citation metadata.
+    """
+    if not any(text.strip() for text in page_texts):
+        print(f"Skipping {filename} due to no extracted text.")
+        return []
+    return split_statute(filename, page_texts)
+
+def load_and_process_pdf(pdf_path):
+    """
+    Extracts, cleans and splits a single PDF into chunks.
+    Returns a list of LangChain Document objects (empty if no text could be extracted).
+    """
+    filename = os.path.basename(pdf_path)
+    print(f"Processing {filename}...")
+    page_texts, _ = _extract_page_range(pdf_path, 0, _count_pages(pdf_path))
+    return _split_pages(filename, page_texts)
+
+def iter_processed_pdfs(pdf_paths, workers=EXTRACT_WORKERS):
+    """
+    Parallel counterpart of load_and_process_pdf for many files.
+    Yields (filename, chunks, stats) per PDF in completion order and prints per-file timing.
+    """
+    for pdf_path, page_texts, stats in iter_extracted_pdfs(pdf_paths, workers=workers):
+        filename = os.path.basename(pdf_path)
+        chunks = _split_pages(filename, page_texts)
+        stats["chunks"] = len(chunks)
+        print(f"Processed {filename}: {stats['pages']} pages in {stats['seconds']}s ({stats['pages_per_sec']} pages/sec), {len(chunks)} chunks")
+        yield filename, chunks, stats
+
+def iter_legal_chunks(pdf_directory="./legal_data_pdfs", workers=EXTRACT_WORKERS):
+    """
+    Generator over the chunks of every PDF in pdf_directory, extracted in parallel.
+    Only the chunks of files currently being handed out are held in memory.
+    """
+    pdf_paths = [
+        os.path.join(pdf_directory, filename)
+        for filename in sorted(os.listdir(pdf_directory)) if filename.lower().endswith(".pdf")
+    ]
+    for _, chunks, _ in iter_processed_pdfs(pdf_paths, workers=workers):
+        yield from chunks
+
+def load_and_process_legal_data(pdf_directory="./legal_data_pdfs", workers=EXTRACT_WORKERS):
     """
     Loads PDF documents, extracts text, cleans it, and splits into chunks.
     Returns a list of LangChain Document objects.
     """
-    all_raw_text = []
-    for filename in os.listdir(pdf_directory):
-        if filename.lower().endswith(".pdf"):
-            pdf_path = os.path.join(pdf_directory, filename)
-            print(f"Processing {filename}...")
-            text = extract_text_from_pdf(pdf_path)
-            if text:
-                # Basic cleaning: remove extra newlines and leading/trailing whitespace
-                cleaned_text = os.linesep.join([s for s in text.splitlines() if s.strip()])
-                cleaned_text = cleaned_text.strip()
-                all_raw_text.append(Document(page_content=cleaned_text, metadata={"source": filename}))
-            else:
-                print(f"Skipping {filename} due to no extracted text.")
-
-    if not all_raw_text:
+    chunks = list(iter_legal_chunks(pdf_directory, workers=workers))
+
+    if not chunks:
         print("No legal documents found or extracted. Please check your 'legal_data_pdfs' directory.")
         return []
 
-    # Initialize the text splitter
-    # RecursiveCharacterTextSplitter tries to split by paragraphs, then sentences, then words
-    # You'll need to experiment with chunk_size and chunk_overlap
-    # A chunk_size of 1000-2000 characters is a good starting point for legal docs
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1500,  # Max characters per chunk
-        chunk_overlap=200, # Characters to overlap between chunks (helps maintain context)
-        length_function=len, # Use standard Python len() for character count
-        add_start_index=True # Adds starting index of chunk to metadata
-    )
-
-    # Split the loaded documents into chunks
-    chunks = text_splitter.split_documents(all_raw_text)
-
     print(f"Created {len(chunks)} text chunks from your legal documents.")
     return chunks
 
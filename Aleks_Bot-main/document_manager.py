@@ -1,7 +1,5 @@
 # document_manager.py
-import os
-import re
-from datetime import datetime
+from document_store import DOCUMENT_STORE_PATH, DocumentStore
 
 # --- Document Template Configuration ---
 TEMPLATE_DIR = "./document_templates"
@@ -11,6 +9,24 @@ DOCUMENT_TEMPLATES = {
     # Add more mappings as you create more templates (e.g., "lease agreement": "lease_agreement_template.txt")
 }
 
+# --- Template Examples ---
+# Example requests for each template key. The intent router embeds these once at startup and compares
+# incoming chat messages against them, so only ambiguous messages need an LLM classification call.
+TEMPLATE_EXAMPLES = {
+    "nda": [
+        "I need an NDA.",
+        "Draft an NDA for me and my business partner.",
+        "Can you generate a confidentiality agreement?",
+        "Give me a confidentiality agreement template for my employees.",
+        "Prepare a document so the other party keeps our information secret.",
+    ],
+    "non-disclosure agreement": [
+        "Can you help me draft a non-disclosure agreement?",
+        "I want to create a non-disclosure agreement with a contractor.",
+        "Please make a non-disclosure agreement form I can fill out.",
+    ],
+}
+
 # --- Placeholder Descriptions ---
 # This dictionary maps placeholder names (from your templates) to user-friendly explanations.
 # You will need to expand this as you add more templates and placeholders.
@@ -32,47 +48,35 @@ def handle_document_filling(template_key):
     """
     Guides the user through filling out a document template.
     """
-    template_filename = DOCUMENT_TEMPLATES.get(template_key)
-    if not template_filename:
+    # Imported here: template_engine reads the template configuration from this module
+    from template_engine import current_date, template_registry
+
+    try:
+        compiled_template = template_registry.get(template_key)
+    except KeyError:
         print(f"Aleks: Error: No template found for '{template_key}'.")
         return
-
-    template_path = os.path.join(TEMPLATE_DIR, template_filename)
-
-    if not os.path.exists(template_path):
-        print(f"Aleks: Error: Template file '{template_filename}' not found at '{template_path}'.")
+    except FileNotFoundError:
+        print(f"Aleks: Error: Template file '{DOCUMENT_TEMPLATES[template_key]}' not found in '{TEMPLATE_DIR}'.")
         return
-
-    print(f"\nAleks: Okay, let's fill out your '{template_key}' template.")
-    
-    try:
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template_content = f.read()
     except Exception as e:
         print(f"Aleks: Error reading template file: {e}")
         return
 
-    placeholders = set(re.findall(r'\[(.*?)\]|\{\{(.*?)\}\}', template_content))
-    placeholders = {p.strip() for tup in placeholders for p in tup if p.strip()}
-    
-    if 'current_date' in placeholders:
-        placeholders.remove('current_date') # 'current_date' is handled automatically
+    print(f"\nAleks: Okay, let's fill out your '{template_key}' template.")
 
     filled_data = {}
     print("\nAleks: Please provide the following details:")
 
-    if 'current_date' in template_content:
-        filled_data['current_date'] = datetime.now().strftime("%B %d, %Y")
+    if 'current_date' in compiled_template.names:
+        filled_data['current_date'] = current_date()
         print(f"Aleks: Setting current date to: {filled_data['current_date']}")
 
-    for placeholder in sorted(list(placeholders)):
-        description = PLACEHOLDER_DESCRIPTIONS.get(placeholder, placeholder.replace('_', ' ').title())
-        user_input = input(f"Aleks: {description}: ") # Use description in prompt
-        filled_data[placeholder] = user_input
+    for placeholder in compiled_template.placeholders:
+        user_input = input(f"Aleks: {placeholder['description']}: ") # Use description in prompt
+        filled_data[placeholder['name']] = user_input
 
-    filled_document = template_content
-    for placeholder, value in filled_data.items():
-        filled_document = re.sub(rf"\[{re.escape(placeholder)}\]|" + r"\{\{" + re.escape(placeholder) + r"\}\}", value, filled_document)
+    filled_document = compiled_template.render(filled_data)
 
     print("\n" + "="*50)
     print("Aleks: Here is your filled document preview:")
@@ -85,16 +89,15 @@ def handle_document_filling(template_key):
 
     if review_correct == 'yes':
         print("Aleks: Great! The document is finalized.")
-        output_filename = f"filled_{template_key}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        # Output saved in the same TEMPLATE_DIR for now, could be changed to an 'output' folder
-        output_path = os.path.join(TEMPLATE_DIR, output_filename)
+        store = DocumentStore()
         try:
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(filled_document)
-            print(f"Aleks: Document saved as '{output_filename}' in the '{TEMPLATE_DIR}' folder.")
+            record = store.put(template_key, filled_document, {"filled_data": filled_data})
+            print(f"Aleks: Document saved as '{record['id']}' in '{DOCUMENT_STORE_PATH}'.")
             print("Aleks: (Mock process for sending to government agency complete.)")
         except Exception as e:
             print(f"Aleks: Error saving document: {e}")
+        finally:
+            store.close()
     else:
         print("Aleks: Okay, please indicate what needs to be changed for future improvements.")
         print("Aleks: For now, you can manually edit the content from the preview above.")
\ No newline at end of file
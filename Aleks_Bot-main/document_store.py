@@ -0,0 +1,548 @@
+# document_store.py
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import quote, unquote
+from concurrent.futures import Future
+from datetime import datetime, timezone
+
+try:
+    import zstandard
+except ImportError:  # optional: documents are zlib-compressed without it
+    zstandard = None
+
+# --- Document Store Configuration ---
+# "sqlite" keeps every generated document in one SQLite file (deduplicated by content hash);
+# "files" writes one compressed file per document under date/hour directories.
+DOCUMENT_STORE_BACKEND = os.getenv("ALEKS_DOCUMENT_STORE_BACKEND", "sqlite").lower()
+DOCUMENT_STORE_PATH = os.getenv("ALEKS_DOCUMENT_STORE_PATH", "./generated_documents")
+# Documents older than this are deleted by the periodic cleanup (0 = keep forever). Imported documents
+# count from the day they were imported.
+DOCUMENT_RETENTION_DAYS = float(os.getenv("ALEKS_DOCUMENT_RETENTION_DAYS", "0"))
+# Only the newest N documents are kept (0 = no limit).
+DOCUMENT_MAX_COUNT = int(os.getenv("ALEKS_DOCUMENT_MAX_COUNT", "0"))
+# Seconds between retention cleanups run by the writer thread.
+DOCUMENT_CLEANUP_INTERVAL = float(os.getenv("ALEKS_DOCUMENT_CLEANUP_INTERVAL", "3600"))
+# Writes queued while the previous batch commits are committed together, up to this many.
+WRITE_BATCH_SIZE = 256
+ZSTD_LEVEL = 3
+SQLITE_FILENAME = "documents.sqlite3"
+# Appended to a legacy filled_*.txt file once it is imported, so a second import skips it
+IMPORTED_SUFFIX = ".imported"
+
+
+_id_lock = threading.Lock()
+_last_id = [0, 0]  # [millisecond, sequence within it]
+
+
+def new_document_id():
+    """
+    Collision-free, time-ordered ID: UTC timestamp to the millisecond, a per-process sequence number
+    and 32 random bits, e.g. "20250801T075447123-00003f9a0c1b". Sorting IDs sorts documents by
+    creation time, also within one millisecond.
+    """
+    with _id_lock:
+        now_ms = max(time.time_ns() // 1_000_000, _last_id[0])  # never step back with the clock
+        _last_id[1] = _last_id[1] + 1 if now_ms == _last_id[0] else 0
+        _last_id[0] = now_ms
+        sequence = _last_id[1]
+    now = datetime.fromtimestamp(now_ms / 1000, timezone.utc)
+    return f"{now.strftime('%Y%m%dT%H%M%S')}{now_ms % 1000:03d}-{sequence:04x}{secrets.token_hex(4)}"
+
+
+def document_time(document_id):
+    """The creation time (epoch seconds, to the millisecond) encoded in a document ID."""
+    stamp = datetime.strptime(document_id[:15], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+    return (int(stamp.timestamp()) * 1000 + int(document_id[15:18])) / 1000
+
+
+def compress(data):
+    """Returns (codec, compressed bytes)."""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This document is zstd-compressed; install zstandard to read it.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+def _summary(record):
+    return {key: record[key] for key in ("id", "template_key", "created_at", "size")}
+
+
+class SQLiteDocumentBackend:
+    """
+    One SQLite file holding document metadata and content-addressed, compressed bodies.
+    Identical documents share a single blob; blobs no document points to are removed on delete/cleanup.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, SQLITE_FILENAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha256 TEXT PRIMARY KEY, codec TEXT NOT NULL, body BLOB NOT NULL, stored_size INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id TEXT PRIMARY KEY, template_key TEXT NOT NULL, created_at REAL NOT NULL, size INTEGER NOT NULL, "
+            "sha256 TEXT NOT NULL, metadata TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS documents_created ON documents (created_at);"
+            "CREATE INDEX IF NOT EXISTS documents_template ON documents (template_key, id);"
+        )
+        self._conn.commit()
+
+    def put_many(self, records):
+        """Stores records ({"id", "template_key", "created_at", "size", "text", "metadata"}) in one transaction."""
+        blobs, rows = {}, []
+        for record in records:
+            data = record["text"].encode('utf-8')
+            sha256 = hashlib.sha256(data).hexdigest()
+            if sha256 not in blobs:
+                codec, body = compress(data)
+                blobs[sha256] = (sha256, codec, body, len(body))
+            rows.append((record["id"], record["template_key"], record["created_at"], record["size"], sha256,
+                         json.dumps(record.get("metadata") or {})))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?, ?)", list(blobs.values()))
+            self._conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def get(self, document_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT d.id, d.template_key, d.created_at, d.size, d.metadata, b.codec, b.body "
+                "FROM documents d JOIN blobs b ON b.sha256 = d.sha256 WHERE d.id = ?", (document_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "template_key": row[1], "created_at": row[2], "size": row[3],
+                "metadata": json.loads(row[4]), "text": decompress(row[5], row[6]).decode('utf-8')}
+
+    def list(self, limit, cursor=None, template_key=None):
+        """Newest first. Returns up to limit summaries with IDs below cursor."""
+        query = "SELECT id, template_key, created_at, size FROM documents WHERE 1 = 1"
+        params = []
+        if cursor:
+            query += " AND id < ?"
+            params.append(cursor)
+        if template_key:
+            query += " AND template_key = ?"
+            params.append(template_key)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{"id": r[0], "template_key": r[1], "created_at": r[2], "size": r[3]} for r in rows]
+
+    def delete(self, document_id):
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount
+            if deleted:
+                self._delete_orphan_blobs()
+        return bool(deleted)
+
+    def cleanup(self, older_than=None, keep_newest=0):
+        """Deletes documents created before older_than (epoch seconds) and all but the newest keep_newest."""
+        with self._lock, self._conn:
+            deleted = 0
+            if older_than is not None:
+                deleted += self._conn.execute("DELETE FROM documents WHERE created_at < ?", (older_than,)).rowcount
+            if keep_newest:
+                deleted += self._conn.execute(
+                    "DELETE FROM documents WHERE id NOT IN (SELECT id FROM documents ORDER BY id DESC LIMIT ?)",
+                    (keep_newest,),
+                ).rowcount
+            if deleted:
+                self._delete_orphan_blobs()
+        return deleted
+
+    def _delete_orphan_blobs(self):
+        self._conn.execute("DELETE FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM documents)")
+
+    def stats(self):
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+            blobs, stored = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()
+        return {"documents": count, "bytes": size, "unique_bodies": blobs, "stored_bytes": stored}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class FileDocumentBackend:
+    """
+    One compressed JSON file per document under <root>/<YYYYmmdd>/<HH>/, so no directory grows
+    past an hour's worth of documents. Files are named <id>.<size>.<template key>.json.<codec>, so
+    listing builds summaries from directory entries alone, newest first, without opening a file.
+    """
+
+    def __init__(self, directory):
+        self.root = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _hour_dir_name(document_id):
+        # IDs start with "YYYYmmddTHH"
+        if len(document_id) < 18 or not document_id[:8].isdigit() or document_id[8] != "T" or "/" in document_id \
+                or os.sep in document_id:
+            return None
+        return os.path.join(document_id[:8], document_id[9:11])
+
+    def _path(self, document_id):
+        """Path of the stored file, or None if there is none. Only the document's hour directory is scanned."""
+        hour_dir = self._hour_dir_name(document_id)
+        if hour_dir is None:
+            return None
+        hour_dir = os.path.join(self.root, hour_dir)
+        try:
+            names = os.listdir(hour_dir)
+        except FileNotFoundError:
+            return None
+        prefix = document_id + "."
+        for name in names:
+            if name.startswith(prefix) and not name.endswith(".tmp"):
+                return os.path.join(hour_dir, name)
+        return None
+
+    @staticmethod
+    def _summary_from_name(name):
+        """The summary encoded in a file name, or None for files written before names carried it."""
+        document_id, _, rest = name.partition(".")
+        size, _, rest = rest.partition(".")
+        if not size.isdigit() or ".json." not in rest:
+            return None
+        return {"id": document_id, "template_key": unquote(rest.rsplit(".json.", 1)[0]),
+                "created_at": document_time(document_id), "size": int(size)}
+
+    @staticmethod
+    def _codec():
+        return "zst" if zstandard is not None else "zlib"
+
+    def put_many(self, records):
+        for record in records:
+            # "." is quoted too, so the template key can't be confused with the fields around it
+            name = f"{record['id']}.{record['size']}.{quote(record['template_key'], safe='').replace('.', '%2E')}"
+            path = os.path.join(self.root, self._hour_dir_name(record["id"]), f"{name}.json.{self._codec()}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = json.dumps(record).encode('utf-8')
+            _, body = compress(data)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)  # readers never see a partial file
+
+    def get(self, document_id):
+        path = self._path(document_id)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return json.loads(decompress("zstd" if path.endswith(".zst") else "zlib", body))
+
+    def _names_newest_first(self, before=None):
+        """
+        (document ID, file name) of the stored documents, newest first. With before, only IDs below it;
+        day and hour directories that are newer are skipped without being listed.
+        """
+        for day in sorted(os.listdir(self.root), reverse=True):
+            day_dir = os.path.join(self.root, day)
+            if not (day.isdigit() and os.path.isdir(day_dir)) or (before and day > before[:8]):
+                continue
+            for hour in sorted(os.listdir(day_dir), reverse=True):
+                if before and f"{day}T{hour}" > before[:11]:
+                    continue
+                names = [n for n in os.listdir(os.path.join(day_dir, hour)) if not n.endswith(".tmp")]
+                for name in sorted(names, reverse=True):
+                    document_id = name.split(".", 1)[0]
+                    if before and document_id >= before:
+                        continue
+                    yield document_id, name
+
+    def _ids_newest_first(self):
+        for document_id, _ in self._names_newest_first():
+            yield document_id
+
+    def list(self, limit, cursor=None, template_key=None):
+        items = []
+        for document_id, name in self._names_newest_first(before=cursor):
+            summary = self._summary_from_name(name)
+            if summary is None:
+                # Written by an older version: the summary is only inside the file
+                record = self.get(document_id)
+                if record is None:
+                    continue
+                summary = _summary(record)
+            if template_key and summary["template_key"] != template_key:
+                continue
+            items.append(summary)
+            if len(items) >= limit:
+                break
+        return items
+
+    def delete(self, document_id):
+        path = self._path(document_id)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def cleanup(self, older_than=None, keep_newest=0):
+        cutoff = None
+        if older_than is not None:
+            cutoff = datetime.fromtimestamp(older_than, timezone.utc).strftime('%Y%m%dT%H%M%S')
+        deleted = 0
+        for i, document_id in enumerate(list(self._ids_newest_first())):
+            if (keep_newest and i >= keep_newest) or (cutoff and document_id < cutoff):
+                deleted += self.delete(document_id)
+        for pattern in (os.path.join(self.root, "*", "*"), os.path.join(self.root, "*")):
+            for directory in glob.glob(pattern):
+                if os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)
+        return deleted
+
+    def stats(self):
+        count = stored = 0
+        for path in glob.glob(os.path.join(self.root, "*", "*", "*.json.*")):
+            count += 1
+            stored += os.path.getsize(path)
+        return {"documents": count, "stored_bytes": stored}
+
+    def close(self):
+        pass
+
+
+BACKENDS = {"sqlite": SQLiteDocumentBackend, "files": FileDocumentBackend}
+
+
+class DocumentStore:
+    """
+    Stores generated documents off the event loop.
+
+    Writes are queued to a single writer thread, which commits whatever has queued up in one
+    batch (one SQLite transaction), so a burst of concurrent generations costs a few commits
+    instead of one each. save() / submit() resolve once the document is durably stored, so a
+    request never reports a document that was not written. The writer also runs the retention
+    cleanup every DOCUMENT_CLEANUP_INTERVAL seconds.
+    """
+
+    def __init__(self, directory=DOCUMENT_STORE_PATH, backend=DOCUMENT_STORE_BACKEND,
+                 retention_days=DOCUMENT_RETENTION_DAYS, max_documents=DOCUMENT_MAX_COUNT,
+                 cleanup_interval=DOCUMENT_CLEANUP_INTERVAL):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown document store backend '{backend}' (expected one of {', '.join(BACKENDS)}).")
+        self.backend_name = backend
+        self.backend = BACKENDS[backend](directory)
+        self.retention_days = retention_days
+        self.max_documents = max_documents
+        self.cleanup_interval = cleanup_interval
+        self._queue = queue.Queue()
+        self._last_cleanup = time.monotonic()  # first cleanup one interval after startup, not at once
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.cleaned_up = 0
+
+    # --- Writing ---
+
+    def submit(self, template_key, texts, metadata=None):
+        """
+        Queues one document (texts is a str) or several (a list of str) for writing.
+        Returns a Future resolving to the stored summary (or list of summaries).
+        """
+        self._ensure_writer()
+        single = isinstance(texts, str)
+        records = []
+        for text in ([texts] if single else texts):
+            document_id = new_document_id()
+            # created_at is the time in the ID, so summaries built from IDs alone match the stored records
+            records.append({"id": document_id, "template_key": template_key, "created_at": document_time(document_id),
+                            "size": len(text.encode('utf-8')), "text": text, "metadata": metadata})
+        future = Future()
+        self._queue.put((records, single, future))
+        return future
+
+    def put(self, template_key, text, metadata=None):
+        """Blocking write; for scripts and the console flow."""
+        return self.submit(template_key, text, metadata).result()
+
+    async def save(self, template_key, texts, metadata=None):
+        """Awaitable write for request handlers: the event loop keeps serving while the writer commits."""
+        return await asyncio.wrap_future(self.submit(template_key, texts, metadata))
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name="aleks-document-writer", daemon=True)
+                self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=max(1.0, min(self.cleanup_interval, 60.0)))
+            except queue.Empty:
+                self._maybe_cleanup()
+                continue
+            pending, stopping = [], item is None
+            if item is not None:
+                pending.append(item)
+            while len(pending) < WRITE_BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+            if pending:
+                self._write(pending)
+            self._maybe_cleanup()
+            if stopping:
+                return
+
+    def _write(self, pending):
+        records = [record for item_records, _, _ in pending for record in item_records]
+        try:
+            self.backend.put_many(records)
+        except Exception as e:
+            self.failed += len(records)
+            print(f"Error saving {len(records)} generated documents: {e}")
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+        self.written += len(records)
+        self.batches += 1
+        for item_records, single, future in pending:
+            summaries = [_summary(record) for record in item_records]
+            future.set_result(summaries[0] if single else summaries)
+
+    def _maybe_cleanup(self):
+        if time.monotonic() - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = time.monotonic()
+        self.cleanup()
+
+    def cleanup(self):
+        """Applies the retention policy now. Returns the number of documents deleted."""
+        if not self.retention_days and not self.max_documents:
+            return 0
+        older_than = time.time() - self.retention_days * 86400 if self.retention_days else None
+        try:
+            deleted = self.backend.cleanup(older_than=older_than, keep_newest=self.max_documents)
+        except Exception as e:
+            print(f"Error applying document retention: {e}")
+            return 0
+        if deleted:
+            self.cleaned_up += deleted
+            print(f"Document retention: deleted {deleted} generated documents.")
+        return deleted
+
+    def close(self):
+        """Flushes queued writes and stops the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self.backend.close()
+
+    # --- Reading ---
+
+    def get(self, document_id):
+        """The stored document ({"id", "template_key", "created_at", "size", "metadata", "text"}) or None."""
+        return self.backend.get(document_id)
+
+    def list(self, limit=20, cursor=None, template_key=None):
+        """
+        One page of document summaries, newest first. Pass the returned next_cursor back as cursor
+        for the next page; it is None on the last page.
+        """
+        items = self.backend.list(limit + 1, cursor=cursor, template_key=template_key)
+        next_cursor = items[limit - 1]["id"] if len(items) > limit else None
+        return {"items": items[:limit], "next_cursor": next_cursor}
+
+    def delete(self, document_id):
+        return self.backend.delete(document_id)
+
+    def stats(self):
+        return dict(self.backend.stats(), backend=self.backend_name, written=self.written, batches=self.batches,
+                    failed=self.failed, queued=self._queue.qsize(), cleaned_up=self.cleaned_up,
+                    compression="zstd" if zstandard is not None else "zlib")
+
+
+def import_legacy_documents(store, template_dir):
+    """
+    Copies the filled_<key>_<YYYYmmdd_HHMMSS>.txt files older versions wrote into the templates
+    directory into the store. They are stored as created now (so retention counts from the import), with
+    the original time in metadata["original_created_at"]. Each file is kept but renamed to
+    <name>.txt.imported once stored, so running the import again does not copy it twice.
+    """
+    imported = 0
+    for path in sorted(glob.glob(os.path.join(template_dir, "filled_*.txt"))):
+        name = os.path.basename(path)[len("filled_"):-len(".txt")]
+        template_key, _, stamp = name.rpartition("_")
+        template_key, _, day = template_key.rpartition("_")
+        try:
+            # Old filenames used local time
+            created = datetime.strptime(f"{day}_{stamp}", "%Y%m%d_%H%M%S").astimezone(timezone.utc)
+        except ValueError:
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        document_id = new_document_id()
+        store.backend.put_many([{"id": document_id, "template_key": template_key, "created_at": document_time(document_id),
+                                 "size": len(text.encode('utf-8')), "text": text,
+                                 "metadata": {"imported_from": name, "original_created_at": created.timestamp()}}])
+        os.replace(path, path + IMPORTED_SUFFIX)
+        imported += 1
+    return imported
+
+
+def main():
+    from document_manager import TEMPLATE_DIR
+
+    parser = argparse.ArgumentParser(description="Maintain the generated-document store.")
+    parser.add_argument("--import-legacy", action="store_true",
+                        help=f"Import filled_*.txt files from {TEMPLATE_DIR} (each is renamed to *.txt{IMPORTED_SUFFIX}, not deleted).")
+    parser.add_argument("--cleanup", action="store_true", help="Apply the retention policy now.")
+    args = parser.parse_args()
+
+    store = DocumentStore()
+    if args.import_legacy:
+        print(f"Imported {import_legacy_documents(store, TEMPLATE_DIR)} documents from {TEMPLATE_DIR}.")
+    if args.cleanup:
+        print(f"Deleted {store.cleanup()} documents.")
+    print(json.dumps(store.stats(), indent=2))
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# embedding_service.py
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Embedding Configuration ---
+EMBEDDINGS_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# Texts per forward pass. Larger batches are faster on CPU up to a point, at the cost of memory.
+EMBEDDING_BATCH_SIZE = int(os.getenv("ALEKS_EMBEDDING_BATCH_SIZE", "64"))
+# CPU threads for inference (0 = library default, usually one per core).
+EMBEDDING_THREADS = int(os.getenv("ALEKS_EMBEDDING_THREADS", "0"))
+# "torch" (default), "onnx", or "onnx-int8" for the quantized ONNX export. ONNX needs `optimum[onnxruntime]`.
+EMBEDDING_BACKEND = os.getenv("ALEKS_EMBEDDING_BACKEND", "torch").lower()
+# SQLite file caching embeddings by text hash and model. Empty string disables the disk cache.
+EMBEDDING_CACHE_PATH = os.getenv("ALEKS_EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+# Recent query embeddings kept in memory.
+EMBEDDING_QUERY_CACHE_SIZE = int(os.getenv("ALEKS_EMBEDDING_QUERY_CACHE_SIZE", "2048"))
+# Local copy of the model written by `python embedding_service.py --export DIR` (empty = download/cache by name).
+EMBEDDING_MODEL_PATH = os.getenv("ALEKS_EMBEDDING_MODEL_PATH", "")
+
+# Quantized ONNX export shipped with the sentence-transformers model repo.
+ONNX_INT8_FILE_NAME = "onnx/model_qint8_avx2.onnx"
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache: one SQLite row per (model, text hash) holding the float32 vector.
+    Safe to share between threads; concurrent processes are handled by SQLite's WAL locking.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+
+    def get_many(self, model, hashes):
+        """Returns {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look up in slices.
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                for hash_value, blob in rows:
+                    found[hash_value] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model, items):
+        """Stores (text_hash, vector) pairs."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, hash_value, np.asarray(vector, dtype=np.float32).tobytes()) for hash_value, vector in items],
+            )
+            self._conn.commit()
+
+    def count(self, model=None):
+        with self._lock:
+            if model is None:
+                return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+
+class EmbeddingService(Embeddings):
+    """
+    LangChain Embeddings used for both ingestion and queries.
+
+    Wraps HuggingFaceEmbeddings with a configurable batch size, thread count and backend
+    (torch, ONNX or quantized int8 ONNX), and checks an in-memory query LRU and the disk cache
+    before running the model, so unchanged chunks and repeated queries are never re-embedded.
+    """
+
+    def __init__(self, model_name=EMBEDDINGS_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE,
+                 threads=EMBEDDING_THREADS, backend=EMBEDDING_BACKEND,
+                 cache_path=EMBEDDING_CACHE_PATH, query_cache_size=EMBEDDING_QUERY_CACHE_SIZE,
+                 model_path=EMBEDDING_MODEL_PATH):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend = backend
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+
+        self._model = self._load_model(model_path or model_name)
+        # Vectors from different backends differ slightly, so they never share cache entries.
+        self.model_id = model_name if self.backend == "torch" else f"{model_name}|{self.backend}"
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        self._query_lock = threading.Lock()
+
+        self.computed = 0
+        self.disk_hits = 0
+        self.memory_hits = 0
+
+    def _load_model(self, model_name_or_path):
+        # Imported here: it pulls in torch, which API workers using the shared retrieval service never need
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        encode_kwargs = {"batch_size": self.batch_size}
+        model_kwargs = {"device": "cpu"}
+        if self.backend in ("onnx", "onnx-int8"):
+            model_kwargs["backend"] = "onnx"
+            if self.backend == "onnx-int8":
+                model_kwargs["model_kwargs"] = {"file_name": ONNX_INT8_FILE_NAME}
+        try:
+            return HuggingFaceEmbeddings(model_name=model_name_or_path, model_kwargs=model_kwargs, encode_kwargs=encode_kwargs)
+        except Exception as e:
+            if self.backend == "torch":
+                raise
+            print(f"Could not load the {self.backend} embedding backend ({e}), falling back to torch.")
+            self.backend = "torch"
+            return HuggingFaceEmbeddings(model_name=model_name_or_path, model_kwargs={"device": "cpu"}, encode_kwargs=encode_kwargs)
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.model_id, list(set(hashes))) if self.cache else {}
+        self.disk_hits += sum(1 for h in hashes if h in vectors)
+
+        # Embed each distinct missing text once, batch_size texts per forward pass.
+        missing = {}
+        for text, hash_value in zip(texts, hashes):
+            if hash_value not in vectors:
+                missing.setdefault(hash_value, text)
+        if missing:
+            missing_hashes = list(missing)
+            computed = self._model.embed_documents([missing[h] for h in missing_hashes])
+            self.computed += len(computed)
+            new_items = list(zip(missing_hashes, computed))
+            if self.cache:
+                self.cache.put_many(self.model_id, new_items)
+            vectors.update((h, np.asarray(v, dtype=np.float32)) for h, v in new_items)
+
+        return [vectors[h].tolist() for h in hashes]
+
+    def embed_query(self, text):
+        hash_value = text_hash(text)
+        with self._query_lock:
+            vector = self._query_cache.get(hash_value)
+            if vector is not None:
+                self._query_cache.move_to_end(hash_value)
+                self.memory_hits += 1
+                return vector
+
+        cached = self.cache.get_many(self.model_id, [hash_value]) if self.cache else {}
+        if hash_value in cached:
+            self.disk_hits += 1
+            vector = cached[hash_value].tolist()
+        else:
+            vector = self._model.embed_query(text)
+            self.computed += 1
+            if self.cache:
+                self.cache.put_many(self.model_id, [(hash_value, vector)])
+
+        with self._query_lock:
+            self._query_cache[hash_value] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_queries(self, texts):
+        """
+        embed_query() for many queries at once: the ones not in the query LRU are embedded in batched
+        forward passes (through the disk cache) instead of one pass each, and kept in the LRU, so later
+        embed_query() calls for them are memory hits.
+        """
+        hashes = [text_hash(t) for t in texts]
+        found = {}
+        with self._query_lock:
+            for hash_value in hashes:
+                vector = self._query_cache.get(hash_value)
+                if vector is not None:
+                    self._query_cache.move_to_end(hash_value)
+                    self.memory_hits += 1
+                    found[hash_value] = vector
+
+        missing = {}
+        for text, hash_value in zip(texts, hashes):
+            if hash_value not in found:
+                missing.setdefault(hash_value, text)
+        if missing:
+            vectors = self.embed_documents(list(missing.values()))
+            with self._query_lock:
+                for hash_value, vector in zip(missing, vectors):
+                    found[hash_value] = self._query_cache[hash_value] = vector
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return [found[h] for h in hashes]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_id,
+            "backend": self.backend,
+            "batch_size": self.batch_size,
+            "computed": self.computed,
+            "disk_hits": self.disk_hits,
+            "memory_hits": self.memory_hits,
+        }
+
+
+def export_model(output_dir, model_name=EMBEDDINGS_MODEL_NAME, backend=EMBEDDING_BACKEND):
+    """
+    Writes a self-contained copy of the embedding model to output_dir, so servers load it from local
+    disk instead of resolving it through the Hugging Face hub. For onnx-int8 the dynamically quantized
+    graph is written next to it under the file name the service expects.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu", backend="onnx" if backend.startswith("onnx") else "torch")
+    model.save(output_dir)
+    if backend == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        export_dynamic_quantized_onnx_model(model, "avx2", output_dir)
+    print(f"Saved {model_name} ({backend}) to {output_dir}. Set ALEKS_EMBEDDING_MODEL_PATH={output_dir} to use it.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a local copy of the embedding model.")
+    parser.add_argument("--export", required=True, metavar="DIR", help="Directory to write the model to.")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=["torch", "onnx", "onnx-int8"])
+    args = parser.parse_args()
+    export_model(args.export, backend=args.backend)
@@ -0,0 +1,123 @@
+# hybrid_retriever.py
+import os
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+import telemetry
+from vector_index import similarity_search_many
+
+# --- Retrieval Configuration ---
+# "hybrid" fuses BM25 and vector results, "vector" is the plain Chroma similarity search.
+RETRIEVAL_MODE = os.getenv("ALEKS_RETRIEVAL_MODE", "hybrid").lower()
+# Chunks handed to the LLM. Hybrid retrieval is precise enough to send fewer than the old k=4.
+RETRIEVAL_K = int(os.getenv("ALEKS_RETRIEVAL_K", "3"))
+# Candidates taken from each ranker before fusion.
+RETRIEVAL_CANDIDATES = int(os.getenv("ALEKS_RETRIEVAL_CANDIDATES", "10"))
+# Reciprocal rank fusion constant; larger values flatten the difference between ranks.
+RRF_K = 60
+
+
+def source_filter(sources):
+    """Chroma metadata filter restricting a search to the given source PDFs (None = no restriction)."""
+    if not sources:
+        return None
+    if len(sources) == 1:
+        return {"source": next(iter(sources))}
+    return {"source": {"$in": sorted(sources)}}
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retriever that combines three signals:
+
+    1. Citation lookup: chunks whose provision heading matches an "Article N" / "Section N" in the query
+       (restricted to the named law, if any) always come first.
+    2. BM25 keyword search over the in-process index.
+    3. Chroma vector similarity search, filtered to the named law, if any.
+
+    The BM25 and vector rankings are merged with reciprocal rank fusion and the top k chunks are returned.
+    Each returned document carries its fused score and the rankers that found it in its metadata.
+    """
+
+    vectorstore: Any
+    bm25: Any
+    k: int = RETRIEVAL_K
+    candidates: int = RETRIEVAL_CANDIDATES
+    rrf_k: int = RRF_K
+
+    def _keyword_hits(self, query):
+        """Citation and BM25 hits for the query, and the laws it names (restricting the vector search too)."""
+        with telemetry.stage("bm25_search"):
+            # An explicitly cited provision outranks anything fusion can produce (max RRF sum is 2 / (rrf_k + 1)).
+            sources = self.bm25.sources_for_query(query)
+            citation_hits = self.bm25.lookup_citations(query, sources)[:self.k]
+            bm25_hits = self.bm25.search(query, k=self.candidates, sources=sources)
+        return citation_hits, bm25_hits, sources
+
+    def _fuse(self, citation_hits, bm25_hits, vector_hits):
+        fused = {}  # chunk_id -> {"score", "found_by", "document"}
+
+        def add(chunk_id, score, ranker, document=None):
+            entry = fused.setdefault(chunk_id, {"score": 0.0, "found_by": [], "document": document})
+            entry["score"] += score
+            entry["found_by"].append(ranker)
+            if entry["document"] is None:
+                entry["document"] = document
+
+        for chunk_id in citation_hits:
+            add(chunk_id, 1.0, "citation")
+        for rank, (chunk_id, _) in enumerate(bm25_hits):
+            add(chunk_id, 1.0 / (self.rrf_k + rank + 1), "bm25")
+        for rank, document in enumerate(vector_hits):
+            if document.id is None:
+                continue
+            add(document.id, 1.0 / (self.rrf_k + rank + 1), "vector", document)
+
+        ranked = sorted(fused.items(), key=lambda item: item[1]["score"], reverse=True)[:self.k]
+        results = []
+        for chunk_id, entry in ranked:
+            document = entry["document"]
+            if document is None:
+                stored = self.bm25.get(chunk_id)
+                if stored is None:
+                    continue
+                document = Document(id=chunk_id, page_content=stored["text"], metadata=dict(stored["metadata"]))
+            else:
+                # Search results can be shared between queries of a batch; the scores are per query
+                document = Document(id=chunk_id, page_content=document.page_content, metadata=dict(document.metadata))
+            document.metadata["relevance"] = round(entry["score"], 6)
+            document.metadata["found_by"] = "+".join(entry["found_by"])
+            results.append(document)
+        return results
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        citation_hits, bm25_hits, sources = self._keyword_hits(query)
+        # Embedded separately from the search so the two show up as their own stages
+        with telemetry.stage("embed_query"):
+            query_vector = self.vectorstore.embeddings.embed_query(query)
+        with telemetry.stage("vector_search"):
+            # When the query names a law, Chroma only searches that law's chunks
+            vector_hits = self.vectorstore.similarity_search_by_vector(query_vector, k=self.candidates, filter=source_filter(sources))
+        return self._fuse(citation_hits, bm25_hits, vector_hits)
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        """
+        invoke() for a batch of queries, in order: the queries are embedded in one batched call and
+        searched together (vector_index.similarity_search_many), so chunks found by several queries
+        are fetched once.
+        """
+        keyword_hits = [self._keyword_hits(query) for query in queries]
+        embeddings = self.vectorstore.embeddings
+        with telemetry.stage("embed_query"):
+            if hasattr(embeddings, "embed_queries"):
+                query_vectors = embeddings.embed_queries(queries)
+            else:
+                query_vectors = [embeddings.embed_query(query) for query in queries]
+        with telemetry.stage("vector_search"):
+            vector_hits = similarity_search_many(self.vectorstore, query_vectors, k=self.candidates,
+                                                 filters=[source_filter(sources) for _, _, sources in keyword_hits])
+        return [self._fuse(citation_hits, bm25_hits, hits)
+                for (citation_hits, bm25_hits, _), hits in zip(keyword_hits, vector_hits)]
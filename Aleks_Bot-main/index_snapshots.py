@@ -0,0 +1,295 @@
+# index_snapshots.py
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from vector_index import close_store
+
+# --- Index Snapshot Configuration ---
+# Directory of versioned, read-only index snapshots written by vector_db_creator.py. Empty = a single
+# database at ALEKS_CHROMA_DB_DIR, updated in place (restart the API after ingesting).
+INDEX_SNAPSHOT_ROOT = os.getenv("ALEKS_INDEX_SNAPSHOT_ROOT", "")
+# Published snapshots kept on disk, the live one included; older ones are deleted after each ingestion
+# run (0 = keep all).
+INDEX_SNAPSHOT_KEEP = int(os.getenv("ALEKS_INDEX_SNAPSHOT_KEEP", "3"))
+# How often (seconds) a running API checks CURRENT and swaps to a newly published snapshot
+# (0 = only on SIGHUP or POST /api/admin/index/reload).
+INDEX_SNAPSHOT_WATCH_SECONDS = float(os.getenv("ALEKS_INDEX_SNAPSHOT_WATCH_SECONDS", "10"))
+
+# Question run through retrieval once at startup and before a new snapshot goes live, so the first
+# requests on it do not pay for loading its index.
+WARMUP_QUERY = "What are the rights of an employee under the Labor Code?"
+
+CURRENT_FILENAME = "CURRENT"
+SNAPSHOTS_DIRNAME = "snapshots"
+BUILDING_PREFIX = ".building-"
+
+
+class SnapshotStore:
+    """
+    Versioned databases under one root directory:
+
+        root/CURRENT             name of the snapshot the API serves
+        root/snapshots/<name>/   one complete database each: Chroma, BM25 index, ingestion manifest,
+                                 corpus fingerprint and (flat/ivf) quantized index
+
+    A snapshot is never modified after it is published. Ingestion copies the live snapshot, updates the
+    copy and publishes it, and publishing only rewrites CURRENT (atomically), so a reader always sees
+    either the old or the new version, never a half-written one.
+    """
+
+    def __init__(self, root=INDEX_SNAPSHOT_ROOT):
+        if not root:
+            raise ValueError("No snapshot root configured (ALEKS_INDEX_SNAPSHOT_ROOT).")
+        self.root = root
+        self.snapshots_dir = os.path.join(root, SNAPSHOTS_DIRNAME)
+
+    def path(self, name):
+        return os.path.join(self.snapshots_dir, name)
+
+    def current(self):
+        """Name of the live snapshot, or None if none was published yet."""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILENAME), 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self):
+        """Published snapshot names, oldest first (names start with their publication time)."""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name for name in os.listdir(self.snapshots_dir)
+                      if not name.startswith(BUILDING_PREFIX) and os.path.isdir(self.path(name)))
+
+    def begin(self):
+        """
+        Creates the working directory of a new snapshot, starting as a copy of the live one (so ingestion
+        only embeds what changed), and returns its path.
+        """
+        building = self.path(f"{BUILDING_PREFIX}{os.getpid()}-{int(time.time())}")
+        live = self.current()
+        if live is not None:
+            shutil.copytree(self.path(live), building)
+        else:
+            os.makedirs(building)
+        return building
+
+    def discard(self, building):
+        shutil.rmtree(building, ignore_errors=True)
+
+    def publish(self, building, fingerprint):
+        """Moves a finished working directory into place under a new name and makes it CURRENT."""
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{fingerprint[:12]}"
+        os.rename(building, self.path(name))
+        self.set_current(name)
+        return name
+
+    def set_current(self, name):
+        """Points CURRENT at a published snapshot (also how a rollback is done)."""
+        if name not in self.versions():
+            raise FileNotFoundError(f"No index snapshot '{name}' in {self.snapshots_dir}.")
+        path = os.path.join(self.root, CURRENT_FILENAME)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(name + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def prune(self, keep=INDEX_SNAPSHOT_KEEP):
+        """
+        Deletes the oldest snapshots beyond keep, never the current one. A snapshot a process still has
+        open can't be deleted on Windows; it is left for the next run. Returns the deleted names.
+        """
+        if keep <= 0:
+            return []
+        current = self.current()
+        removed = []
+        for name in self.versions()[:-keep]:
+            if name == current:
+                continue
+            try:
+                shutil.rmtree(self.path(name))
+                removed.append(name)
+            except OSError as e:
+                print(f"Could not delete index snapshot '{name}' yet: {e}")
+        return removed
+
+
+class IndexGeneration:
+    """
+    One opened snapshot and the number of retrievals running on it. Once retired (replaced by a
+    newer generation), it is closed as soon as its last retrieval finishes.
+    """
+
+    def __init__(self, version, path, retriever):
+        self.version = version
+        self.path = path
+        self.retriever = retriever
+        self.opened_at = time.time()
+        self.closed = False
+        self._refs = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self):
+        return self._refs
+
+    def acquire(self):
+        with self._lock:
+            self._refs += 1
+
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            close = self._retired and self._refs == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self._retired = True
+            close = self._refs == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        # Stops the Chroma instance of this snapshot, freeing its HNSW graph and file handles;
+        # the BM25 and quantized indexes go with the retriever
+        self.retriever = None
+        close_store(self.path)
+        self.closed = True
+        print(f"Closed index snapshot '{self.version}'.")
+
+
+class LiveIndex:
+    """
+    The snapshot generation retrieval runs on, swappable while requests are served. swap() opens and
+    warms the new snapshot first, then replaces the live generation in one step; retrievals already
+    running finish on the generation they started on.
+    """
+
+    def __init__(self, generation, store, opener):
+        self.store = store
+        self.opener = opener  # version -> IndexGeneration
+        self.generation = generation
+        self.swaps = 0
+        self.last_swap_s = None
+        self._retired = []
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.generation.version
+
+    @property
+    def path(self):
+        return self.generation.path
+
+    def acquire(self):
+        """The live generation, pinned until its release() is called."""
+        with self._lock:
+            generation = self.generation
+            generation.acquire()
+        return generation
+
+    def swap(self, version=None):
+        """
+        Makes version (default: the one CURRENT names) live. Does nothing if it already is. Returns
+        {"version", "previous", "path", "swapped", "seconds"}.
+        """
+        with self._swap_lock:
+            version = version or self.store.current()
+            previous = self.generation.version
+            if version is None or version == previous:
+                return {"version": previous, "previous": previous, "path": self.path, "swapped": False, "seconds": 0.0}
+            started = time.perf_counter()
+            self._wait_closed(version)
+            generation = self.opener(version)
+            generation.retriever.invoke(WARMUP_QUERY)
+            with self._lock:
+                old, self.generation = self.generation, generation
+            self._retired = [g for g in self._retired if not g.closed] + [old]
+            old.retire()
+            self.swaps += 1
+            self.last_swap_s = round(time.perf_counter() - started, 2)
+            print(f"Index snapshot '{version}' is live (was '{previous}', ready in {self.last_swap_s}s).")
+            return {"version": version, "previous": previous, "path": generation.path, "swapped": True,
+                    "seconds": self.last_swap_s}
+
+    @property
+    def draining(self):
+        """Replaced generations still finishing retrievals: {version: retrievals running}."""
+        return {g.version: g.in_flight for g in self._retired if not g.closed}
+
+    def _wait_closed(self, version, timeout=30.0):
+        # Chroma keeps one instance per directory, which closing the draining generation of a version
+        # would take away from a newly opened one (a rollback to it right after a swap)
+        deadline = time.monotonic() + timeout
+        while any(g.version == version and not g.closed for g in self._retired):
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Index snapshot '{version}' is still finishing retrievals from before the last swap.")
+            time.sleep(0.05)
+
+    def status(self) -> dict:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "current": self.store.current(),
+            "in_flight": self.generation.in_flight,
+            "swaps": self.swaps,
+            "last_swap_s": self.last_swap_s,
+            "draining": self.draining,
+            "available": self.store.versions(),
+        }
+
+
+class LiveIndexRetriever(BaseRetriever):
+    """Retriever over a LiveIndex: each retrieval runs entirely on the generation live when it starts."""
+
+    index: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        generation = self.index.acquire()
+        try:
+            return generation.retriever.invoke(query)
+        finally:
+            generation.release()
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        generation = self.index.acquire()
+        try:
+            if hasattr(generation.retriever, "retrieve_many"):
+                return generation.retriever.retrieve_many(queries)
+            return generation.retriever.batch(queries)
+        finally:
+            generation.release()
+
+
+def watch_snapshots(reload, interval=INDEX_SNAPSHOT_WATCH_SECONDS):
+    """
+    Calls reload() every interval seconds in a background thread, so a process picks up snapshots
+    published while it runs. Returns an Event that stops the thread.
+    """
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            try:
+                reload()
+            except Exception as e:
+                print(f"Could not switch to the current index snapshot: {e}")
+
+    if interval > 0:
+        threading.Thread(target=run, name="aleks-index-watch", daemon=True).start()
+    return stop
@@ -0,0 +1,156 @@
+# intent_router.py
+import os
+import re
+import time
+
+import numpy as np
+
+from document_manager import DOCUMENT_TEMPLATES, TEMPLATE_EXAMPLES
+
+# --- Intent Router Configuration ---
+# "tiered" runs keyword -> embedding -> LLM fallback, "llm" always asks the LLM (old behaviour).
+INTENT_ROUTER_MODE = os.getenv("ALEKS_INTENT_ROUTER_MODE", "tiered").lower()
+# Cosine similarity at or above which the embedding tier accepts a document request.
+INTENT_ACCEPT_THRESHOLD = float(os.getenv("ALEKS_INTENT_ACCEPT_THRESHOLD", "0.72"))
+# Cosine similarity below which the embedding tier confidently answers "NONE".
+INTENT_REJECT_THRESHOLD = float(os.getenv("ALEKS_INTENT_REJECT_THRESHOLD", "0.45"))
+# Whether low-confidence queries (between the two thresholds) may fall back to the LLM.
+INTENT_LLM_FALLBACK = os.getenv("ALEKS_INTENT_LLM_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+NO_DOCUMENT = "NONE"
+
+# Words that signal the user wants something produced, not explained. They only count at most
+# CUE_WINDOW words before a template alias ("draft an NDA"), so "what makes a contract void" or
+# "what form must an NDA take" are not requests.
+REQUEST_CUES = (
+    "need", "want", "draft", "create", "generate", "prepare", "write", "make me", "make a", "make an",
+    "give me", "send me", "get me", "fill out", "fill in", "template", "sample", "can you do",
+)
+# Words right after an alias that make it a request ("NDA template", "non-disclosure agreement form").
+DOCUMENT_NOUN_CUES = ("template", "form", "sample", "draft")
+CUE_WINDOW = 3
+# Messages opening like a question about the law ("Do I need to notarize an NDA?") are left to the
+# embedding tier even when they contain a cue; "Can you draft..." is still a request.
+QUESTION_START = re.compile(r"^\W*(what|why|how|when|where|who|which|is|are|am|do|does|did|should|must|may)\b", re.IGNORECASE)
+
+
+class IntentRouter:
+    """
+    Decides whether a chat message is a document-template request.
+
+    Tier 1 matches template aliases (the DOCUMENT_TEMPLATES keys) next to a request cue.
+    Tier 2 compares the query embedding against precomputed embeddings of TEMPLATE_EXAMPLES.
+    Tier 3 asks the LLM, only for queries the first two tiers are not confident about.
+    """
+
+    def __init__(self, embeddings=None, llm_classifier=None, mode=INTENT_ROUTER_MODE,
+                 accept_threshold=INTENT_ACCEPT_THRESHOLD, reject_threshold=INTENT_REJECT_THRESHOLD,
+                 llm_fallback=INTENT_LLM_FALLBACK):
+        self.embeddings = embeddings
+        self.llm_classifier = llm_classifier
+        self.mode = mode
+        self.accept_threshold = accept_threshold
+        self.reject_threshold = reject_threshold
+        self.llm_fallback = llm_fallback
+
+        # Longest aliases first so "non-disclosure agreement" wins over any shorter overlap.
+        aliases = sorted(DOCUMENT_TEMPLATES.keys(), key=len, reverse=True)
+        alias = "(" + "|".join(re.escape(a) for a in aliases) + r")s?\b"
+        cues = "|".join(re.escape(c) for c in REQUEST_CUES)
+        nouns = "|".join(re.escape(c) for c in DOCUMENT_NOUN_CUES)
+        self._request_patterns = (
+            re.compile(rf"\b(?:{cues})\b(?:\W+\w+){{0,{CUE_WINDOW}}}?\W+{alias}", re.IGNORECASE),
+            re.compile(rf"\b{alias}\W+(?:{nouns})\b", re.IGNORECASE),
+        )
+
+        self._example_keys = []
+        self._example_matrix = None
+        if self.embeddings is not None:
+            self._precompute_example_embeddings()
+
+    def _precompute_example_embeddings(self):
+        texts = []
+        for key, examples in TEMPLATE_EXAMPLES.items():
+            if key not in DOCUMENT_TEMPLATES:
+                continue
+            for example in examples:
+                self._example_keys.append(key)
+                texts.append(example)
+        if not texts:
+            return
+        matrix = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._example_matrix = matrix / np.clip(norms, 1e-12, None)
+
+    def _keyword_tier(self, query):
+        if QUESTION_START.match(query):
+            return None
+        for pattern in self._request_patterns:
+            match = pattern.search(query)
+            if match:
+                return match.group(1).lower()
+        # An alias without a request cue next to it ("what is an NDA?") is ambiguous, let the next tier decide.
+        return None
+
+    def _embedding_tier(self, query):
+        if self._example_matrix is None:
+            return None, 0.0
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        scores = self._example_matrix @ vector
+        best = int(np.argmax(scores))
+        return self._example_keys[best], float(scores[best])
+
+    def _llm_tier(self, query):
+        if self.llm_classifier is None:
+            return NO_DOCUMENT
+        detected_type = self.llm_classifier(query).strip().lower()
+        return detected_type if detected_type in DOCUMENT_TEMPLATES else NO_DOCUMENT
+
+    def route(self, query: str, use_llm: bool = True) -> dict:
+        """
+        Returns a dict with the detected document type (or "NONE"), the tier that decided it,
+        the similarity score when the embedding tier was consulted and the routing latency.
+
+        With use_llm=False the LLM tier is skipped: queries that would need it come back with
+        document_type None and tier "undecided", so the caller can schedule the LLM call itself.
+        """
+        start = time.perf_counter()
+        decision = {"document_type": NO_DOCUMENT, "tier": "llm", "score": None}
+
+        if self.mode == "llm" and not use_llm and self.llm_classifier is not None:
+            decision.update(document_type=None, tier="undecided")
+        elif self.mode == "llm":
+            decision["document_type"] = self._llm_tier(query)
+        else:
+            keyword_type = self._keyword_tier(query)
+            if keyword_type:
+                decision.update(document_type=keyword_type, tier="keyword")
+            else:
+                embedding_type, score = self._embedding_tier(query)
+                if embedding_type:
+                    decision["score"] = round(score, 4)
+                if embedding_type and score >= self.accept_threshold:
+                    decision.update(document_type=embedding_type, tier="embedding")
+                elif embedding_type and score < self.reject_threshold:
+                    decision.update(document_type=NO_DOCUMENT, tier="embedding")
+                elif not self.llm_fallback or self.llm_classifier is None:
+                    # Not confident, but the LLM tier is disabled: default to a normal legal question.
+                    decision.update(document_type=NO_DOCUMENT, tier="embedding" if embedding_type else "keyword")
+                elif not use_llm:
+                    decision.update(document_type=None, tier="undecided")
+                else:
+                    decision["document_type"] = self._llm_tier(query)
+
+        decision["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return decision
+
+    def resolve(self, query: str, decision: dict) -> dict:
+        """
+        Finishes an "undecided" decision of route(query, use_llm=False) with the LLM tier alone,
+        keeping the embedding score the cheap tiers already computed.
+        """
+        start = time.perf_counter()
+        decision = dict(decision, document_type=self._llm_tier(query), tier="llm")
+        decision["latency_ms"] = round(decision["latency_ms"] + (time.perf_counter() - start) * 1000, 2)
+        return decision
@@ -0,0 +1,467 @@
+# llm_backends.py
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import time
+from typing import Any, Iterator, List, Optional, Union
+
+import httpx
+import ollama
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import BaseLLM
+from langchain_core.outputs import GenerationChunk, LLMResult
+from pydantic import PrivateAttr
+
+# --- LLM Backend Configuration ---
+# "ollama" = one or more Ollama servers, "llamacpp" = in-process llama-cpp-python, "stub" = deterministic
+# fake for tests and benchmarks.
+LLM_BACKEND = os.getenv("ALEKS_LLM_BACKEND", "ollama").lower()
+LLM_TEMPERATURE = 0.1
+
+# --- Ollama Configuration ---
+OLLAMA_MODEL_NAME = os.getenv("ALEKS_OLLAMA_MODEL", "mistral")
+# Comma-separated Ollama servers; requests are spread over the healthy ones.
+OLLAMA_URLS = [url.strip().rstrip("/") for url in os.getenv("ALEKS_OLLAMA_URLS", "http://localhost:11434").split(",") if url.strip()]
+# "least-loaded" sends each request to the server with the fewest in flight, "round-robin" takes turns.
+OLLAMA_ROUTING = os.getenv("ALEKS_OLLAMA_ROUTING", "least-loaded").lower()
+# Keep-alive HTTP connections held open to each server.
+OLLAMA_POOL_SIZE = int(os.getenv("ALEKS_OLLAMA_POOL_SIZE", "8"))
+# Seconds between health checks of each server (0 = only mark servers down when a request fails).
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("ALEKS_OLLAMA_HEALTH_INTERVAL", "10"))
+# How long Ollama keeps the model in memory after each request: seconds (-1 = until Ollama stops) or a duration like "30m".
+OLLAMA_KEEP_ALIVE = os.getenv("ALEKS_OLLAMA_KEEP_ALIVE", "-1")
+if OLLAMA_KEEP_ALIVE.lstrip("-").isdigit():
+    OLLAMA_KEEP_ALIVE = int(OLLAMA_KEEP_ALIVE)
+# A server that doesn't accept the connection within this many seconds is failed over.
+OLLAMA_CONNECT_TIMEOUT = 5.0
+# Longest wait for the next chunk of a response (prompt evaluation comes before the first one).
+OLLAMA_READ_TIMEOUT = 300.0
+
+# --- llama.cpp Configuration ---
+LLAMACPP_MODEL_PATH = os.getenv("ALEKS_LLAMACPP_MODEL_PATH", "")
+LLAMACPP_CONTEXT = int(os.getenv("ALEKS_LLAMACPP_CONTEXT", "4096"))
+LLAMACPP_THREADS = int(os.getenv("ALEKS_LLAMACPP_THREADS", "0"))
+LLAMACPP_GPU_LAYERS = int(os.getenv("ALEKS_LLAMACPP_GPU_LAYERS", "0"))
+LLAMACPP_MAX_TOKENS = int(os.getenv("ALEKS_LLAMACPP_MAX_TOKENS", "512"))
+# RAM for saved KV states. A prompt starting like an earlier one (the fixed instructions) restores
+# that state instead of evaluating the shared prefix again. 0 = only reuse the previous prompt's prefix.
+LLAMACPP_PROMPT_CACHE_MB = int(os.getenv("ALEKS_LLAMACPP_PROMPT_CACHE_MB", "512"))
+
+# --- Stub Configuration ---
+# Simulated generation time per answer, split between "prompt evaluation" and the streamed tokens.
+STUB_LLM_MS = float(os.getenv("ALEKS_STUB_LLM_MS", "0"))
+
+
+def _timing_info(prompt_tokens, completion_tokens, started, first_token_at, finished):
+    """Final-chunk generation_info in Ollama's format, so GenerationStatsHandler reads every backend alike."""
+    first_token_at = first_token_at or finished
+    return {
+        "done": True,
+        "prompt_eval_count": prompt_tokens,
+        "prompt_eval_duration": int((first_token_at - started) * 1e9),
+        "eval_count": completion_tokens,
+        "eval_duration": int((finished - first_token_at) * 1e9),
+    }
+
+
+class StreamingLLM(BaseLLM):
+    """
+    Base for the backends: each one only implements _stream, and invoke() aggregates the streamed
+    chunks, so both paths produce the same final generation_info.
+
+    temperature and max_tokens can be passed to invoke()/stream() to override them for that call
+    only, e.g. llm.invoke(prompt, temperature=0.3, max_tokens=16); the shared instance never changes.
+    """
+
+    temperature: float = LLM_TEMPERATURE
+    # None = the backend's default length limit
+    max_tokens: Optional[int] = None
+
+    def _options(self, kwargs):
+        """(temperature, max_tokens) for one call: the call's own values, else the instance's."""
+        temperature = kwargs.get("temperature")
+        max_tokens = kwargs.get("max_tokens")
+        return (self.temperature if temperature is None else temperature,
+                self.max_tokens if max_tokens is None else max_tokens)
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> LLMResult:
+        generations = []
+        for prompt in prompts:
+            final = None
+            for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                final = chunk if final is None else final + chunk
+            generations.append([final or GenerationChunk(text="")])
+        return LLMResult(generations=generations)
+
+    def warm(self, prefixes=()) -> dict:
+        """
+        Loads the model so the first request doesn't pay for it, and evaluates the fixed prompt
+        prefixes so they are already in the KV cache. Returns details for /readyz.
+        """
+        return {}
+
+    def stats(self) -> dict:
+        return {"backend": self._llm_type}
+
+    def close(self):
+        pass
+
+
+class OllamaEndpoint:
+    """
+    One Ollama server: a client with a pool of keep-alive connections, plus its load and health.
+    The counters and healthy flag are updated under the OllamaPool's lock.
+    """
+
+    def __init__(self, url, pool_size=OLLAMA_POOL_SIZE):
+        self.url = url
+        # Our own transport holds the connection pool, so close() can release it
+        self.transport = httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+        self.client = ollama.Client(
+            host=url,
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            transport=self.transport,
+        )
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.total_s = 0.0
+        self.last_error = None
+
+    def probe(self):
+        """Cheap liveness probe (lists the loaded models). Returns the error, or None if the server answered."""
+        try:
+            self.client.ps()
+            return None
+        except Exception as e:
+            return e
+
+    def close(self):
+        self.transport.close()
+
+    def stats(self):
+        completed = self.requests - self.in_flight
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "avg_ms": round(self.total_s / completed * 1000, 1) if completed else None,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool(StreamingLLM):
+    """
+    Generation over one or more Ollama servers (ALEKS_OLLAMA_URLS).
+
+    Each request goes to the least-loaded (or next, with round-robin routing) healthy server over a
+    pooled keep-alive connection. A server that refuses or fails a request before its first token is
+    marked down and the request is retried on the next one; a background thread re-checks every
+    server each health interval so recovered ones rejoin. Once tokens have been streamed, a failure
+    is raised to the caller rather than restarting the answer elsewhere.
+    """
+
+    model: str = OLLAMA_MODEL_NAME
+    urls: List[str] = OLLAMA_URLS
+    routing: str = OLLAMA_ROUTING
+    pool_size: int = OLLAMA_POOL_SIZE
+    health_interval: float = OLLAMA_HEALTH_INTERVAL
+    keep_alive: Optional[Union[int, str]] = OLLAMA_KEEP_ALIVE
+
+    _endpoints: list = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _turns: Any = PrivateAttr(default_factory=itertools.count)
+    _stop_event: Any = PrivateAttr(default_factory=threading.Event)
+    _health_thread: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, context: Any) -> None:
+        super().model_post_init(context)
+        if not self.urls:
+            raise ValueError("ALEKS_OLLAMA_URLS doesn't list any server.")
+        self._endpoints = [OllamaEndpoint(url, self.pool_size) for url in self.urls]
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama"
+
+    def _start_health_checks(self):
+        if self.health_interval <= 0 or self._health_thread is not None:
+            return
+        self._health_thread = threading.Thread(target=self._health_loop, name="aleks-ollama-health", daemon=True)
+        self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop_event.wait(self.health_interval):
+            for endpoint in self._endpoints:
+                error = endpoint.probe()
+                if self._mark(endpoint, error) != (error is None):
+                    print(f"Ollama at {endpoint.url} is {'back up' if error is None else 'down'}.")
+
+    def _mark(self, endpoint, error=None):
+        """Marks a server up (error None) or down; returns whether it was up before."""
+        with self._lock:
+            was_healthy = endpoint.healthy
+            endpoint.healthy = error is None
+            if error is not None:
+                endpoint.last_error = str(error)
+            return was_healthy
+
+    def _acquire(self, tried):
+        """Picks the server for the next attempt (healthy ones first), or None once every server was tried."""
+        with self._lock:
+            if self._health_thread is None:
+                self._start_health_checks()
+            untried = [endpoint for endpoint in self._endpoints if endpoint not in tried]
+            candidates = [endpoint for endpoint in untried if endpoint.healthy] or untried
+            if not candidates:
+                return None
+            # Rotating the start spreads ties (and is the whole of round-robin)
+            offset = next(self._turns) % len(candidates)
+            candidates = candidates[offset:] + candidates[:offset]
+            endpoint = min(candidates, key=lambda e: e.in_flight) if self.routing == "least-loaded" else candidates[0]
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint, started, error=None, down=False):
+        """Ends a request on endpoint; down marks the server down (it failed before answering)."""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.total_s += time.perf_counter() - started
+            if error is None:
+                endpoint.healthy = True
+            else:
+                endpoint.failures += 1
+                endpoint.last_error = str(error)
+                if down:
+                    endpoint.healthy = False
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        temperature, max_tokens = self._options(kwargs)
+        options = {"temperature": temperature}
+        if max_tokens:
+            options["num_predict"] = max_tokens
+        if stop:
+            options["stop"] = stop
+        tried, last_error = [], None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            started = time.perf_counter()
+            try:
+                parts = endpoint.client.generate(model=self.model, prompt=prompt, stream=True,
+                                                 keep_alive=self.keep_alive, options=options)
+                # Connection errors and a missing model surface on the first part
+                first = next(parts, None)
+                break
+            except Exception as e:
+                self._release(endpoint, started, e, down=True)
+                last_error = e
+                print(f"Ollama at {endpoint.url} failed ({e}); trying the next server.")
+
+        error = None
+        try:
+            for part in itertools.chain([first] if first is not None else [], parts):
+                chunk = GenerationChunk(text=part.get("response") or "",
+                                        generation_info=dict(part) if part.get("done") else None)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            parts.close()
+            self._release(endpoint, started, error)
+
+    def warm(self, prefixes=()) -> dict:
+        """
+        Loads the model on every server (an empty prompt loads it without generating), then has each
+        server evaluate the prefixes so its KV cache holds them. Fails only if none answers.
+        """
+        load_ms, errors = [], []
+        for endpoint in self._endpoints:
+            try:
+                response = endpoint.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+                self._mark(endpoint)
+                load_ms.append(round((response.get("load_duration") or 0) / 1e6, 1))
+                # Same options as real requests: Ollama reloads the model when the context size changes
+                for prefix in prefixes:
+                    endpoint.client.generate(model=self.model, prompt=prefix, keep_alive=self.keep_alive,
+                                             options={"temperature": self.temperature, "num_predict": 1})
+            except Exception as e:
+                self._mark(endpoint, e)
+                errors.append(f"{endpoint.url}: {e}")
+        if not load_ms:
+            raise ConnectionError("; ".join(errors))
+        for error in errors:
+            print(f"Ollama server not ready, continuing without it for now ({error}).")
+        return {"backend": "ollama", "model": self.model, "keep_alive": self.keep_alive,
+                "servers": len(self._endpoints), "servers_up": len(load_ms), "ollama_load_ms": max(load_ms)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            servers = [endpoint.stats() for endpoint in self._endpoints]
+        return {"backend": "ollama", "model": self.model, "routing": self.routing, "pool_size": self.pool_size,
+                "servers": servers}
+
+    def close(self):
+        self._stop_event.set()
+        for endpoint in self._endpoints:
+            endpoint.close()
+
+
+class LlamaCppLLM(StreamingLLM):
+    """
+    In-process generation with llama-cpp-python from a GGUF file (ALEKS_LLAMACPP_MODEL_PATH), for
+    single-box deployments without an Ollama server. One model context generates one answer at a
+    time, so concurrent requests wait for each other here (keep ALEKS_LLM_MAX_IN_FLIGHT at 1).
+    Generation runs in its own thread and queues its tokens, so the model is free for the next
+    request as soon as an answer is generated, however slowly the client reads it.
+    """
+
+    model_path: str = LLAMACPP_MODEL_PATH
+    n_ctx: int = LLAMACPP_CONTEXT
+    n_threads: int = LLAMACPP_THREADS
+    n_gpu_layers: int = LLAMACPP_GPU_LAYERS
+    max_tokens: Optional[int] = LLAMACPP_MAX_TOKENS
+    prompt_cache_mb: int = LLAMACPP_PROMPT_CACHE_MB
+
+    _model: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "llamacpp"
+
+    def _load(self):
+        if self._model is None:
+            if not self.model_path:
+                raise ValueError("Set ALEKS_LLAMACPP_MODEL_PATH to a GGUF model file to use the llamacpp backend.")
+            try:
+                from llama_cpp import Llama, LlamaRAMCache
+            except ImportError as e:
+                raise ImportError("The llamacpp backend needs llama-cpp-python: pip install llama-cpp-python") from e
+            model = Llama(model_path=self.model_path, n_ctx=self.n_ctx, n_threads=self.n_threads or None,
+                          n_gpu_layers=self.n_gpu_layers, verbose=False)
+            if self.prompt_cache_mb > 0:
+                model.set_cache(LlamaRAMCache(capacity_bytes=self.prompt_cache_mb << 20))
+            self._model = model
+        return self._model
+
+    def _generate_into(self, tokens, cancelled, prompt, stop, temperature, max_tokens):
+        """Generates one answer holding the model, putting ("token", text), then ("done", info) or ("error", e) on tokens."""
+        try:
+            with self._lock:
+                model = self._load()
+                started = time.perf_counter()
+                prompt_tokens = len(model.tokenize(prompt.encode("utf-8")))
+                first_token_at, completion_tokens = None, 0
+                for part in model(prompt, max_tokens=max_tokens, temperature=temperature, stop=stop or [], stream=True):
+                    if cancelled.is_set():  # the caller stopped reading
+                        break
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    completion_tokens += 1
+                    tokens.put(("token", part["choices"][0]["text"]))
+                finished = time.perf_counter()
+            tokens.put(("done", _timing_info(prompt_tokens, completion_tokens, started, first_token_at, finished)))
+        except Exception as e:
+            tokens.put(("error", e))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        temperature, max_tokens = self._options(kwargs)
+        tokens, cancelled = queue.Queue(), threading.Event()
+        threading.Thread(target=self._generate_into, args=(tokens, cancelled, prompt, stop, temperature, max_tokens),
+                         name="aleks-llamacpp", daemon=True).start()
+        try:
+            while True:
+                kind, value = tokens.get()
+                if kind == "error":
+                    raise value
+                if kind == "done":
+                    yield GenerationChunk(text="", generation_info=value)
+                    return
+                chunk = GenerationChunk(text=value)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+        finally:
+            cancelled.set()
+
+    def warm(self, prefixes=()) -> dict:
+        started = time.perf_counter()
+        with self._lock:
+            model = self._load()
+            # Each completion saves its KV state to the prompt cache, keyed by its tokens
+            for prefix in prefixes:
+                model(prefix, max_tokens=1, temperature=self.temperature)
+        return {"backend": "llamacpp", "model": os.path.basename(self.model_path),
+                "load_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    def stats(self) -> dict:
+        cache = self._model.cache if self._model is not None else None
+        return {"backend": "llamacpp", "model_path": self.model_path, "n_ctx": self.n_ctx, "loaded": self._model is not None,
+                "prompt_cache_mb": round(cache.cache_size / 2 ** 20, 1) if cache is not None else 0}
+
+
+class StubLLM(StreamingLLM):
+    """
+    Deterministic stand-in for tests and benchmarks: the same prompt always gets the same answer
+    (a hash of the prompt followed by its first words), streamed word by word after delay_ms.
+    """
+
+    delay_ms: float = STUB_LLM_MS
+    answer_words: int = 40
+
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        self._calls += 1
+        started = time.perf_counter()
+        _, max_tokens = self._options(kwargs)
+        answer_words = min(self.answer_words, max_tokens) if max_tokens else self.answer_words
+        words = [f"[stub {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}]", *prompt.split()[:answer_words - 1]]
+        time.sleep(self.delay_ms / 2000)
+        first_token_at = time.perf_counter()
+        for i, word in enumerate(words):
+            chunk = GenerationChunk(text=word if i == 0 else f" {word}")
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+            time.sleep(self.delay_ms / 2000 / len(words))
+        yield GenerationChunk(text="", generation_info=_timing_info(
+            len(prompt.split()), len(words), started, first_token_at, time.perf_counter()))
+
+    def warm(self, prefixes=()) -> dict:
+        return {"backend": "stub", "delay_ms": self.delay_ms}
+
+    def stats(self) -> dict:
+        return {"backend": "stub", "delay_ms": self.delay_ms, "calls": self._calls}
+
+
+def create_llm(backend=LLM_BACKEND):
+    """Builds the generation backend selected by ALEKS_LLM_BACKEND."""
+    if backend == "ollama":
+        return OllamaPool()
+    if backend == "llamacpp":
+        return LlamaCppLLM()
+    if backend == "stub":
+        return StubLLM()
+    raise ValueError(f"Unknown ALEKS_LLM_BACKEND '{backend}' (expected ollama, llamacpp or stub).")
@@ -0,0 +1,125 @@
+# llm_scheduler.py
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+# --- Scheduler Configuration ---
+# Maximum number of blocking LLM/retrieval calls running at once (match Ollama's OLLAMA_NUM_PARALLEL).
+LLM_MAX_IN_FLIGHT = int(os.getenv("ALEKS_LLM_MAX_IN_FLIGHT", "2"))
+# Maximum number of requests allowed to wait for a slot before new ones are rejected with 429.
+LLM_MAX_QUEUE = int(os.getenv("ALEKS_LLM_MAX_QUEUE", "32"))
+# Seconds a request may wait in the queue for a slot.
+LLM_QUEUE_TIMEOUT = float(os.getenv("ALEKS_LLM_QUEUE_TIMEOUT", "30"))
+# Seconds a single call may run once it has a slot.
+LLM_REQUEST_TIMEOUT = float(os.getenv("ALEKS_LLM_REQUEST_TIMEOUT", "120"))
+
+
+class SchedulerBusy(Exception):
+    """Raised when the wait queue is full. Carries a rough retry hint for the 429 response."""
+
+    def __init__(self, queue_depth, retry_after):
+        super().__init__(f"LLM queue is full ({queue_depth} requests waiting).")
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waited too long for a slot or its call ran past the request timeout."""
+
+
+class LLMScheduler:
+    """
+    Admission-controlled gateway for blocking Ollama work.
+
+    Calls run on a dedicated thread pool sized to the in-flight limit, so they never block the event loop.
+    Requests beyond the limit wait in a bounded FIFO queue; once the queue is full, new requests are
+    rejected immediately instead of piling up. A slot is only released when the underlying call has
+    actually finished, even if the request that started it timed out.
+    """
+
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, max_queue=LLM_MAX_QUEUE,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, request_timeout=LLM_REQUEST_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="aleks-llm")
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._waiting = 0
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._total_service_s = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+        }
+
+    def _retry_after(self):
+        # Estimate how long the current queue takes to drain, from the average service time so far.
+        average = self._total_service_s / self._completed if self._completed else 5.0
+        return max(1, int(average * (self._waiting + 1) / self.max_in_flight))
+
+    async def _admit(self):
+        if self._semaphore.locked() and self._waiting >= self.max_queue:
+            self._rejected += 1
+            raise SchedulerBusy(self._waiting, self._retry_after())
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise SchedulerTimeout(f"Waited more than {self.queue_timeout:.0f}s for an LLM slot.")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def _release(self, service_s=0.0):
+        self._in_flight -= 1
+        self._completed += 1
+        self._total_service_s += service_s
+        self._semaphore.release()
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """
+        Runs the blocking callable fn(*args, **kwargs) on the scheduler's thread pool and returns its result.
+        Raises SchedulerBusy when the queue is full and SchedulerTimeout when a timeout expires.
+        The call runs in a copy of the caller's context, so it is attributed to the caller's request.
+        """
+        queued = time.perf_counter()
+        await self._admit()
+        telemetry.record_stage("queue_wait", time.perf_counter() - queued)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(self._executor, functools.partial(context.run, fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+
+        def _on_done(done_future):
+            if not done_future.cancelled():
+                done_future.exception()  # mark as retrieved so abandoned failures are not logged as unhandled
+            self._release(loop.time() - started)
+
+        future.add_done_callback(_on_done)
+        try:
+            # shield() keeps the slot accounted for until the worker thread really finishes.
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.request_timeout)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            raise SchedulerTimeout(f"LLM call exceeded {timeout or self.request_timeout:.0f}s.")
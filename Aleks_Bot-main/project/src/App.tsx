@@ -9,10 +9,11 @@ interface Message {
   text: string;
   type: 'text' | 'document_request' | 'document_generated';
   additionalData?: {
-    sources?: Array<{ source: string; startIndex: string; snippet: string }>;
+    sources?: Array<{ source: string; citation?: string; pages?: string; startIndex: string; snippet: string }>;
     documentType?: string;
     placeholdersToFill?: Array<{ name: string; description: string }>;
     generatedDocumentPreview?: string;
+    timing?: { timeToFirstTokenMs: number; totalMs: number };
   };
 }
 
@@ -38,6 +39,8 @@ function App() {
   const [currentDocumentType, setCurrentDocumentType] = useState('');
   const [currentPlaceholders, setCurrentPlaceholders] = useState<Placeholder[]>([]);
 
+  // Identifies this conversation to the server, which keeps its history for follow-up questions
+  const sessionIdRef = useRef<string>(crypto.randomUUID());
   const chatMessagesRef = useRef<HTMLDivElement>(null);
   const userInputRef = useRef<HTMLTextAreaElement>(null);
   const documentFillFormRef = useRef<HTMLFormElement>(null);
@@ -62,6 +65,77 @@ function App() {
     setMessages(prevMessages => [...prevMessages, message]);
   };
 
+  // Updates the last message in place (used while an answer is streaming in)
+  const updateLastMessage = (update: (message: Message) => Message) => {
+    setMessages(prevMessages => [...prevMessages.slice(0, -1), update(prevMessages[prevMessages.length - 1])]);
+  };
+
+  const handleDocumentRequest = (data: { message: string; document_type?: string; placeholders_to_fill?: Placeholder[] }) => {
+    addMessage({
+      sender: 'aleks',
+      text: data.message,
+      type: 'document_request',
+      additionalData: {
+        documentType: data.document_type,
+        placeholdersToFill: data.placeholders_to_fill
+      }
+    });
+    setCurrentDocumentType(data.document_type || '');
+    setCurrentPlaceholders(data.placeholders_to_fill || []);
+    setIsDocumentFillModalOpen(true);
+  };
+
+  // Reads the Server-Sent Events from /api/chat/stream and renders the answer as tokens arrive
+  const readChatStream = async (response: Response) => {
+    const reader = response.body!.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let answerStarted = false;
+
+    const startAnswer = (sources: NonNullable<Message['additionalData']>['sources']) => {
+      addMessage({ sender: 'aleks', text: '', type: 'text', additionalData: { sources } });
+      answerStarted = true;
+    };
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE frames are separated by a blank line
+      let frameEnd: number;
+      while ((frameEnd = buffer.indexOf('\n\n')) !== -1) {
+        const frame = buffer.slice(0, frameEnd);
+        buffer = buffer.slice(frameEnd + 2);
+        const eventName = frame.match(/^event: (.*)$/m)?.[1];
+        const dataLine = frame.match(/^data: (.*)$/m)?.[1];
+        if (!eventName || dataLine === undefined) continue;
+        const data = JSON.parse(dataLine);
+
+        if (eventName === 'sources') {
+          startAnswer(data);
+        } else if (eventName === 'token') {
+          if (!answerStarted) startAnswer([]);
+          updateLastMessage(msg => ({ ...msg, text: msg.text + data }));
+        } else if (eventName === 'done') {
+          updateLastMessage(msg => ({
+            ...msg,
+            additionalData: {
+              ...msg.additionalData,
+              timing: { timeToFirstTokenMs: data.time_to_first_token_api_ms, totalMs: data.total_api_ms },
+            },
+          }));
+        } else if (eventName === 'document_request') {
+          handleDocumentRequest(data);
+        } else if (eventName === 'text') {
+          addMessage({ sender: 'aleks', text: data.response, type: 'text' });
+        } else if (eventName === 'error') {
+          throw new Error(data.detail || 'An unknown error occurred.');
+        }
+      }
+    }
+  };
+
   const sendMessageToAleks = async () => {
     const question = userInput.trim();
     if (!question || isLoading || isDocumentFillModalOpen) return;
@@ -76,12 +150,12 @@ function App() {
     setError(null);
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/chat`, {
+      const response = await fetch(`${API_BASE_URL}/api/chat/stream`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ message: question }),
+        body: JSON.stringify({ message: question, session_id: sessionIdRef.current }),
       });
 
       if (!response.ok) {
@@ -89,22 +163,17 @@ function App() {
         throw new Error(errorData.detail || 'An unknown error occurred.');
       }
 
+      if (response.body && response.headers.get('content-type')?.startsWith('text/event-stream')) {
+        // Streamed answer: tokens are rendered as they arrive
+        await readChatStream(response);
+        return;
+      }
+
       const data = await response.json(); // Data from FastAPI
 
       if (data.type === 'document_request') {
         // Handle document request from API
-        addMessage({
-          sender: 'aleks',
-          text: data.message,
-          type: 'document_request',
-          additionalData: {
-            documentType: data.document_type,
-            placeholdersToFill: data.placeholders_to_fill
-          }
-        });
-        setCurrentDocumentType(data.document_type || '');
-        setCurrentPlaceholders(data.placeholders_to_fill || []);
-        setIsDocumentFillModalOpen(true);
+        handleDocumentRequest(data);
       } else if (data.type === 'rag_response') {
         // Handle RAG response from API
         addMessage({
@@ -224,7 +293,7 @@ function App() {
                   <ul className="list-disc pl-4">
                     {msg.additionalData.sources.map((source, sIdx) => (
                       <li key={sIdx}>
-                        <strong>{source.source}</strong> (Start Index: {source.startIndex || 'N/A'})<br />
+                        <strong>{source.citation || source.source}</strong>{source.pages ? ` (${source.pages})` : ''}<br />
                         <span className="italic text-gray-500 line-clamp-2">"{source.snippet}"</span>
                       </li>
                     ))}
@@ -232,6 +301,12 @@ function App() {
                 </div>
               )}
 
+              {msg.additionalData?.timing && (
+                <p className="mt-1 text-xs text-gray-400">
+                  First token {(msg.additionalData.timing.timeToFirstTokenMs / 1000).toFixed(1)}s · Total {(msg.additionalData.timing.totalMs / 1000).toFixed(1)}s
+                </p>
+              )}
+
               {msg.type === 'document_generated' && msg.additionalData?.generatedDocumentPreview && (
                 <div className="mt-2 text-sm bg-gray-50 p-3 rounded-md border border-gray-200 overflow-x-auto">
                   <p className="font-semibold mb-1">Generated Document Preview:</p>
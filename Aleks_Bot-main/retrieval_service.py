@@ -0,0 +1,358 @@
+# retrieval_service.py
+import os
+import queue
+import secrets
+import stat
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import Any, List
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+
+# --- Retrieval Service Configuration ---
+# Where the shared embedding/retrieval process listens: a Unix socket path, a Windows pipe name
+# (\\.\pipe\aleks-retrieval) or host:port. Empty = every API worker loads its own model and index.
+RETRIEVAL_SERVICE = os.getenv("ALEKS_RETRIEVAL_SERVICE", "")
+# Shared secret the service and the workers authenticate each other with. Required: requests and
+# results are pickled, so whoever holds it can run code in the service. retrieval_service.py --workers N
+# generates a random one for its own workers when it is not set.
+RETRIEVAL_SERVICE_KEY = os.getenv("ALEKS_RETRIEVAL_SERVICE_KEY", "")
+# How long the service waits for concurrent requests to batch with the first one, and the batch limit.
+RETRIEVAL_BATCH_MS = float(os.getenv("ALEKS_RETRIEVAL_BATCH_MS", "2"))
+RETRIEVAL_BATCH_SIZE = int(os.getenv("ALEKS_RETRIEVAL_BATCH_SIZE", "32"))
+# Batches the service works on at once (embedding and Chroma release the GIL for most of their work).
+RETRIEVAL_SERVICE_THREADS = int(os.getenv("ALEKS_RETRIEVAL_SERVICE_THREADS", "2"))
+# Connections each worker keeps open to the service; each carries one request at a time.
+RETRIEVAL_SERVICE_CONNECTIONS = int(os.getenv("ALEKS_RETRIEVAL_SERVICE_CONNECTIONS", "8"))
+# Seconds a worker keeps trying to reach a service that is still starting.
+RETRIEVAL_SERVICE_CONNECT_TIMEOUT = float(os.getenv("ALEKS_RETRIEVAL_SERVICE_CONNECT_TIMEOUT", "120"))
+
+# The default socket lives in a directory only its owner can enter, so no other user can connect to it
+# or put a socket of their own in its place
+PRIVATE_SOCKET_DIR = None if os.name == "nt" else os.path.join(tempfile.gettempdir(), f"aleks-{os.getuid()}")
+DEFAULT_ADDRESS = r"\\.\pipe\aleks-retrieval" if os.name == "nt" else os.path.join(PRIVATE_SOCKET_DIR, "retrieval.sock")
+
+
+def parse_address(address):
+    """host:port -> (host, port) for TCP; anything else is a Unix socket path or a Windows pipe name."""
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit():
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def require_key(authkey):
+    if not authkey:
+        raise RuntimeError("ALEKS_RETRIEVAL_SERVICE_KEY is not set. The retrieval service and its workers need a "
+                           "shared secret (e.g. python -c \"import secrets; print(secrets.token_hex(32))\").")
+    return authkey.encode("utf-8")
+
+
+def check_private_dir(address, create=False):
+    """
+    For the default socket: creates its directory (mode 0700) if asked, and refuses a directory that
+    another user owns or can enter.
+    """
+    if PRIVATE_SOCKET_DIR is None or not isinstance(address, str) or os.path.dirname(address) != PRIVATE_SOCKET_DIR:
+        return
+    if create:
+        os.makedirs(PRIVATE_SOCKET_DIR, mode=0o700, exist_ok=True)
+    try:
+        info = os.lstat(PRIVATE_SOCKET_DIR)
+    except FileNotFoundError:
+        return  # service not started yet; connecting fails and is retried
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{PRIVATE_SOCKET_DIR} must be a directory owned by this user with mode 0700.")
+
+
+class MicroBatcher:
+    """
+    Groups items submitted concurrently from many threads: a batch starts with the first waiting item,
+    takes whatever else arrives within window_ms (up to max_size), and fn(items) answers them all at
+    once. Each submit() call blocks until its own result is ready.
+    """
+
+    def __init__(self, fn, window_ms=RETRIEVAL_BATCH_MS, max_size=RETRIEVAL_BATCH_SIZE,
+                 threads=RETRIEVAL_SERVICE_THREADS, name="aleks-batch"):
+        self.fn = fn
+        self.window_s = window_ms / 1000
+        self.max_size = max_size
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        for i in range(max(1, threads)):
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True).start()
+
+    def submit(self, item):
+        slot = {"item": item, "done": threading.Event()}
+        self._queue.put(slot)
+        slot["done"].wait()
+        if "error" in slot:
+            raise slot["error"]
+        return slot["result"]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.window_s
+            while len(batch) < self.max_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for slot, result in zip(batch, self.fn([slot["item"] for slot in batch])):
+                    slot["result"] = result
+            except Exception as e:
+                for slot in batch:
+                    slot["error"] = e
+            self.batches += 1
+            self.items += len(batch)
+            for slot in batch:
+                slot["done"].set()
+
+
+class RetrievalService:
+    """
+    Serves one embedding model, vector store and retriever to every API worker on the host, so
+    N workers hold one copy of them instead of N. Workers connect with RetrievalServiceClient;
+    single queries arriving together from different workers are embedded and searched as one batch
+    (EmbeddingService.embed_queries, HybridRetriever.retrieve_many). With index snapshots, index is
+    the LiveIndex behind the retriever, which workers can ask to swap.
+    """
+
+    def __init__(self, embeddings, retriever, address=None, authkey=RETRIEVAL_SERVICE_KEY, index=None):
+        self.embeddings = embeddings
+        self.retriever = retriever
+        self.index = index
+        self.address = address or RETRIEVAL_SERVICE or DEFAULT_ADDRESS
+        self.authkey = require_key(authkey)
+        self.connections = 0
+        self._retrieve = MicroBatcher(self._retrieve_many, name="aleks-retrieve")
+        self._embed = MicroBatcher(embeddings.embed_queries, name="aleks-embed")
+        self._listener = None
+
+    def _retrieve_many(self, queries):
+        if hasattr(self.retriever, "retrieve_many"):
+            return self.retriever.retrieve_many(queries)
+        return self.retriever.batch(queries)
+
+    def handle(self, operation, payload):
+        if operation == "retrieve":
+            return self._retrieve.submit(payload)
+        if operation == "retrieve_many":
+            return self._retrieve_many(payload)
+        if operation == "embed_query":
+            return self._embed.submit(payload)
+        if operation == "embed_queries":
+            return self.embeddings.embed_queries(payload)
+        if operation == "embed_documents":
+            return self.embeddings.embed_documents(payload)
+        if operation == "stats":
+            return self.stats()
+        if operation == "index_status":
+            return self.index.status() if self.index is not None else None
+        if operation == "reload_index":
+            if self.index is None:
+                raise RuntimeError("Index snapshots are not enabled in the retrieval service (ALEKS_INDEX_SNAPSHOT_ROOT).")
+            return self.index.swap(payload)
+        raise ValueError(f"Unknown retrieval service operation '{operation}'.")
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address,
+            "connections": self.connections,
+            "embeddings": self.embeddings.stats(),
+            "retrieve_batches": self._retrieve.batches,
+            "retrieve_requests": self._retrieve.items,
+            "embed_batches": self._embed.batches,
+            "embed_requests": self._embed.items,
+        }
+
+    def start(self):
+        """Starts listening in background threads and returns."""
+        address = parse_address(self.address)
+        check_private_dir(address, create=True)
+        if isinstance(address, str) and os.name != "nt" and os.path.exists(address):
+            os.remove(address)  # left behind by a service that did not shut down cleanly
+        self._listener = Listener(address, authkey=self.authkey)
+        threading.Thread(target=self._accept_loop, name="aleks-retrieval-accept", daemon=True).start()
+        print(f"Retrieval service listening on {self.address}.")
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def _accept_loop(self):
+        while self._listener is not None:
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                break  # closed
+            except Exception as e:
+                print(f"Retrieval service rejected a connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(connection,), name="aleks-retrieval-conn", daemon=True).start()
+
+    def _serve(self, connection):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    operation, payload = connection.recv()
+                except (EOFError, OSError):
+                    break
+                try:
+                    response = ("ok", self.handle(operation, payload))
+                except Exception as e:
+                    response = ("error", f"{type(e).__name__}: {e}")
+                connection.send(response)
+        finally:
+            self.connections -= 1
+            connection.close()
+
+
+class RetrievalServiceClient:
+    """
+    A worker's pool of connections to the RetrievalService, safe to use from many threads.
+    A connection that breaks (e.g. the service restarted) is dropped and the call retried once.
+    """
+
+    def __init__(self, address=None, authkey=RETRIEVAL_SERVICE_KEY, connections=RETRIEVAL_SERVICE_CONNECTIONS):
+        self.address = address or RETRIEVAL_SERVICE or DEFAULT_ADDRESS
+        self._address = parse_address(self.address)
+        self._authkey = require_key(authkey)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(connections)
+
+    def call(self, operation, payload=None):
+        with self._slots:
+            for attempt in range(2):
+                try:
+                    connection = self._idle.get_nowait()
+                    reused = True
+                except queue.Empty:
+                    check_private_dir(self._address)
+                    connection = Client(self._address, authkey=self._authkey)
+                    reused = False
+                try:
+                    connection.send((operation, payload))
+                    status, result = connection.recv()
+                except (EOFError, OSError):
+                    connection.close()
+                    if reused and attempt == 0:
+                        continue
+                    raise
+                self._idle.put(connection)
+                break
+        if status == "error":
+            raise RuntimeError(f"Retrieval service: {result}")
+        return result
+
+    def wait_until_up(self, timeout=RETRIEVAL_SERVICE_CONNECT_TIMEOUT):
+        """Returns the service's stats once it answers; raises ConnectionError after timeout seconds."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.call("stats")
+            except (OSError, EOFError) as e:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"Retrieval service at {self.address} is not reachable: {e}") from e
+                time.sleep(0.5)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class RemoteEmbeddings(Embeddings):
+    """EmbeddingService stand-in for API workers: every call is answered by the retrieval service."""
+
+    def __init__(self, client):
+        self.client = client
+        info = client.wait_until_up()["embeddings"]
+        self.model_id = info["model"]
+        self.backend = info["backend"]
+        self.batch_size = info["batch_size"]
+
+    def embed_query(self, text):
+        return self.client.call("embed_query", text)
+
+    def embed_queries(self, texts):
+        return self.client.call("embed_queries", list(texts))
+
+    def embed_documents(self, texts):
+        return self.client.call("embed_documents", list(texts))
+
+    def stats(self) -> dict:
+        """The service's counts, shared by every worker."""
+        return self.client.call("stats")["embeddings"]
+
+
+class RemoteRetriever(BaseRetriever):
+    """Retriever for API workers that runs the retrieval in the shared service."""
+
+    client: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.client.call("retrieve", query)
+
+    def retrieve_many(self, queries: List[str]) -> List[List[Document]]:
+        return self.client.call("retrieve_many", list(queries))
+
+
+def main():
+    import argparse
+    import signal
+
+    import aleks_core
+    from index_snapshots import watch_snapshots
+
+    parser = argparse.ArgumentParser(description="Serve the embedding model and retrieval index to every Aleks API worker on this host.")
+    parser.add_argument("--address", default=RETRIEVAL_SERVICE or DEFAULT_ADDRESS, help="Unix socket path, Windows pipe name or host:port.")
+    parser.add_argument("--workers", type=int, default=0, help="Also run the API with this many uvicorn workers using the service (0 = service only).")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    authkey = RETRIEVAL_SERVICE_KEY or (secrets.token_hex(32) if args.workers else "")
+    require_key(authkey)
+    embeddings = aleks_core.load_embeddings()
+    embeddings.embed_query("warm-up")
+    retriever = aleks_core.load_retriever(embeddings)
+    service = RetrievalService(embeddings, retriever, args.address, authkey, index=aleks_core.live_index)
+    service.start()
+    if aleks_core.live_index is not None:
+        watch_snapshots(aleks_core.live_index.swap)
+        if hasattr(signal, "SIGHUP") and not args.workers:  # with workers, uvicorn uses SIGHUP to restart them
+            signal.signal(signal.SIGHUP, lambda *_: threading.Thread(target=aleks_core.live_index.swap, daemon=True).start())
+    try:
+        if args.workers:
+            import uvicorn
+
+            # The workers are spawned after this, so they inherit it and connect instead of loading their own copies
+            os.environ["ALEKS_RETRIEVAL_SERVICE"] = args.address
+            os.environ["ALEKS_RETRIEVAL_SERVICE_KEY"] = authkey
+            uvicorn.run("aleks_api:app", host=args.host, port=args.port, workers=args.workers)
+        else:
+            stop = threading.Event()
+            signal.signal(signal.SIGINT, lambda *_: stop.set())
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            while not stop.wait(1):
+                pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
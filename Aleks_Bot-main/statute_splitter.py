@@ -0,0 +1,232 @@
+# statute_splitter.py
+import bisect
+import os
+import re
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.docstore.document import Document
+
+# --- Chunking Configuration ---
+# Provisions longer than this (in characters) are split further; shorter ones stay whole.
+CHUNK_SIZE = int(os.getenv("ALEKS_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("ALEKS_CHUNK_OVERLAP", "100"))
+# Stored in the ingestion manifest: changing how chunks are cut forces a rebuild of the vector DB.
+CHUNKER_VERSION = f"statute-v1/{CHUNK_SIZE}/{CHUNK_OVERLAP}"
+
+# Division headings: "BOOK THREE – CONDITIONS OF EMPLOYMENT", "Book One - PRE-EMPLOYMENT", "TITLE I",
+# "Chapter II – WEEKLY REST PERIODS", "PART II.", "CHAPTER IV RIGHTS OF THE DATA SUBJECT" (inline in RA 10173).
+DIVISION_PATTERN = re.compile(
+    r"(?:^|(?<=[.:;”\")]\s))"
+    r"(?P<kind>BOOK|Book|TITLE|Title|CHAPTER|Chapter|PART|Part)\s+"
+    r"(?P<number>[IVXLC]+|\d+|(?i:one|two|three|four|five|six|seven|eight|nine|ten))\b"
+    r"\.?[ \t]*(?P<separator>[-–—:]?)[ \t]*(?P<rest>[^\n]*)",
+    re.MULTILINE,
+)
+PRELIMINARY_TITLE_PATTERN = re.compile(r"^PRELIMINARY TITLE\b", re.MULTILINE)
+# Provision headings: "ART. 306. [291] Money Claims. –", "SEC. 12. Criteria...", "Sec. 8. Legal Recognition...",
+# "SEC 22. Responsibility...". The number is followed by a period and a capitalised title, which is what
+# separates a heading from a reference like "Section 20(f)" or "Sec. 8, R.A. No. 165a".
+PROVISION_PATTERN = re.compile(
+    r"(?P<kind>ART(?:ICLE)?|SEC(?:TION)?|Art(?:icle)?|Sec(?:tion)?)\.?\s*(?P<number>\d+[A-Z]?)\.\s*"
+    r"(?:\[\s*(?P<old_number>\d+[A-Z]?)\s*\]\s*)?(?=[A-Z\"“\[(])"
+)
+ROMAN_OR_DIGITS = re.compile(r"[IVXLC]+|\d+")
+SENTENCE_END = re.compile(r"[.:;”\")]\s$")
+# Title of a provision: the text up to the dash (or first full stop) after its number.
+PROVISION_TITLE_END = re.compile(r"\s*(?:–|—| - |\.\s)")
+FOOTNOTE_MARK = re.compile(r"(?<=[A-Za-z.)])\d{1,3}$")
+# Republic Act references: "RA 10173", "R.A. No. 8293", "Republic Act No. 8792"
+RA_NUMBER_PATTERN = re.compile(r"\b(?:r\.?\s?a\.?|republic\s+act)(?:\s+no\.?)?\s*(\d{3,5})\b", re.IGNORECASE)
+
+DIVISION_LEVELS = {"book": 0, "part": 0, "title": 1, "chapter": 2}
+# Text outside any provision shorter than this is dropped
+MIN_UNSTRUCTURED_CHARS = 40
+
+
+def law_info(source):
+    """
+    Law name and RA number from a corpus filename:
+    "RA 10173 - Data Privacy Act.pdf" -> ("Data Privacy Act", "10173"),
+    "Labor Code of the Philippines.pdf" -> ("Labor Code of the Philippines", "").
+    """
+    stem = os.path.splitext(os.path.basename(source))[0]
+    match = RA_NUMBER_PATTERN.search(stem)
+    name = stem.split(" - ", 1)[-1].strip()
+    return name, match.group(1) if match else ""
+
+
+def format_citation(metadata):
+    """Human-readable citation for a chunk, e.g. "RA 10173 (Data Privacy Act), Sec. 12 – Criteria for Lawful Processing"."""
+    law_name = metadata.get("law_name") or metadata.get("source", "Unknown Document")
+    ra_number = metadata.get("ra_number")
+    citation = f"RA {ra_number} ({law_name})" if ra_number else law_name
+    number = metadata.get("provision")
+    if number:
+        citation += f", {'Art.' if metadata.get('provision_type') == 'article' else 'Sec.'} {number}"
+        if metadata.get("provision_alt"):
+            citation += f" [{metadata['provision_alt']}]"
+        if metadata.get("provision_title"):
+            citation += f" – {metadata['provision_title']}"
+    elif metadata.get("chapter") or metadata.get("title") or metadata.get("book") or metadata.get("part"):
+        citation += ", " + (metadata.get("chapter") or metadata.get("title") or metadata.get("book") or metadata.get("part"))
+    return citation
+
+
+def format_pages(metadata):
+    start, end = metadata.get("page_start"), metadata.get("page_end")
+    if not start:
+        return ""
+    return f"p. {start}" if start == end else f"pp. {start}–{end}"
+
+
+def _clean_page(text):
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    lines = [line for line in lines if line]
+    # Printed page number at the top of the page
+    if lines and lines[0].isdigit():
+        lines = lines[1:]
+    return "\n".join(lines)
+
+
+def _clean_heading_title(title):
+    title = FOOTNOTE_MARK.sub("", title.strip())
+    return title.strip(" .–-")
+
+
+def _at_boundary(text, position, strict):
+    """True if position starts a line, or (for non-strict, all-caps headings) follows whitespace or a sentence end."""
+    if position == 0 or text[position - 1] == "\n":
+        return True
+    if strict:
+        return bool(SENTENCE_END.search(text[max(0, position - 2):position]))
+    return text[position - 1].isspace()
+
+
+def _find_divisions(text):
+    """Yields (position, end, key, label, level) for Book/Part/Title/Chapter headings."""
+    for match in PRELIMINARY_TITLE_PATTERN.finditer(text):
+        # Comes before Book One, so it closes whatever the table of contents opened
+        yield match.start(), match.end(), "title", "Preliminary Title", 0
+    for match in DIVISION_PATTERN.finditer(text):
+        kind, rest = match.group("kind"), match.group("rest")
+        at_line_start = match.start() == 0 or text[match.start() - 1] == "\n"
+        # "Title I of this Book" at the start of a wrapped line is a reference, not a heading
+        if not kind.isupper() and not (match.group("separator") or not rest or rest[:2].isupper()):
+            continue
+        if not at_line_start and not (kind.isupper() and rest[:2].isupper()):
+            continue
+        name = rest
+        end = match.end()
+        # Names printed on the following line(s) ("PART II." / "THE LAW ON PATENTS") or wrapped onto them
+        while len(name) < 150:
+            next_line = text[end + 1:].split("\n", 1)[0]
+            if not next_line.isupper() or PROVISION_PATTERN.match(next_line) or DIVISION_PATTERN.match(next_line):
+                break
+            name = f"{name} {next_line}".strip()
+            end += 1 + len(next_line)
+        provision = PROVISION_PATTERN.search(name)
+        if provision:
+            # Inline headings: the division name stops where the first provision starts
+            end -= len(name) - provision.start()
+            name = name[:provision.start()]
+        name = re.sub(r"\s+\d+$", "", _clean_heading_title(name))[:100]  # table-of-contents page numbers
+        number = match.group("number")
+        label = f"{kind.capitalize()} {number if ROMAN_OR_DIGITS.fullmatch(number) else number.capitalize()}"
+        yield match.start(), end, kind.lower(), f"{label} – {name}" if name else label, DIVISION_LEVELS[kind.lower()]
+
+
+def _find_provisions(text):
+    """Yields (position, end, kind, number, old_number, title) for Article/Section headings."""
+    for match in PROVISION_PATTERN.finditer(text):
+        kind = match.group("kind")
+        if not _at_boundary(text, match.start(), strict=not kind.isupper()):
+            continue
+        rest = text[match.end():match.end() + 150].split("\n", 1)[0]
+        title = _clean_heading_title(PROVISION_TITLE_END.split(rest, 1)[0])
+        yield (match.start(), match.end(), "article" if kind.lower().startswith("art") else "section",
+               match.group("number").upper(), (match.group("old_number") or "").upper(), title[:120])
+
+
+def _make_text_splitter():
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+                                          length_function=len, add_start_index=True)
+
+
+def split_statute(source, page_texts):
+    """
+    Splits the page texts of one statute PDF into provision-aligned chunks.
+
+    Each Article/Section becomes its own chunk (long ones are split further, every piece repeating
+    the provision heading) and never shares a chunk with its neighbours. Chunks carry the law name,
+    RA number, enclosing Book/Part/Title/Chapter, provision number and title, and the PDF pages they
+    span, so retrieval can filter on them and answers can cite them. Text outside any provision
+    (preambles, tables of contents, documents with no recognisable headings) is chunked by size.
+    """
+    law_name, ra_number = law_info(source)
+    pages = [_clean_page(text) for text in page_texts]
+    page_starts = []
+    offset = 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page) + 1
+    text = "\n".join(pages)
+    if not text.strip():
+        return []
+
+    def page_at(position):
+        return bisect.bisect_right(page_starts, position)  # 1-based page number
+
+    events = sorted(
+        [(start, end, "division", rest) for start, end, *rest in _find_divisions(text)]
+        + [(start, end, "provision", rest) for start, end, *rest in _find_provisions(text)],
+        key=lambda event: event[0],
+    )
+
+    divisions = {}
+    segments = []  # (start, end, provision or None, divisions)
+    cursor, current_provision = 0, None
+    for start, end, event_type, payload in events:
+        if start < cursor:
+            continue  # overlaps the previous heading (e.g. a provision inside an inline division name)
+        segments.append((cursor, start, current_provision, dict(divisions)))
+        if event_type == "division":
+            key, label, level = payload
+            for other, other_level in DIVISION_LEVELS.items():
+                if other_level >= level:
+                    divisions.pop(other, None)
+            divisions[key] = label
+            current_provision = None
+            cursor = end
+        else:
+            current_provision = payload
+            cursor = start
+    segments.append((cursor, len(text), current_provision, dict(divisions)))
+
+    splitter = _make_text_splitter()
+    chunks = []
+    for start, end, provision, segment_divisions in segments:
+        segment = text[start:end].strip()
+        if not segment or (provision is None and len(segment) < MIN_UNSTRUCTURED_CHARS):
+            continue  # stray page numbers and heading fragments between divisions
+        start += text[start:end].find(segment)
+        metadata = {"source": source, "law_name": law_name, "ra_number": ra_number, **segment_divisions}
+        heading = ""
+        if provision is not None:
+            kind, number, old_number, title = provision
+            metadata.update(provision_type=kind, provision=number, provision_alt=old_number, provision_title=title)
+            heading = f"{'ART.' if kind == 'article' else 'SEC.'} {number}.{f' [{old_number}]' if old_number else ''} {title}".strip()
+
+        pieces = [(segment, 0)] if len(segment) <= CHUNK_SIZE else [
+            (piece.page_content, piece.metadata["start_index"])
+            for piece in splitter.split_documents([Document(page_content=segment)])
+        ]
+        for i, (piece, piece_offset) in enumerate(pieces):
+            piece_start = start + piece_offset
+            content = piece if i == 0 or not heading else f"{heading} (continued)\n{piece}"
+            chunks.append(Document(page_content=content, metadata=dict(
+                metadata,
+                start_index=piece_start,
+                page_start=page_at(piece_start),
+                page_end=page_at(piece_start + len(piece) - 1),
+            )))
+    return chunks
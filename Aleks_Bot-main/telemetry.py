@@ -0,0 +1,273 @@
+# telemetry.py
+import bisect
+import contextvars
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+# --- Telemetry Configuration ---
+# Fraction of requests whose per-stage breakdown is logged (and exported as spans if OTLP is set up).
+TRACE_SAMPLE_RATE = float(os.getenv("ALEKS_TRACE_SAMPLE_RATE", "0.01"))
+# Requests slower than this are always logged with their stage breakdown (0 = never).
+SLOW_REQUEST_MS = float(os.getenv("ALEKS_SLOW_REQUEST_MS", "10000"))
+# OTLP/gRPC collector (e.g. http://localhost:4317) that receives the sampled traces. Empty = logs only.
+OTLP_ENDPOINT = os.getenv("ALEKS_OTLP_ENDPOINT", "")
+# Incoming request IDs longer than this are replaced with a generated one.
+MAX_REQUEST_ID_LENGTH = 64
+
+# Seconds. Covers everything from a BM25 lookup to a long CPU generation.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_current_request = contextvars.ContextVar("aleks_request", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = [(key, list(series)) for key, series in sorted(self._series.items())]
+        for key, series in series_items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {round(series[-1], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms updated on the request path, plus collectors that read the components'
+    existing stats() when /metrics is scraped (queue depth, cache hit counts, sessions...).
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, description, labels=()):
+        metric = Counter(name, description, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, description, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """collector() returns [(name, "gauge" | "counter", description, [(labels dict, value), ...]), ...]."""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, description, samples in families:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(labels), tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+HTTP_REQUESTS = metrics.counter("aleks_http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status"))
+HTTP_SECONDS = metrics.histogram("aleks_http_request_seconds", "HTTP request duration, until the last byte is sent.", ("route",))
+STAGE_SECONDS = metrics.histogram("aleks_stage_seconds", "Time spent in each pipeline stage.", ("stage",))
+FIRST_TOKEN_SECONDS = metrics.histogram("aleks_time_to_first_token_seconds", "Time from request to the first streamed token.")
+LLM_TOKENS = metrics.counter("aleks_llm_tokens_total", "Tokens evaluated by the LLM (prompt) and generated by it (completion).", ("kind",))
+INTENT_DECISIONS = metrics.counter("aleks_intent_decisions_total", "Intent router decisions by the tier that decided.", ("tier",))
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def _get_tracer():
+    """OpenTelemetry tracer exporting over OTLP, created on first use (None when ALEKS_OTLP_ENDPOINT is unset)."""
+    global _tracer
+    if not OTLP_ENDPOINT or _tracer is not None:
+        return _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            # A private provider: the sampling decision is made per request below, and the
+            # chromadb spans going to the global provider stay out of our traces.
+            provider = TracerProvider(resource=Resource.create({"service.name": "aleks"}))
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=OTLP_ENDPOINT, insecure=True)))
+            _tracer = provider.get_tracer("aleks")
+    return _tracer
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_request_id():
+    request = _current_request.get()
+    return request["id"] if request else None
+
+
+@contextmanager
+def request_scope(name, request_id=None, sampled=None):
+    """
+    Marks the work of one request: stages recorded inside it are attributed to it, log() lines carry
+    its ID, and if it is sampled (or slower than ALEKS_SLOW_REQUEST_MS) its stage breakdown is logged.
+    Worker threads see the request when the context is copied to them (llm_scheduler does).
+    """
+    if not request_id or len(request_id) > MAX_REQUEST_ID_LENGTH:
+        request_id = new_request_id()
+    request = {
+        "id": request_id,
+        "name": name,
+        "sampled": random.random() < TRACE_SAMPLE_RATE if sampled is None else sampled,
+        "stages": [],
+    }
+    token = _current_request.set(request)
+    tracer = _get_tracer() if request["sampled"] else None
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(name, attributes={"aleks.request_id": request_id}) if tracer else nullcontext():
+            yield request
+    finally:
+        _current_request.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if request["stages"] and (request["sampled"] or (SLOW_REQUEST_MS and elapsed_ms >= SLOW_REQUEST_MS)):
+            breakdown = ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in request["stages"])
+            print(f"[{request_id}] {name} took {elapsed_ms:.0f} ms: {breakdown}")
+
+
+@contextmanager
+def stage(name):
+    """Times a pipeline stage into aleks_stage_seconds (and a span, for sampled requests)."""
+    request = _current_request.get()
+    tracer = _get_tracer() if request is not None and request["sampled"] else None
+    started = time.perf_counter()
+    try:
+        with tracer.start_as_current_span(name) if tracer else nullcontext():
+            yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def record_stage(name, seconds):
+    """Records a stage measured elsewhere (e.g. Ollama's own prompt evaluation time)."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    request = _current_request.get()
+    if request is not None:
+        request["stages"].append((name, seconds))
+
+
+def record_generation(generation_stats):
+    """Token counts and Ollama's prompt-evaluation/generation split, from GenerationStatsHandler.stats()."""
+    if not generation_stats:
+        return
+    LLM_TOKENS.inc(generation_stats["prompt_tokens"], kind="prompt")
+    LLM_TOKENS.inc(generation_stats["completion_tokens"], kind="completion")
+    record_stage("prompt_eval", generation_stats["prompt_eval_ms"] / 1000)
+    record_stage("token_generation", generation_stats["eval_ms"] / 1000)
+
+
+def log(message):
+    """print() with the current request's ID in front, so concurrent requests' lines can be told apart."""
+    request_id = current_request_id()
+    print(f"[{request_id}] {message}" if request_id else message)
+
+
+class RequestTelemetryMiddleware:
+    """
+    ASGI middleware: gives every HTTP request an ID (the caller's X-Request-ID or a new one, echoed in
+    the response), runs it inside request_scope() and records its duration and status until the last
+    byte is sent, so streamed responses are measured whole.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        status = 500
+
+        async def send_with_request_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request["id"].encode("latin-1"))]
+            await send(message)
+
+        started = time.perf_counter()
+        with request_scope(f"{scope['method']} {scope['path']}", request_id) as request:
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                # The router stores the matched route in the scope; label by its template, not the raw path
+                route = getattr(scope.get("route"), "path", "unmatched")
+                HTTP_REQUESTS.inc(route=route, method=scope["method"], status=status)
+                HTTP_SECONDS.observe(time.perf_counter() - started, route=route)
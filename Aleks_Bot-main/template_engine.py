@@ -0,0 +1,173 @@
+# template_engine.py
+import argparse
+import csv
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+from document_manager import DOCUMENT_TEMPLATES, PLACEHOLDER_DESCRIPTIONS, TEMPLATE_DIR
+
+# --- Template Configuration ---
+# Templates are re-checked on disk at most this often (seconds); edits are picked up without a restart.
+TEMPLATE_RELOAD_SECONDS = float(os.getenv("ALEKS_TEMPLATE_RELOAD_SECONDS", "2"))
+# Largest batch /api/generate_documents accepts in one request.
+MAX_BATCH_ROWS = int(os.getenv("ALEKS_TEMPLATE_BATCH_MAX_ROWS", "5000"))
+
+# Placeholders are written as [NAME] or {{name}}
+PLACEHOLDER_PATTERN = re.compile(r'\[(.*?)\]|\{\{(.*?)\}\}')
+# Filled in automatically with today's date instead of being asked for
+AUTO_PLACEHOLDERS = ("current_date",)
+
+
+def current_date():
+    return datetime.now().strftime("%B %d, %Y")
+
+
+def describe_placeholder(name):
+    return PLACEHOLDER_DESCRIPTIONS.get(name, name.replace('_', ' ').title())
+
+
+class CompiledTemplate:
+    """
+    A template parsed once into literal text and placeholder slots.
+
+    Rendering walks the slots once and joins the pieces, instead of rebuilding the whole document
+    with one re.sub per placeholder. Values are inserted verbatim, so a value containing a backslash
+    or another placeholder's brackets is never re-substituted. Slots without a value keep their
+    original "[NAME]" / "{{name}}" text.
+    """
+
+    def __init__(self, path, text, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.literals = []  # literals[i] comes before slots[i]; the last literal ends the document
+        self.slots = []  # (name, original placeholder text)
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            name = (match.group(1) if match.group(1) is not None else match.group(2)).strip()
+            if not name:
+                continue
+            self.literals.append(text[position:match.start()])
+            self.slots.append((name, match.group(0)))
+            position = match.end()
+        self.literals.append(text[position:])
+        # Unique names in order of first appearance
+        self.names = list(dict.fromkeys(name for name, _ in self.slots))
+        self.placeholders = [
+            {"name": name, "description": describe_placeholder(name)}
+            for name in sorted(self.names) if name not in AUTO_PLACEHOLDERS
+        ]
+
+    def missing(self, values):
+        """Placeholders the user has to fill that have no value in values."""
+        return [p["name"] for p in self.placeholders if p["name"] not in values]
+
+    def render(self, values, today=None):
+        """Fills the template from values (placeholder name -> value) in a single pass."""
+        if "current_date" in self.names and "current_date" not in values:
+            values = dict(values, current_date=today or current_date())
+        parts = []
+        for literal, (name, original) in zip(self.literals, self.slots):
+            parts.append(literal)
+            value = values.get(name)
+            parts.append(original if value is None else str(value))
+        parts.append(self.literals[-1])
+        return "".join(parts)
+
+
+class TemplateRegistry:
+    """
+    In-memory cache of compiled document templates, keyed by DOCUMENT_TEMPLATES key.
+
+    A template is read and parsed the first time it is used and re-parsed only when its file's mtime
+    changes (checked at most every reload_seconds), so placeholder metadata and rendering normally
+    never touch the disk. Aliases pointing at the same file share one compiled template.
+    Raises KeyError for an unknown template key and FileNotFoundError when the file is missing.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, templates=None, reload_seconds=TEMPLATE_RELOAD_SECONDS):
+        self.template_dir = template_dir
+        self.templates = DOCUMENT_TEMPLATES if templates is None else templates
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._compiled = {}  # filename -> CompiledTemplate
+        self._checked = {}  # filename -> time.monotonic() of the last mtime check
+        self.loads = 0
+
+    def get(self, key):
+        filename = self.templates.get(key)
+        if not filename:
+            raise KeyError(key)
+        now = time.monotonic()
+        with self._lock:
+            compiled = self._compiled.get(filename)
+            if compiled is not None and now - self._checked[filename] < self.reload_seconds:
+                return compiled
+        path = os.path.join(self.template_dir, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._compiled.pop(filename, None)
+            raise
+        if compiled is None or compiled.mtime != mtime:
+            if compiled is not None:
+                print(f"Template '{filename}' changed on disk; reloading.")
+            with open(path, 'r', encoding='utf-8') as f:
+                compiled = CompiledTemplate(path, f.read(), mtime)
+            self.loads += 1
+        with self._lock:
+            self._compiled[filename] = compiled
+            self._checked[filename] = now
+        return compiled
+
+    def placeholders(self, key):
+        """[{"name", "description"}] for the placeholders the user fills in, sorted by name."""
+        return self.get(key).placeholders
+
+    def render(self, key, values):
+        return self.get(key).render(values)
+
+    def render_batch(self, key, rows):
+        """Renders one document per row (dict of placeholder values); the template is looked up once."""
+        compiled = self.get(key)
+        today = current_date()
+        return [compiled.render(row, today) for row in rows]
+
+    def render_csv(self, key, csv_path):
+        """Renders one document per CSV row; column headers are placeholder names."""
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            return self.render_batch(key, list(csv.DictReader(f)))
+
+
+# Shared by the API and the CLI
+template_registry = TemplateRegistry()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a document template once per row of a CSV file.")
+    parser.add_argument("template_key", choices=sorted(DOCUMENT_TEMPLATES))
+    parser.add_argument("csv_path", help="CSV whose column headers are placeholder names")
+    parser.add_argument("--output-dir", default="./filled_documents")
+    args = parser.parse_args()
+
+    compiled = template_registry.get(args.template_key)
+    with open(args.csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.DictReader(f))
+    missing = compiled.missing(rows[0] if rows else {})
+    if missing:
+        print(f"Warning: the CSV has no column for {', '.join(missing)}; those placeholders are left as-is.")
+
+    started = time.perf_counter()
+    documents = template_registry.render_batch(args.template_key, rows)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for i, document in enumerate(documents, 1):
+        with open(os.path.join(args.output_dir, f"{args.template_key}_{i:04d}.txt"), 'w', encoding='utf-8') as f:
+            f.write(document)
+    print(f"Wrote {len(documents)} documents to {args.output_dir} in {time.perf_counter() - started:.2f}s.")
+
+
+if __name__ == "__main__":
+    main()
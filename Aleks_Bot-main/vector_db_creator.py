@@ -1,34 +1,234 @@
 # vector_db_creator.py
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-
-from data_processor import load_and_process_legal_data # Import your data processing function
+from data_processor import EXTRACT_WORKERS, iter_processed_pdfs # Import your data processing function
+from corpus_fingerprint import hash_file, write_corpus_fingerprint
+from embedding_service import EmbeddingService
+from bm25_index import BM25Index
+from index_snapshots import INDEX_SNAPSHOT_ROOT, SnapshotStore
+from statute_splitter import CHUNKER_VERSION
+from vector_index import DEFAULT_LAYOUT, VECTOR_INDEX, build_quantized_index, close_store, create_store, load_quantized_index, reset_store, vector_layout
+import argparse
+import hashlib
+import json
 import os
+import time
+from datetime import datetime
+
+# Records, per PDF, the content hash it was ingested with and the IDs of its chunks in Chroma
+MANIFEST_FILENAME = "ingest_manifest.json"
+# Chroma rejects very large add() calls, so chunks are upserted in batches
+UPSERT_BATCH_SIZE = 256
+# Bumped when chunk_ids_for changes; databases with other IDs are rebuilt
+CHUNK_ID_VERSION = 2
+
+def load_manifest(db_directory):
+    """
+    Loads the ingestion manifest for a vector database, or returns None if there is none yet.
+    """
+    path = os.path.join(db_directory, MANIFEST_FILENAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_manifest(db_directory, manifest):
+    """
+    Writes the ingestion manifest atomically, so an interrupted run never leaves a half-written file.
+    """
+    path = os.path.join(db_directory, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
 
-def create_and_persist_vector_db(chunks, db_directory="./chroma_db"):
+def chunk_ids_for(filename, content_hash, count):
     """
-    Creates a ChromaDB vector store from document chunks and persists it to disk.
+    Deterministic chunk IDs: the same file with the same content always maps to the same IDs. The file
+    name is part of them, so two PDFs with identical content (e.g. a renamed copy) own separate chunks.
     """
+    prefix = hashlib.sha256(f"{filename}\0{content_hash}".encode('utf-8')).hexdigest()[:16]
+    return [f"{prefix}-{i:05d}" for i in range(count)]
+
+def sync_vector_db(pdf_directory="./legal_data_pdfs", db_directory="./chroma_db", full_rebuild=False, workers=EXTRACT_WORKERS):
+    """
+    Brings the ChromaDB vector store in line with the PDFs in pdf_directory.
+
+    Only new or changed PDFs are parsed and embedded; vectors of changed or removed PDFs are deleted;
+    unchanged PDFs are skipped entirely. A full rebuild happens when requested, when the embedding model
+    or chunking rules changed, or when an existing database has no manifest (it may contain duplicate vectors).
+    Returns a report of what was added, updated, deleted and left unchanged.
+    """
+    start = time.perf_counter()
+    os.makedirs(db_directory, exist_ok=True)
+
     print("Loading embedding model...")
-    embeddings_model_name = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
-    embeddings = HuggingFaceEmbeddings(model_name=embeddings_model_name)
-
-    print(f"Creating ChromaDB at {db_directory}...")
-    # If the directory exists and contains a DB, it will load it.
-    # Otherwise, it will create a new one.
-    vectorstore = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=db_directory
-    )
-
-    # REMOVED: vectorstore.persist() - It's no longer needed in newer versions of langchain-chroma
-    print(f"Vector database created/updated and persisted successfully at {db_directory}!")
-    return vectorstore
+    # Cached embeddings mean a rebuild only runs the model for chunks it has never seen
+    embeddings = EmbeddingService()
+    vectorstore = create_store(db_directory, embeddings)
+
+    manifest = load_manifest(db_directory)
+    if manifest is not None and manifest.get("embedding_model") != embeddings.model_id:
+        print("Embedding model changed since the last run, rebuilding from scratch.")
+        full_rebuild = True
+    if manifest is not None and manifest.get("chunker") != CHUNKER_VERSION:
+        # Same PDFs would map to the same chunk IDs with different content, so nothing can be reused
+        print("Chunking rules changed since the last run, rebuilding from scratch.")
+        full_rebuild = True
+    if manifest is not None and manifest.get("chunk_ids", 1) != CHUNK_ID_VERSION:
+        # Identical PDFs under different names used to share chunk IDs
+        print("Chunk ID scheme changed since the last run, rebuilding from scratch.")
+        full_rebuild = True
+    if manifest is not None and manifest.get("vector_layout", DEFAULT_LAYOUT) != vector_layout():
+        # HNSW parameters and the per-law split are fixed when the collections are created
+        print("Vector index layout (sharding, HNSW M or ef_construction) changed since the last run, rebuilding from scratch.")
+        full_rebuild = True
+    if manifest is None and vectorstore.get(limit=1)["ids"]:
+        print("Existing database has no ingestion manifest, rebuilding from scratch to drop duplicate vectors.")
+        full_rebuild = True
+    if full_rebuild:
+        vectorstore = reset_store(db_directory, embeddings)
+        manifest = None
+    if manifest is None:
+        manifest = {"embedding_model": embeddings.model_id, "chunker": CHUNKER_VERSION, "chunk_ids": CHUNK_ID_VERSION,
+                    "files": {}}
+    manifest["vector_layout"] = vector_layout()
+
+    # The BM25 keyword index is kept in step with Chroma. If it is missing or out of sync
+    # (e.g. an interrupted run), rebuild it from the chunks already stored in Chroma.
+    bm25 = None if full_rebuild else BM25Index.load(db_directory)
+    manifest_ids = {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+    if bm25 is None or bm25.ids() != manifest_ids:
+        bm25 = BM25Index.from_vectorstore(vectorstore) if not full_rebuild else BM25Index()
+
+    current_hashes = {
+        filename: hash_file(os.path.join(pdf_directory, filename))
+        for filename in sorted(os.listdir(pdf_directory)) if filename.lower().endswith(".pdf")
+    }
+    known = manifest["files"]
+    report = {"added": [], "updated": [], "deleted": [], "unchanged": [], "chunks_added": 0, "chunks_deleted": 0}
+
+    # 1. Drop vectors of removed PDFs and of PDFs whose content changed
+    for filename in sorted(known):
+        if filename in current_hashes and known[filename]["sha256"] == current_hashes[filename]:
+            continue
+        stale_ids = known[filename]["chunk_ids"]
+        if stale_ids:
+            vectorstore.delete(ids=stale_ids)
+        for chunk_id in stale_ids:
+            bm25.remove(chunk_id)
+        report["chunks_deleted"] += len(stale_ids)
+        if filename not in current_hashes:
+            report["deleted"].append(filename)
+            del known[filename]
+            save_manifest(db_directory, manifest)
+
+    # 2. Embed and upsert new and changed PDFs, skip the rest.
+    # PDFs are extracted in a process pool and each one is embedded as soon as its pages are ready.
+    to_ingest = []
+    for filename, content_hash in current_hashes.items():
+        previous = known.get(filename)
+        if previous is not None and previous["sha256"] == content_hash:
+            report["unchanged"].append(filename)
+        else:
+            to_ingest.append(os.path.join(pdf_directory, filename))
+
+    report["files"] = {}
+    for filename, chunks, stats in iter_processed_pdfs(to_ingest, workers=workers):
+        content_hash = current_hashes[filename]
+        previous = known.get(filename)
+        embed_started = time.perf_counter()
+        ids = chunk_ids_for(filename, content_hash, len(chunks))
+        for chunk in chunks:
+            chunk.metadata["content_hash"] = content_hash
+        for i in range(0, len(chunks), UPSERT_BATCH_SIZE):
+            vectorstore.add_documents(chunks[i:i + UPSERT_BATCH_SIZE], ids=ids[i:i + UPSERT_BATCH_SIZE])
+        for chunk_id, chunk in zip(ids, chunks):
+            bm25.add(chunk_id, chunk.page_content, chunk.metadata)
+
+        stats["embed_seconds"] = round(time.perf_counter() - embed_started, 3)
+        report["files"][filename] = stats
+        report["updated" if previous is not None else "added"].append(filename)
+        report["chunks_added"] += len(chunks)
+        known[filename] = {
+            "sha256": content_hash,
+            "chunk_ids": ids,
+            "ingested_at": datetime.now().isoformat(timespec='seconds'),
+        }
+        # Saved after every file, so an interrupted run resumes where it stopped
+        save_manifest(db_directory, manifest)
+
+    save_manifest(db_directory, manifest)
+    bm25.save(db_directory)
+    # Record which corpus this database was built from, so the API's answer cache notices the change
+    report["fingerprint"] = write_corpus_fingerprint(db_directory, current_hashes)
+    if VECTOR_INDEX in ("flat", "ivf") and known:
+        index_started = time.perf_counter()
+        index = build_quantized_index(vectorstore, db_directory, VECTOR_INDEX)
+        report["vector_index"] = {"kind": index.kind, "chunks": len(index), "seconds": round(time.perf_counter() - index_started, 2)}
+    report["full_rebuild"] = full_rebuild
+    report["embedding"] = embeddings.stats()
+    report["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return report
+
+def build_snapshot(pdf_directory="./legal_data_pdfs", snapshot_root=INDEX_SNAPSHOT_ROOT, full_rebuild=False, workers=EXTRACT_WORKERS):
+    """
+    sync_vector_db() into a new index snapshot: the live snapshot is copied, the copy is brought in line
+    with the PDFs and then published as CURRENT, so a running API never sees a half-written database and
+    can swap to the new one without a restart. Nothing is published when no PDF changed and the live
+    snapshot already has the configured quantized index (the API never builds one itself).
+    """
+    store = SnapshotStore(snapshot_root)
+    building = store.begin()
+    try:
+        report = sync_vector_db(pdf_directory, building, full_rebuild=full_rebuild, workers=workers)
+    except BaseException:
+        close_store(building)
+        store.discard(building)
+        raise
+    # Chroma has to let go of the files before the directory is moved into place
+    close_store(building)
+    live = store.current()
+    index_current = VECTOR_INDEX not in ("flat", "ivf") or (live is not None and load_quantized_index(store.path(live)) is not None)
+    if live is not None and index_current and not (report["full_rebuild"] or report["added"] or report["updated"] or report["deleted"]):
+        store.discard(building)
+        report["snapshot"] = {"version": live, "published": False, "pruned": []}
+    else:
+        version = store.publish(building, report["fingerprint"])
+        report["snapshot"] = {"version": version, "published": True, "pruned": store.prune()}
+    return report
+
+def print_report(report):
+    print("\nIngestion report")
+    print("=" * 50)
+    for key in ("added", "updated", "deleted", "unchanged"):
+        print(f"{key.capitalize():<10} {len(report[key]):>4}  {', '.join(report[key])}")
+    print(f"Chunks added: {report['chunks_added']}, chunks deleted: {report['chunks_deleted']}")
+    for filename, stats in report["files"].items():
+        print(f"  {filename}: {stats['pages']} pages, {stats['pages_per_sec']} pages/sec extraction, {stats['chunks']} chunks embedded in {stats['embed_seconds']}s")
+    print(f"Embeddings computed: {report['embedding']['computed']}, served from cache: {report['embedding']['disk_hits']}")
+    if "vector_index" in report:
+        print(f"Built the {report['vector_index']['kind']} vector index over {report['vector_index']['chunks']} chunks in {report['vector_index']['seconds']}s")
+    print(f"Full rebuild: {report['full_rebuild']}, took {report['elapsed_s']}s")
+    print(f"Corpus fingerprint: {report['fingerprint']}")
+    if "snapshot" in report:
+        snapshot = report["snapshot"]
+        if snapshot["published"]:
+            print(f"Published index snapshot '{snapshot['version']}' as CURRENT" + (f", deleted {', '.join(snapshot['pruned'])}" if snapshot["pruned"] else ""))
+        else:
+            print(f"Nothing changed, index snapshot '{snapshot['version']}' stays CURRENT")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest legal PDFs into the ChromaDB vector store.")
+    parser.add_argument("--pdf-dir", default="./legal_data_pdfs")
+    parser.add_argument("--db-dir", default="./chroma_db")
+    parser.add_argument("--snapshot-root", default=INDEX_SNAPSHOT_ROOT,
+                        help="Write a new versioned snapshot under this directory instead of updating --db-dir in place.")
+    parser.add_argument("--full", action="store_true", help="Re-embed every PDF instead of only new/changed ones.")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="PDF extraction processes.")
+    args = parser.parse_args()
+
     # Ensure the legal_data_pdfs directory and dummy file exist for testing
-    dummy_dir = "./legal_data_pdfs"
+    dummy_dir = args.pdf_dir
     dummy_file = os.path.join(dummy_dir, "dummy_law.pdf")
     if not os.path.exists(dummy_dir):
         os.makedirs(dummy_dir)
@@ -45,19 +245,17 @@ if __name__ == "__main__":
     else:
         print(f"Using existing dummy PDF at {dummy_file}.")
 
-
-    print("Loading and processing legal data...")
-    legal_chunks = load_and_process_legal_data()
-
-    if legal_chunks:
-        # Create and persist the DB
-        db = create_and_persist_vector_db(legal_chunks)
-        
-        # You can now test retrieval (optional, as chatbot_app.py does this)
-        # print("\nTesting retrieval from the database:")
-        # query = "What are the rights of citizens?"
-        # results = db.similarity_search(query, k=2)
-        # for doc in results:
-        #     print(doc.page_content)
+    print("Syncing legal data into the vector database...")
+    if args.snapshot_root:
+        report = build_snapshot(args.pdf_dir, args.snapshot_root, full_rebuild=args.full, workers=args.workers)
     else:
-        print("No legal documents found or processed. Vector database not created/updated.")
\ No newline at end of file
+        report = sync_vector_db(args.pdf_dir, args.db_dir, full_rebuild=args.full, workers=args.workers)
+    print_report(report)
+    if not report["added"] and not report["updated"] and not report["unchanged"]:
+        print("No legal documents found or processed. Vector database not created/updated.")
+
+    # You can now test retrieval (optional, as chatbot_app.py does this)
+    # db = Chroma(persist_directory=args.db_dir, embedding_function=EmbeddingService())
+    # results = db.similarity_search("What are the rights of citizens?", k=2)
+    # for doc in results:
+    #     print(doc.page_content)
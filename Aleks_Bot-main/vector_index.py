@@ -0,0 +1,604 @@
+# vector_index.py
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from corpus_fingerprint import FINGERPRINT_FILENAME, read_corpus_fingerprint, write_corpus_fingerprint
+
+# --- Vector Index Configuration ---
+# HNSW graph of the Chroma collections. M and ef_construction are fixed when a collection is created
+# (the next ingestion run rebuilds the database when they change). ef_search is stored by the ingestion
+# run; the API only reads it, so serving never writes to a published database.
+HNSW_M = int(os.getenv("ALEKS_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("ALEKS_HNSW_EF_CONSTRUCTION", "100"))
+HNSW_EF_SEARCH = int(os.getenv("ALEKS_HNSW_EF_SEARCH", "100"))
+# "none" keeps every chunk in one collection, "law" gives each source PDF its own collection.
+VECTOR_SHARDING = os.getenv("ALEKS_VECTOR_SHARDING", "none").lower()
+# Threads searching the per-law collections of an unrestricted query in parallel.
+SHARD_SEARCH_WORKERS = int(os.getenv("ALEKS_SHARD_SEARCH_WORKERS", "4"))
+# "hnsw" searches Chroma. "flat" and "ivf" search a memory-mapped int8 index built next to the database,
+# a quarter of the memory of float32 vectors and without an in-memory HNSW graph.
+VECTOR_INDEX = os.getenv("ALEKS_VECTOR_INDEX", "hnsw").lower()
+# Inverted lists of the IVF index (0 = 4 x sqrt(chunks)) and how many of them each query scans.
+IVF_LISTS = int(os.getenv("ALEKS_IVF_LISTS", "0"))
+IVF_PROBES = int(os.getenv("ALEKS_IVF_PROBES", "16"))
+# int8 candidates per requested result that are re-scored with the exact float32 vectors.
+QUANTIZED_RERANK = int(os.getenv("ALEKS_QUANTIZED_RERANK", "4"))
+
+# The collection langchain_chroma uses when none is named
+COLLECTION_NAME = "langchain"
+SHARD_PREFIX = "law-"
+QUANTIZED_INDEX_DIRNAME = "vector_index"
+# Chroma's own defaults, which databases built before these settings existed were created with
+DEFAULT_LAYOUT = {"sharding": "none", "hnsw_m": 16, "hnsw_ef_construction": 100}
+# Rows scored per step of a scan. Small enough for the float32 copy of their codes to stay in cache.
+SCAN_BLOCK = 4096
+KMEANS_SAMPLE = 65536
+KMEANS_ITERATIONS = 12
+
+
+def vector_layout():
+    """The settings baked into the stored collections. A database built with other ones must be rebuilt."""
+    return {"sharding": VECTOR_SHARDING, "hnsw_m": HNSW_M, "hnsw_ef_construction": HNSW_EF_CONSTRUCTION}
+
+
+def hnsw_metadata():
+    return {"hnsw:space": "l2", "hnsw:M": HNSW_M, "hnsw:construction_ef": HNSW_EF_CONSTRUCTION, "hnsw:search_ef": HNSW_EF_SEARCH}
+
+
+def _open_collection(client, name, metadata=None, writable=True):
+    collection = client.get_or_create_collection(name, metadata={**hnsw_metadata(), **(metadata or {})})
+    # Existing collections keep the metadata they were created with; only ef_search can change later,
+    # and only when the database is written (ingestion), never when it is opened for serving.
+    stored_ef_search = collection.configuration_json["hnsw"]["ef_search"]
+    if stored_ef_search != HNSW_EF_SEARCH:
+        if writable:
+            collection.modify(configuration={"hnsw": {"ef_search": HNSW_EF_SEARCH}})
+        else:
+            print(f"Note: collection '{name}' was built with ef_search={stored_ef_search}; "
+                  f"ALEKS_HNSW_EF_SEARCH={HNSW_EF_SEARCH} applies from the next ingestion run.")
+    return collection
+
+
+def sources_in_filter(filter):
+    """The source PDFs a hybrid_retriever.source_filter() restricts to, or None for any other filter."""
+    if not filter or set(filter) != {"source"}:
+        return None
+    condition = filter["source"]
+    if isinstance(condition, str):
+        return {condition}
+    if isinstance(condition, dict) and set(condition) == {"$in"}:
+        return set(condition["$in"])
+    return None
+
+
+def _merge_by_distance(result_lists, k):
+    return sorted((hit for hits in result_lists for hit in hits), key=lambda hit: hit[1])[:k]
+
+
+class BatchChroma(Chroma):
+    """Chroma with nearest_many(), which sends several query vectors to the collection in one query."""
+
+    def nearest_many(self, vectors, k, filter=None):
+        """Returns, per query vector, [(chunk_id, distance)] of its k nearest chunks."""
+        if not len(vectors):
+            return []
+        result = self._collection.query(query_embeddings=[list(vector) for vector in vectors], n_results=k,
+                                        where=filter, include=["distances"])
+        return [list(zip(ids, distances)) for ids, distances in zip(result["ids"], result["distances"])]
+
+
+class ShardedChroma(VectorStore):
+    """
+    One Chroma collection per law. Chunks are written to the collection of their source PDF; a search
+    restricted to some laws only touches their collections, an unrestricted one queries every collection
+    in parallel and merges the hits by distance. Each HNSW graph stays small, so it loads and searches
+    faster, and a law that is re-ingested only rebuilds its own graph.
+    """
+
+    def __init__(self, persist_directory, embedding_function=None, workers=SHARD_SEARCH_WORKERS, writable=True):
+        self._client = chromadb.PersistentClient(path=persist_directory)
+        self._embedding_function = embedding_function
+        self._writable = writable
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="aleks-shard")
+        self._shards = {}  # source PDF -> Chroma
+        self._names = {}  # source PDF -> collection name
+        for collection in self._client.list_collections():
+            if collection.name.startswith(SHARD_PREFIX) and "source" in (collection.metadata or {}):
+                self._open_shard(collection.metadata["source"])
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def _open_shard(self, source):
+        shard = self._shards.get(source)
+        if shard is None:
+            name = SHARD_PREFIX + hashlib.sha256(source.encode('utf-8')).hexdigest()[:16]
+            _open_collection(self._client, name, {"source": source}, self._writable)
+            shard = self._shards[source] = BatchChroma(client=self._client, collection_name=name,
+                                                       embedding_function=self._embedding_function)
+            self._names[source] = name
+        return shard
+
+    def _size(self, source, ids=None, where=None):
+        if ids is None and where is None:
+            return self._client.get_collection(self._names[source]).count()
+        return len(self._shards[source].get(ids=ids, where=where, include=[])["ids"])
+
+    def shard_sizes(self):
+        return {source: self._size(source) for source in sorted(self._shards)}
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [hashlib.sha256(text.encode('utf-8')).hexdigest()[:24] for text in texts]
+        by_source = {}
+        for text, metadata, chunk_id in zip(texts, metadatas, ids):
+            batch = by_source.setdefault(metadata.get("source", ""), ([], [], []))
+            batch[0].append(text)
+            batch[1].append(metadata)
+            batch[2].append(chunk_id)
+        for source, (shard_texts, shard_metadatas, shard_ids) in by_source.items():
+            self._open_shard(source).add_texts(shard_texts, metadatas=shard_metadatas, ids=shard_ids)
+        return ids
+
+    def add_embeddings(self, ids, texts, metadatas, embeddings):
+        """Adds chunks whose vectors are already computed, e.g. when copying another store."""
+        by_source = {}
+        for row, metadata in enumerate(metadatas):
+            by_source.setdefault(metadata.get("source", ""), []).append(row)
+        for source, rows in by_source.items():
+            self._open_shard(source)
+            self._client.get_collection(self._names[source]).add(
+                ids=[ids[i] for i in rows], documents=[texts[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows], embeddings=[embeddings[i] for i in rows])
+
+    def delete(self, ids=None, **kwargs):
+        # Chunk IDs don't say which law they belong to; deleting unknown IDs is a no-op
+        for shard in self._shards.values():
+            shard.delete(ids=ids)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None):
+        """Chroma's get() across the shards, in a stable shard order so limit/offset can page through them."""
+        kwargs = {"ids": ids, "where": where} if include is None else {"ids": ids, "where": where, "include": include}
+        result = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+        skip, remaining = offset or 0, limit
+        for source, shard in sorted(self._shards.items()):
+            if remaining is not None and remaining <= 0:
+                break
+            if skip:
+                size = self._size(source, ids, where)
+                if skip >= size:
+                    skip -= size
+                    continue
+            batch = shard.get(limit=remaining, offset=skip or None, **kwargs)
+            skip = 0
+            for key in result:
+                if batch.get(key) is not None:
+                    result[key].extend(batch[key])
+            if remaining is not None:
+                remaining -= len(batch["ids"])
+        return result
+
+    def reset_collection(self):
+        for source in list(self._shards):
+            del self._shards[source]
+            self._client.delete_collection(self._names.pop(source))
+
+    def _shards_for(self, filter):
+        """The shards a search with filter has to query, and the filter left to apply within them."""
+        sources = sources_in_filter(filter)
+        if sources is not None:
+            return [self._shards[source] for source in sorted(sources) if source in self._shards], None
+        return list(self._shards.values()), filter
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        shards, filter = self._shards_for(filter)
+        if len(shards) == 1:
+            return shards[0].similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+        return _merge_by_distance(self._pool.map(
+            lambda shard: shard.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter), shards), k)
+
+    def nearest_many(self, vectors, k, filter=None):
+        """Every query vector goes to each shard in one query; the hits are merged per query."""
+        shards, filter = self._shards_for(filter)
+        per_shard = list(self._pool.map(lambda shard: shard.nearest_many(vectors, k, filter), shards))
+        return [_merge_by_distance([hits[i] for hits in per_shard], k) for i in range(len(vectors))]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [document for document, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k, filter)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, persist_directory="./chroma_db", ids=None, **kwargs):
+        store = cls(persist_directory, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def _quantize(vectors):
+    """Symmetric per-vector int8 quantization: vector ~= codes * scale."""
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1.0
+    codes = np.round(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _squared_distances(vectors, points):
+    return (vectors ** 2).sum(axis=1)[:, None] - 2 * vectors @ points.T + (points ** 2).sum(axis=1)[None, :]
+
+
+def _kmeans(vectors, n_lists, rng):
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE), replace=False)]
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignment = _squared_distances(sample, centroids).argmin(axis=1)
+        for list_id in range(n_lists):
+            members = sample[assignment == list_id]
+            # An empty list takes a random point, so no centroid is wasted
+            centroids[list_id] = members.mean(axis=0) if len(members) else sample[rng.integers(len(sample))]
+    return centroids
+
+
+class QuantizedIndex:
+    """
+    Memory-mapped vector index over int8 codes. A query scores the codes of every chunk ("flat") or of
+    the chunks in the ivf_probes inverted lists nearest to it ("ivf"), then re-scores the best candidates
+    with the exact float32 vectors, which stay on disk except for the rows read. Built from the Chroma
+    store by each ingestion run; serving processes only load it.
+    """
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.kind = meta["kind"]
+        self.fingerprint = meta["fingerprint"]
+        self.ids = meta["ids"]
+        self.sources = meta["sources"]
+        self.list_offsets = np.asarray(meta["list_offsets"], dtype=np.int64)
+        n, dim = len(self.ids), meta["dim"]
+        self.codes = np.memmap(os.path.join(directory, "codes.i8"), dtype=np.int8, mode='r', shape=(n, dim))
+        self.vectors = np.memmap(os.path.join(directory, "vectors.f32"), dtype=np.float32, mode='r', shape=(n, dim))
+        self.scales = np.fromfile(os.path.join(directory, "scales.f32"), dtype=np.float32)
+        self.norms = np.fromfile(os.path.join(directory, "norms.f32"), dtype=np.float32)
+        self.source_codes = np.fromfile(os.path.join(directory, "sources.i32"), dtype=np.int32)
+        self.centroids = np.fromfile(os.path.join(directory, "centroids.f32"), dtype=np.float32).reshape(-1, dim)
+        self.probes = IVF_PROBES
+        self.rerank = QUANTIZED_RERANK
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, directory):
+        """Loads the index saved in directory, or returns None if there is none."""
+        try:
+            with open(os.path.join(directory, "index.json"), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        return cls(directory, meta)
+
+    @classmethod
+    def build(cls, vectorstore, directory, kind, fingerprint, n_lists=IVF_LISTS, batch_size=5000):
+        """Reads every vector from the store and writes a new index to directory, replacing any old one."""
+        # A name of its own, so two builds into the same database never share a working directory
+        tmp_dir = f"{directory}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(tmp_dir)
+        ids, source_names, source_codes = [], {}, []
+        # Vectors are streamed to disk, so building never holds more than one batch in memory twice
+        with open(os.path.join(tmp_dir, "unsorted.f32"), 'wb') as f:
+            offset = 0
+            while True:
+                batch = vectorstore.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+                if not batch["ids"]:
+                    break
+                f.write(np.asarray(batch["embeddings"], dtype=np.float32).tobytes())
+                ids.extend(batch["ids"])
+                for metadata in batch["metadatas"]:
+                    source_codes.append(source_names.setdefault((metadata or {}).get("source", ""), len(source_names)))
+                offset += len(batch["ids"])
+        if not ids:
+            shutil.rmtree(tmp_dir)
+            raise ValueError("The vector database is empty, there is nothing to index.")
+        dim = os.path.getsize(os.path.join(tmp_dir, "unsorted.f32")) // (4 * len(ids))
+        unsorted = np.memmap(os.path.join(tmp_dir, "unsorted.f32"), dtype=np.float32, mode='r', shape=(len(ids), dim))
+
+        rng = np.random.default_rng(0)
+        if kind == "ivf":
+            n_lists = min(len(ids), n_lists or max(1, int(4 * np.sqrt(len(ids)))))
+            centroids = _kmeans(unsorted, n_lists, rng)
+            assignment = np.concatenate([_squared_distances(unsorted[i:i + SCAN_BLOCK], centroids).argmin(axis=1)
+                                         for i in range(0, len(ids), SCAN_BLOCK)])
+            # Rows are stored list by list, so scanning a list reads one contiguous range
+            order = np.argsort(assignment, kind="stable")
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        else:
+            centroids = np.zeros((0, dim), dtype=np.float32)
+            order = np.arange(len(ids))
+            list_offsets = np.asarray([0, len(ids)])
+
+        with open(os.path.join(tmp_dir, "vectors.f32"), 'wb') as vectors_file, \
+                open(os.path.join(tmp_dir, "codes.i8"), 'wb') as codes_file:
+            scales, norms = [], []
+            for i in range(0, len(ids), SCAN_BLOCK):
+                block = np.asarray(unsorted[order[i:i + SCAN_BLOCK]])
+                codes, block_scales = _quantize(block)
+                vectors_file.write(block.tobytes())
+                codes_file.write(codes.tobytes())
+                scales.append(block_scales)
+                norms.append((block ** 2).sum(axis=1).astype(np.float32))
+        np.concatenate(scales).tofile(os.path.join(tmp_dir, "scales.f32"))
+        np.concatenate(norms).tofile(os.path.join(tmp_dir, "norms.f32"))
+        np.asarray(source_codes, dtype=np.int32)[order].tofile(os.path.join(tmp_dir, "sources.i32"))
+        centroids.astype(np.float32).tofile(os.path.join(tmp_dir, "centroids.f32"))
+        del unsorted
+        os.remove(os.path.join(tmp_dir, "unsorted.f32"))
+        meta = {
+            "kind": kind,
+            "fingerprint": fingerprint,
+            "dim": dim,
+            "ids": [ids[i] for i in order],
+            "sources": sorted(source_names, key=source_names.get),
+            "list_offsets": list_offsets.tolist(),
+        }
+        with open(os.path.join(tmp_dir, "index.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+        return cls(directory, meta)
+
+    def _row_ranges(self, query):
+        """Contiguous row ranges to scan: every row, or the inverted lists nearest to the query."""
+        if self.kind != "ivf" or not len(self.centroids):
+            return [(0, len(self.ids))]
+        nearest = np.argsort(((self.centroids - query) ** 2).sum(axis=1))[:self.probes]
+        return [(int(self.list_offsets[i]), int(self.list_offsets[i + 1])) for i in nearest]
+
+    def _allowed_codes(self, sources):
+        """Source codes a search restricted to sources may return (None = any source)."""
+        if sources is None:
+            return None
+        return np.asarray([i for i, source in enumerate(self.sources) if source in sources], dtype=np.int32)
+
+    def _rerank(self, query, candidate_rows, k):
+        """Re-scores the candidates with the exact float32 vectors and returns the k nearest."""
+        best_rows = np.sort(candidate_rows)
+        distances = ((np.asarray(self.vectors[best_rows]) - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:k]
+        return [(self.ids[best_rows[i]], float(distances[i])) for i in order]
+
+    def search(self, query_vector, k, sources=None):
+        """Returns [(chunk_id, squared L2 distance)] of the k nearest chunks, optionally only from the given sources."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        allowed = self._allowed_codes(sources)
+        if allowed is not None and not len(allowed):
+            return []
+
+        # ||v - q||^2 ranks like ||v||^2 - 2 v.q, with v.q ~= scale * (codes . q)
+        buffer = np.empty((SCAN_BLOCK, self.codes.shape[1]), dtype=np.float32)
+        row_blocks, score_blocks = [], []
+        for range_start, range_stop in self._row_ranges(query):
+            for start in range(range_start, range_stop, SCAN_BLOCK):
+                stop = min(start + SCAN_BLOCK, range_stop)
+                # Converting a cache-sized block into a reused buffer is several times faster than astype()
+                block = buffer[:stop - start]
+                np.copyto(block, self.codes[start:stop])
+                scores = self.norms[start:stop] - 2 * self.scales[start:stop] * (block @ query)
+                block_rows = np.arange(start, stop)
+                if allowed is not None:
+                    keep = np.isin(self.source_codes[start:stop], allowed)
+                    block_rows, scores = block_rows[keep], scores[keep]
+                row_blocks.append(block_rows)
+                score_blocks.append(scores)
+        candidate_rows = np.concatenate(row_blocks) if row_blocks else np.zeros(0, dtype=np.int64)
+        if not len(candidate_rows):
+            return []
+        scores = np.concatenate(score_blocks)
+
+        n_candidates = min(len(scores), k * max(1, self.rerank))
+        best = np.argpartition(scores, n_candidates - 1)[:n_candidates]
+        return self._rerank(query, candidate_rows[best], k)
+
+    def search_many(self, query_vectors, k, sources=None):
+        """
+        search() for several queries. A flat index scores all of them in a single pass over the codes
+        (one matrix product per block); an ivf index probes different lists per query, so it searches
+        them one by one.
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        if self.kind == "ivf" or len(queries) <= 1:
+            return [self.search(query, k, sources) for query in queries]
+        allowed = self._allowed_codes(sources)
+        if allowed is not None and not len(allowed):
+            return [[] for _ in queries]
+
+        n_candidates = k * max(1, self.rerank)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        buffer = np.empty((SCAN_BLOCK, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.ids), SCAN_BLOCK):
+            stop = min(start + SCAN_BLOCK, len(self.ids))
+            block = buffer[:stop - start]
+            np.copyto(block, self.codes[start:stop])
+            scores = self.norms[start:stop] - 2 * self.scales[start:stop] * (queries @ block.T)
+            if allowed is not None:
+                scores[:, ~np.isin(self.source_codes[start:stop], allowed)] = np.inf
+            # Only each query's running best candidates are kept, not a score for every chunk
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), scores.shape)], axis=1)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            if scores.shape[1] > n_candidates:
+                keep = np.argpartition(scores, n_candidates - 1, axis=1)[:, :n_candidates]
+                rows = np.take_along_axis(rows, keep, axis=1)
+                scores = np.take_along_axis(scores, keep, axis=1)
+            best_rows, best_scores = rows, scores
+        return [self._rerank(query, rows[np.isfinite(scores)], k) if np.isfinite(scores).any() else []
+                for query, rows, scores in zip(queries, best_rows, best_scores)]
+
+
+class QuantizedVectorStore(VectorStore):
+    """
+    Answers similarity searches from a QuantizedIndex and everything else (texts, metadata, writes)
+    from the Chroma store the index was built from.
+    """
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def embeddings(self):
+        return self.store.embeddings
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        return self.store.add_texts(texts, metadatas=metadatas, ids=ids, **kwargs)
+
+    def delete(self, ids=None, **kwargs):
+        return self.store.delete(ids=ids, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self.store.get(*args, **kwargs)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        sources = sources_in_filter(filter)
+        if filter and sources is None:
+            # Only source filters are indexed; anything else goes to Chroma
+            return self.store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter)
+        hits = self.index.search(embedding, k, sources)
+        if not hits:
+            return []
+        stored = self.store.get(ids=[chunk_id for chunk_id, _ in hits], include=["documents", "metadatas"])
+        by_id = {chunk_id: (text, metadata) for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+        return [(Document(id=chunk_id, page_content=by_id[chunk_id][0], metadata=by_id[chunk_id][1] or {}), distance)
+                for chunk_id, distance in hits if chunk_id in by_id]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [document for document, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def nearest_many(self, vectors, k, filter=None):
+        sources = sources_in_filter(filter)
+        if filter and sources is None:
+            return self.store.nearest_many(vectors, k, filter)
+        return self.index.search_many(vectors, k, sources)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k, filter)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, persist_directory="./chroma_db", ids=None, kind="flat", **kwargs):
+        """Adds the texts to the Chroma store in persist_directory, then builds the quantized index over all of it."""
+        if kind not in ("flat", "ivf"):
+            raise ValueError(f"Unknown quantized index kind '{kind}' (expected flat or ivf).")
+        store = create_store(persist_directory, embedding)
+        texts = list(texts)
+        ids = store.add_texts(texts, metadatas=metadatas, ids=ids)
+        if not os.path.exists(os.path.join(persist_directory, FINGERPRINT_FILENAME)):
+            # Without a recorded fingerprint open_store() could never match the index to the database
+            write_corpus_fingerprint(persist_directory, {chunk_id: hashlib.sha256(text.encode('utf-8')).hexdigest()
+                                                         for chunk_id, text in zip(ids, texts)})
+        return cls(store, build_quantized_index(store, persist_directory, kind))
+
+
+def create_store(persist_directory, embedding_function=None, sharding=VECTOR_SHARDING, writable=True):
+    """
+    The Chroma store: one collection, or one per law, with the configured HNSW parameters.
+    writable=False opens it for searching only and leaves the stored collection settings untouched.
+    """
+    if sharding == "law":
+        return ShardedChroma(persist_directory, embedding_function, writable=writable)
+    client = chromadb.PersistentClient(path=persist_directory)
+    _open_collection(client, COLLECTION_NAME, writable=writable)
+    return BatchChroma(client=client, collection_name=COLLECTION_NAME, embedding_function=embedding_function)
+
+
+def reset_store(persist_directory, embedding_function=None):
+    """Drops every collection of either layout and returns a new, empty store for the current one."""
+    client = chromadb.PersistentClient(path=persist_directory)
+    for collection in client.list_collections():
+        if collection.name == COLLECTION_NAME or collection.name.startswith(SHARD_PREFIX):
+            client.delete_collection(collection.name)
+    shutil.rmtree(os.path.join(persist_directory, QUANTIZED_INDEX_DIRNAME), ignore_errors=True)
+    return create_store(persist_directory, embedding_function)
+
+
+def close_store(persist_directory):
+    """
+    Stops the Chroma instance this process keeps for persist_directory, releasing its loaded indexes
+    and open files. Stores opened on that directory must not be used afterwards.
+    """
+    from chromadb.api.shared_system_client import SharedSystemClient
+
+    system = SharedSystemClient._identifier_to_system.pop(persist_directory, None)
+    if system is not None:
+        system.stop()
+
+
+def build_quantized_index(store, persist_directory, kind=VECTOR_INDEX):
+    directory = os.path.join(persist_directory, QUANTIZED_INDEX_DIRNAME)
+    return QuantizedIndex.build(store, directory, kind, read_corpus_fingerprint(persist_directory))
+
+
+def load_quantized_index(persist_directory, kind=VECTOR_INDEX):
+    """The quantized index saved with the database, or None if it is missing, of another kind or outdated."""
+    index = QuantizedIndex.load(os.path.join(persist_directory, QUANTIZED_INDEX_DIRNAME))
+    if index is None or index.kind != kind or index.fingerprint != read_corpus_fingerprint(persist_directory):
+        return None
+    return index
+
+
+def open_store(persist_directory, embedding_function=None, index_kind=VECTOR_INDEX, sharding=VECTOR_SHARDING):
+    """
+    The store retrieval searches, as configured by ALEKS_VECTOR_SHARDING and ALEKS_VECTOR_INDEX.
+    Opening never writes to the database: the Chroma collections are opened read-only and the quantized
+    index is only loaded. Both are built by the ingestion run; without a matching quantized index the
+    store is searched through HNSW until the next run builds one.
+    """
+    store = create_store(persist_directory, embedding_function, sharding, writable=False)
+    if index_kind == "hnsw":
+        return store
+    if index_kind not in ("flat", "ivf"):
+        raise ValueError(f"Unknown ALEKS_VECTOR_INDEX '{index_kind}' (expected hnsw, flat or ivf).")
+    index = load_quantized_index(persist_directory, index_kind)
+    if index is None:
+        print(f"Warning: {persist_directory} has no up-to-date {index_kind} vector index; searching HNSW instead. "
+              f"Run vector_db_creator.py to build it.")
+        return store
+    return QuantizedVectorStore(store, index)
+
+
+def similarity_search_many(store, vectors, k=4, filters=None):
+    """
+    similarity_search_by_vector() for many query vectors, returning a list of documents per query.
+    Queries with the same filter are searched together (one multi-vector query per Chroma collection,
+    or one pass over a flat index), and each distinct chunk is fetched once, however many queries found
+    it; those queries share its Document.
+    """
+    filters = filters or [None] * len(vectors)
+    if not hasattr(store, "nearest_many"):
+        return [store.similarity_search_by_vector(vector, k=k, filter=filter) for vector, filter in zip(vectors, filters)]
+    groups = {}
+    for position, filter in enumerate(filters):
+        groups.setdefault(json.dumps(filter, sort_keys=True), []).append(position)
+    hits = [None] * len(vectors)
+    for key, positions in groups.items():
+        for position, found in zip(positions, store.nearest_many([vectors[p] for p in positions], k, json.loads(key))):
+            hits[position] = found
+
+    unique_ids = list(dict.fromkeys(chunk_id for found in hits for chunk_id, _ in found))
+    documents = {}
+    if unique_ids:
+        stored = store.get(ids=unique_ids, include=["documents", "metadatas"])
+        documents = {chunk_id: Document(id=chunk_id, page_content=text, metadata=metadata or {})
+                     for chunk_id, text, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])}
+    return [[documents[chunk_id] for chunk_id, _ in found if chunk_id in documents] for found in hits]
@@ -0,0 +1,168 @@
+# warmup.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aleks_core
+from hybrid_retriever import RETRIEVAL_MODE
+from index_snapshots import WARMUP_QUERY
+from retrieval_service import RETRIEVAL_SERVICE, RemoteRetriever
+
+# --- Warm-up Configuration ---
+# Seconds between attempts to reach Ollama while it is down or still pulling the model.
+WARMUP_RETRY_SECONDS = float(os.getenv("ALEKS_WARMUP_RETRY_SECONDS", "15"))
+
+COMPONENTS = ("embeddings", "vector_db", "llm", "retrieval")
+
+
+class WarmupManager:
+    """
+    Loads and warms the Aleks components in the background, in parallel:
+
+    - embeddings: loads the sentence-transformers model and runs one forward pass;
+    - vector_db: opens Chroma, pulls its HNSW index into memory with one search and loads BM25;
+    - llm: creates the LLM backend and has it load the model (Ollama keeps it resident with keep_alive),
+      retrying until it answers;
+    - retrieval: once embeddings and vector_db are up, builds the retriever, intent router and
+      answer cache and runs a warm-up query through them.
+
+    With ALEKS_RETRIEVAL_SERVICE set, embeddings and vector_db are held by the shared retrieval
+    service: embeddings waits until the service answers and vector_db has nothing to load.
+    With ALEKS_INDEX_SNAPSHOT_ROOT set, vector_db and retrieval open the snapshot CURRENT names.
+
+    status() reports per-component state and load times for /readyz.
+    """
+
+    def __init__(self, retry_seconds=WARMUP_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self.started_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._components = {name: {"status": "pending", "seconds": None} for name in COMPONENTS}
+
+    @property
+    def started(self):
+        return self.started_at is not None
+
+    @property
+    def ready(self):
+        with self._lock:
+            return all(component["status"] == "ready" for component in self._components.values())
+
+    def start(self):
+        """Starts warming up in a background thread and returns immediately."""
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self.run, name="aleks-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self.ready
+
+    def status(self):
+        with self._lock:
+            components = {name: dict(component) for name, component in self._components.items()}
+        return {
+            "ready": all(component["status"] == "ready" for component in components.values()),
+            "uptime_s": round(time.time() - self.started_at, 1) if self.started_at else 0.0,
+            "components": components,
+        }
+
+    def _update(self, name, **fields):
+        with self._lock:
+            self._components[name].update(fields)
+
+    def _timed(self, name, fn, *args):
+        """Runs one warm-up step, recording its status, duration and (on failure) the error."""
+        self._update(name, status="loading")
+        started = time.perf_counter()
+        try:
+            detail = fn(*args)
+        except Exception as e:
+            self._update(name, status="failed", seconds=round(time.perf_counter() - started, 2), error=str(e))
+            raise
+        self._update(name, status="ready", seconds=round(time.perf_counter() - started, 2), error=None)
+        return detail
+
+    def run(self):
+        print("Warming up Aleks components...")
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="aleks-warmup") as pool:
+            embeddings_future = pool.submit(self._timed, "embeddings", self._warm_embeddings)
+            vector_future = pool.submit(self._timed, "vector_db", self._warm_vector_db)
+            llm_future = pool.submit(self._warm_llm_until_ready)
+            try:
+                embeddings = embeddings_future.result()
+                version, bm25 = vector_future.result()
+                self._timed("retrieval", self._warm_retrieval, embeddings, version, bm25)
+            except Exception as e:
+                self._update("retrieval", status="failed", error=f"not started: {e}")
+                print(f"Failed to initialize Aleks components: {e}. Please check your setup (ChromaDB, embedding model, etc.).")
+            llm_future.result()
+        if self.ready:
+            print(f"Aleks API ready! (warm-up took {time.time() - self.started_at:.1f}s)")
+
+    def _warm_embeddings(self):
+        if RETRIEVAL_SERVICE:
+            embeddings, _ = aleks_core.connect_retrieval_service()
+            self._update("embeddings", model=embeddings.model_id, backend=embeddings.backend, shared=RETRIEVAL_SERVICE)
+            return embeddings
+        embeddings = aleks_core.load_embeddings()
+        embeddings.embed_query("warm-up")  # first forward pass allocates the inference buffers
+        self._update("embeddings", model=embeddings.model_id, backend=embeddings.backend)
+        return embeddings
+
+    def _warm_vector_db(self):
+        if RETRIEVAL_SERVICE:
+            self._update("vector_db", shared=RETRIEVAL_SERVICE)
+            return None, None
+        version, db_directory = aleks_core.index_location()
+        if version is not None:
+            self._update("vector_db", snapshot=version)
+        # Opened without embeddings so this runs while the embedding model is still loading;
+        # Chroma shares the loaded index with the store the retriever opens later.
+        vectorstore = aleks_core.open_vector_store(db_directory=db_directory)
+        sample = vectorstore.get(limit=1, include=["embeddings"])
+        if sample["ids"]:
+            vectorstore.similarity_search_by_vector(list(sample["embeddings"][0]), k=1)
+        bm25 = aleks_core.load_bm25_index(vectorstore, db_directory) if RETRIEVAL_MODE == "hybrid" else None
+        if bm25 is not None:
+            self._update("vector_db", chunks=len(bm25))
+        return version, bm25
+
+    def _warm_llm(self):
+        llm = aleks_core.load_llm()
+        try:
+            # For Ollama: an empty prompt on every server loads the model without generating anything,
+            # then the fixed prompt prefixes are evaluated once so the first requests reuse their KV cache
+            details = llm.warm(prefixes=aleks_core.STATIC_PROMPT_PREFIXES)
+        except Exception:
+            llm.close()
+            raise
+        aleks_core.llm = llm
+        self._update("llm", **details)
+
+    def _warm_llm_until_ready(self):
+        attempts = 0
+        while not self._stop.is_set():
+            attempts += 1
+            self._update("llm", attempts=attempts)
+            try:
+                return self._timed("llm", self._warm_llm)
+            except Exception as e:
+                print(f"The LLM backend is not ready ({e}); retrying in {self.retry_seconds:.0f}s. "
+                      "Please ensure Ollama is running and the model is pulled.")
+                self._stop.wait(self.retry_seconds)
+
+    def _warm_retrieval(self, embeddings, version, bm25):
+        if RETRIEVAL_SERVICE:
+            retriever = RemoteRetriever(client=embeddings.client)
+        else:
+            retriever = aleks_core.load_retriever(embeddings, version, bm25)
+        aleks_core.install_retrieval_components(embeddings, retriever)
+        aleks_core.retriever.invoke(WARMUP_QUERY)